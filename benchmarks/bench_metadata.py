@@ -0,0 +1,72 @@
+# bench_metadata.py
+#
+# Compare serializing a source's metadata for every tile (the old behaviour of
+# save_image_with_metadata) with building one save profile per source.
+#
+# Usage (from the repository root): python -m benchmarks.bench_metadata [grid]
+
+import io
+import sys
+import time
+from PIL import Image, PngImagePlugin
+from splyt.config import VERSION
+from splyt.metadata import prepare_metadata, build_save_profile, save_image_with_metadata, save_image_with_profile
+from splyt.utils import calculate_cell_positions
+
+def make_source(image_format):
+    """
+    Build an in-memory source carrying typical metadata for the format.
+    """
+    img = Image.effect_noise((1024, 1024), 30).convert('RGB')
+    buffer = io.BytesIO()
+    if image_format == 'PNG':
+        info = PngImagePlugin.PngInfo()
+        for idx in range(20):
+            info.add_text(f'Key{idx}', 'value ' * 20)
+        img.save(buffer, format='PNG', pnginfo=info, dpi=(300, 300))
+    else:
+        exif = img.getexif()
+        exif[271] = 'Bench Camera'
+        exif[270] = 'description ' * 50
+        img.save(buffer, format='JPEG', exif=exif.tobytes(), dpi=(300, 300))
+    buffer.seek(0)
+    source = Image.open(buffer)
+    source.load()
+    return source
+
+def run(image_format, grid):
+    source = make_source(image_format)
+    original_info = prepare_metadata(source, True, True, VERSION)
+    cells = calculate_cell_positions(source.size, (grid, grid))
+    tiles = [source.crop((c['left'], c['upper'], c['right'], c['lower'])) for c in cells]
+
+    # Metadata serialization alone
+    start = time.perf_counter()
+    for _ in tiles:
+        build_save_profile(original_info, image_format)
+    per_tile_metadata = time.perf_counter() - start
+
+    start = time.perf_counter()
+    profile = build_save_profile(original_info, image_format)
+    once_metadata = time.perf_counter() - start
+
+    # Full tile saves into memory
+    start = time.perf_counter()
+    for tile in tiles:
+        save_image_with_metadata(tile, io.BytesIO(), original_info, image_format, {'format': image_format})
+    per_tile_save = time.perf_counter() - start
+
+    start = time.perf_counter()
+    profile = build_save_profile(original_info, image_format, {'format': image_format})
+    for tile in tiles:
+        save_image_with_profile(tile, io.BytesIO(), profile)
+    once_save = time.perf_counter() - start
+
+    print(f"{image_format} {grid}x{grid} ({len(tiles)} tiles)")
+    print(f"  metadata per tile: {per_tile_metadata * 1000:8.2f} ms   once: {once_metadata * 1000:8.3f} ms")
+    print(f"  saves, per tile:   {per_tile_save * 1000:8.2f} ms   profile: {once_save * 1000:8.2f} ms")
+
+if __name__ == '__main__':
+    grid = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    for image_format in ('PNG', 'JPEG'):
+        run(image_format, grid)
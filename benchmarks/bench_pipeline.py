@@ -0,0 +1,220 @@
+# bench_pipeline.py
+#
+# Time the whole decode -> crop -> encode -> write pipeline of splyt() on synthetic
+# sources, and report throughput and peak memory. Every case runs in a fresh Python
+# process so its peak RSS is its own. Results are saved as JSON; pass an earlier
+# result file with --compare to flag cases that got slower.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_pipeline [--formats PNG,JPEG,...] [--sizes 1,25,200]
+#       [--grids 2x1,10x10,100x100] [--threads N] [--max-tile-size N]
+#       [--format FORMAT] [--presets fast,balanced,small] [--repeat N] [--work-dir DIR]
+#       [--output results.json] [--compare baseline.json] [--tolerance 0.10] [--quick]
+#
+# The default matrix includes 200 megapixel sources, which take minutes and several
+# GB of disk and memory; --quick only runs the 1 megapixel sources.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import PIL
+from PIL import Image
+from splyt.config import VERSION
+from splyt.core import splyt
+
+FORMATS = ['PNG', 'JPEG', 'TIFF', 'BMP', 'GIF']
+EXTENSIONS = {'PNG': '.png', 'JPEG': '.jpg', 'TIFF': '.tif', 'BMP': '.bmp', 'GIF': '.gif'}
+SIZES = [1, 25, 200]
+GRIDS = [(2, 1), (10, 10), (100, 100)]
+PATTERN_SIZE = 1024
+
+def source_dimensions(megapixels):
+    """
+    Width and height of a 4:3 source with about the given number of megapixels.
+    """
+    height = int((megapixels * 1_000_000 * 3 / 4) ** 0.5)
+    return height * 4 // 3, height
+
+def make_pattern():
+    """
+    A noisy gradient that compresses roughly like a photo, unlike flat colour or pure noise.
+    """
+    noise = Image.effect_noise((PATTERN_SIZE, PATTERN_SIZE), 40)
+    gradient = Image.linear_gradient('L').resize((PATTERN_SIZE, PATTERN_SIZE))
+    return Image.merge('RGB', (gradient, Image.blend(noise, gradient, 0.5), gradient.transpose(getattr(Image, 'Transpose', Image).ROTATE_90)))
+
+def generate_source(work_dir, image_format, megapixels):
+    """
+    Write a synthetic source to work_dir, reusing one generated by an earlier run.
+    """
+    path = os.path.join(work_dir, f"source-{megapixels}mp{EXTENSIONS[image_format]}")
+    if os.path.exists(path):
+        return path
+
+    width, height = source_dimensions(megapixels)
+    pattern = make_pattern()
+    img = Image.new('RGB', (width, height))
+    for upper in range(0, height, PATTERN_SIZE):
+        for left in range(0, width, PATTERN_SIZE):
+            img.paste(pattern, (left, upper))
+    if image_format == 'GIF':
+        img = img.convert('P', dither=getattr(Image, 'Dither', Image).NONE)
+
+    # Write under a temporary name so an interrupted run never leaves a partial source
+    temp_path = path + '.part'
+    img.save(temp_path, format=image_format)
+    os.replace(temp_path, path)
+    return path
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_case(case):
+    """
+    Split one source and measure it. Runs inside the child process.
+    """
+    save_dir = tempfile.mkdtemp(prefix='splyt-bench-')
+    try:
+        start = time.perf_counter()
+        result = splyt(case['source'], save_dir, tuple(case['grid']), quiet=True, threads=case['threads'], max_tile_size=case.get('max_tile_size'),
+                       image_format=case.get('image_format'), preset=case.get('preset'))
+        seconds = time.perf_counter() - start
+        output_bytes = sum(os.path.getsize(tile) for tile in result['tiles'])
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+
+    source_bytes = os.path.getsize(case['source'])
+    return {
+        'tiles': len(result['tiles']),
+        'errors': len(result['errors']),
+        'seconds': seconds,
+        'tiles_per_s': len(result['tiles']) / seconds,
+        'source_mb_per_s': source_bytes / seconds / 1e6,
+        'output_mb_per_s': output_bytes / seconds / 1e6,
+        'output_mb': output_bytes / 1e6,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def measure(case, repeat):
+    """
+    Run a case in fresh child processes and keep the fastest run.
+    """
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_pipeline', '--case', json.dumps(case)],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        runs.append(json.loads(completed.stdout))
+    best = min(runs, key=lambda run: run['seconds'])
+    best['peak_rss_mb'] = max((run['peak_rss_mb'] or 0) for run in runs) or None
+    return best
+
+def case_key(entry):
+    return (entry['format'], entry['megapixels'], tuple(entry['grid']), entry['threads'], entry.get('max_tile_size'),
+            entry.get('output_format'), entry.get('preset'))
+
+def compare(results, baseline_path, tolerance):
+    """
+    Print cases that are more than tolerance slower than in the baseline run.
+    Returns the number of regressions.
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {case_key(entry): entry for entry in json.load(f)['results']}
+
+    regressions = 0
+    for entry in results:
+        previous = baseline.get(case_key(entry))
+        if previous is None:
+            continue
+        change = entry['seconds'] / previous['seconds'] - 1
+        if change > tolerance:
+            regressions += 1
+            print(f"REGRESSION {entry['format']} {entry['megapixels']}MP {entry['grid'][0]}x{entry['grid'][1]}: "
+                  f"{previous['seconds']:.3f}s -> {entry['seconds']:.3f}s ({change:+.0%})")
+    return regressions
+
+def parse_grid(value):
+    cols, rows = value.lower().split('x')
+    return int(cols), int(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the splyt pipeline on synthetic sources.")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help='source sizes in megapixels')
+    parser.add_argument('--grids', default=','.join(f"{cols}x{rows}" for cols, rows in GRIDS))
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--max-tile-size', type=int, help='reduce the tiles to fit in this many pixels')
+    parser.add_argument('--format', dest='output_format', help='write the tiles in this format instead of the source format')
+    parser.add_argument('--presets', help='encoder presets to compare, e.g. fast,balanced,small')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--work-dir', help='where synthetic sources are generated and kept between runs')
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--compare', help='earlier result file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    parser.add_argument('--quick', action='store_true', help='only run the 1 megapixel sources')
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    formats = [image_format.upper() for image_format in args.formats.split(',')]
+    sizes = [1] if args.quick else [int(size) for size in args.sizes.split(',')]
+    grids = [parse_grid(grid) for grid in args.grids.split(',')]
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), 'splyt-bench-sources')
+    os.makedirs(work_dir, exist_ok=True)
+
+    presets = args.presets.split(',') if args.presets else [None]
+    output_format = args.output_format.upper() if args.output_format else None
+
+    results = []
+    print(f"{'format':<6} {'MP':>4} {'grid':>8} {'preset':>8} {'tiles':>6} {'seconds':>9} {'tiles/s':>9} {'src MB/s':>9} {'out MB/s':>9} {'out MB':>8} {'RSS MB':>8}")
+    for image_format in formats:
+        for megapixels in sizes:
+            source = generate_source(work_dir, image_format, megapixels)
+            for grid in grids:
+                for preset in presets:
+                    case = {'source': source, 'grid': grid, 'threads': args.threads, 'max_tile_size': args.max_tile_size,
+                            'image_format': output_format, 'preset': preset}
+                    entry = dict(format=image_format, megapixels=megapixels, grid=list(grid), threads=args.threads, max_tile_size=args.max_tile_size,
+                                 output_format=output_format, preset=preset, **measure(case, args.repeat))
+                    results.append(entry)
+                    rss = f"{entry['peak_rss_mb']:8.0f}" if entry['peak_rss_mb'] is not None else f"{'-':>8}"
+                    print(f"{image_format:<6} {megapixels:>4} {grid[0]:>3}x{grid[1]:<4} {preset or '-':>8} {entry['tiles']:>6} {entry['seconds']:>9.3f} "
+                          f"{entry['tiles_per_s']:>9.1f} {entry['source_mb_per_s']:>9.1f} {entry['output_mb_per_s']:>9.1f} {entry['output_mb']:>8.1f} {rss}")
+
+    report = {
+        'splyt_version': VERSION,
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
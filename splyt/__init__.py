@@ -1,3 +1,6 @@
 # splyt/__init__.py
 
-from .cli import main
+def main():
+    # Imported on first use, so importing the package does not load Pillow
+    from .cli import main as cli_main
+    return cli_main()
@@ -0,0 +1,177 @@
+# aio.py
+
+import asyncio
+import functools
+import os
+import threading
+from .core import splyt, iter_tiles, _scan_image_jobs, _split_scanned_image
+from .events import SplitHooks, combine_hooks
+from .naming import NamingIndex
+from .config import ASYNC_IMAGES_IN_FLIGHT, ASYNC_TILES_IN_MEMORY, ERROR_PROCESSING_IMAGE
+
+class SplitCancelled(Exception):
+    """
+    Raised inside a running split to stop it once its asyncio task was cancelled.
+    """
+
+class _CancelHooks(SplitHooks):
+    """
+    Stop a split at the next tile once cancelled, and remember the files it wrote.
+    """
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.written = []
+
+    def on_tile_start(self, event):
+        if self.cancelled.is_set():
+            raise SplitCancelled(event['image'])
+
+    def on_tile_end(self, event):
+        if event['path']:
+            self.written.append(event['path'])
+
+    def remove_outputs(self):
+        for path in self.written:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+async def _run_split(split, executor, *args, **split_options):
+    """
+    Run a blocking split in the executor. If the awaiting task is cancelled, the split
+    stops before its next tile and the tiles it already wrote are removed.
+    """
+    loop = asyncio.get_running_loop()
+    cancel_hooks = _CancelHooks()
+    split_options['hooks'] = combine_hooks(split_options.get('hooks'), cancel_hooks)
+    future = loop.run_in_executor(executor, functools.partial(split, *args, **split_options))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        cancel_hooks.cancelled.set()
+        # A running executor job cannot be interrupted; wait until it gives up
+        await asyncio.wait([future])
+        if not future.cancelled():
+            # Usually SplitCancelled; retrieved so it is not reported as unhandled
+            future.exception()
+        # Archive entries cannot be taken back, and with 'skip' a path may be an older file
+        naming = split_options.get('naming', 'suffix')
+        if split_options.get('sink') is None and getattr(naming, 'policy', naming) != 'skip':
+            cancel_hooks.remove_outputs()
+        raise
+
+async def asplyt(image_path, save_dir=None, grid_size=(3, 3), executor=None, **split_options):
+    """
+    Async counterpart of splyt(): the image is decoded, cropped, encoded and written in
+    executor (the loop's default thread pool if None), so the event loop keeps running.
+    The other keyword arguments are those of splyt(); hooks are called from the
+    executor's thread.
+    Cancelling the awaiting task stops the split before its next tile and removes the
+    tiles already written (not with a sink, or the 'skip' naming policy).
+    """
+    return await _run_split(splyt, executor, image_path, save_dir, grid_size, **split_options)
+
+async def aprocess_directory(directory_path, save_dir, grid_size, max_images=ASYNC_IMAGES_IN_FLIGHT, executor=None, recursive=False, **split_options):
+    """
+    Async counterpart of process_directory(): an async iterator over the per-image
+    results, in the order the images finish. At most max_images images are split at
+    once, and the directory is only scanned as far as needed to keep them busy.
+    Closing the iterator early, or cancelling the task consuming it, cancels the images
+    in progress like asplyt() does.
+    """
+    loop = asyncio.get_running_loop()
+    save_dir, image_jobs = await loop.run_in_executor(executor, _scan_image_jobs, directory_path, save_dir, recursive, split_options.get('sink'))
+    split_options = dict(split_options, grid_size=grid_size)
+    semaphore = asyncio.Semaphore(max_images)
+    naming_indexes = {}
+    running = set()
+
+    async def split_image(image_path, source_format, image_save_dir, image_options):
+        try:
+            return await _run_split(_split_scanned_image, executor, image_path, source_format, image_save_dir, **image_options)
+        except Exception as exc:
+            return {'image': image_path, 'tiles': [], 'errors': [ERROR_PROCESSING_IMAGE.format(image=image_path, error=exc)]}
+        finally:
+            semaphore.release()
+
+    try:
+        while True:
+            # Wait for a free slot before scanning on, so the scan stays lazy
+            await semaphore.acquire()
+            job = await loop.run_in_executor(executor, next, image_jobs, None)
+            if job is None:
+                semaphore.release()
+                break
+
+            image_path, source_format, image_save_dir = job
+            image_save_dir = os.path.normpath(image_save_dir)
+            image_options = split_options
+            if split_options.get('sink') is None:
+                # One naming index per output directory, shared by the images in flight
+                if image_save_dir not in naming_indexes:
+                    naming_indexes[image_save_dir] = await loop.run_in_executor(
+                        executor, _naming_index_for, image_save_dir, split_options.get('naming', 'suffix'))
+                image_options = dict(split_options, naming=naming_indexes[image_save_dir])
+            running.add(asyncio.ensure_future(split_image(image_path, source_format, image_save_dir, image_options)))
+
+            for task in [task for task in running if task.done()]:
+                running.discard(task)
+                yield task.result()
+
+        while running:
+            finished, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                yield task.result()
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+def _naming_index_for(directory, naming):
+    if isinstance(naming, NamingIndex):
+        return naming
+    os.makedirs(directory, exist_ok=True)
+    return NamingIndex(directory, naming)
+
+async def aiter_tiles(source, grid_size=(3, 3), max_tiles=ASYNC_TILES_IN_MEMORY, executor=None, **tile_options):
+    """
+    Async counterpart of iter_tiles(): yields (col, row, box, tile) while the tiles are
+    cropped and encoded in executor. At most max_tiles finished tiles wait in memory;
+    when the consumer falls behind, producing pauses until it catches up.
+    The other keyword arguments are those of iter_tiles().
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(max(1, max_tiles))
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for item in iter_tiles(source, grid_size, **tile_options):
+                if stopped.is_set():
+                    return
+                # Blocks while the queue is full
+                asyncio.run_coroutine_threadsafe(queue.put(('tile', item)), loop).result()
+        except Exception as exc:
+            if not stopped.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(('error', exc)), loop).result()
+            return
+        if not stopped.is_set():
+            asyncio.run_coroutine_threadsafe(queue.put(('done', None)), loop).result()
+
+    producer = loop.run_in_executor(executor, produce)
+    try:
+        while True:
+            kind, item = await queue.get()
+            if kind == 'done':
+                break
+            if kind == 'error':
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        # Make room so a producer waiting on a full queue sees that it should stop
+        while not queue.empty():
+            queue.get_nowait()
+        await asyncio.wait([producer])
@@ -0,0 +1,221 @@
+# bands.py
+
+import mmap
+from PIL import Image
+
+def get_raw_strips(img):
+    """
+    Describe where the uncompressed pixel rows of an image are stored in its file.
+    Returns a list of strip dicts with the keys 'left', 'upper', 'right', 'lower',
+    'offset', 'rawmode', 'stride' and 'orientation', or None if Pillow has to decode
+    the image (compressed data, an image that is already loaded, or strips that do not
+    each hold whole pixels of a separate area, e.g. planar TIFFs with one strip per band).
+    """
+    if not getattr(img, 'filename', None) or not getattr(img, 'tile', None):
+        return None
+
+    bands = img.getbands()
+    strips = []
+    area = 0
+    for tile in img.tile:
+        codec, extents, offset, args = tile[:4]
+        if codec != 'raw':
+            return None
+
+        if isinstance(args, str):
+            args = (args,)
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+
+        left, upper, right, lower = extents
+        if len(bands) > 1 and rawmode.split(';')[0] in bands:
+            # One band of a planar image; the other bands are in strips of their own
+            return None
+        if left < 0 or upper < 0 or right > img.width or lower > img.height:
+            return None
+        area += (right - left) * (lower - upper)
+        if not stride:
+            stride = _raw_row_bytes(img.mode, rawmode, right - left)
+            if stride is None:
+                return None
+
+        strips.append({
+            'left': left,
+            'upper': upper,
+            'right': right,
+            'lower': lower,
+            'offset': offset,
+            'rawmode': rawmode,
+            'stride': stride,
+            'orientation': orientation,
+        })
+    if area != img.width * img.height:
+        # Strips that overlap (or leave gaps) are not a plain layout of the pixels
+        return None
+    return strips
+
+def _raw_row_bytes(mode, rawmode, width):
+    """
+    Number of bytes one row of width pixels takes in the given raw mode.
+    """
+    try:
+        return len(Image.new(mode, (width, 1)).tobytes('raw', rawmode))
+    except (ValueError, OSError):
+        return None
+
+def read_band(img, strips, upper, lower):
+    """
+    Read rows upper to lower of an uncompressed image straight from its file,
+    without decoding the rest of the image.
+    """
+    band = None
+    with open(img.filename, 'rb') as f:
+        for strip in strips:
+            top = max(upper, strip['upper'])
+            bottom = min(lower, strip['lower'])
+            if top >= bottom:
+                continue
+
+            # Bottom-up files (e.g. BMP) store the last row of the strip first
+            if strip['orientation'] < 0:
+                first_row = strip['lower'] - bottom
+            else:
+                first_row = top - strip['upper']
+            f.seek(strip['offset'] + first_row * strip['stride'])
+            data = f.read((bottom - top) * strip['stride'])
+
+            size = (strip['right'] - strip['left'], bottom - top)
+            part = Image.frombytes(img.mode, size, data, 'raw', strip['rawmode'], strip['stride'], strip['orientation'])
+
+            if band is None and size == (img.width, lower - upper):
+                # A single strip covers the whole band
+                band = part
+                break
+            if band is None:
+                band = Image.new(img.mode, (img.width, lower - upper))
+            band.paste(part, (strip['left'], top - upper))
+
+    if img.mode in ('P', 'PA') and img.palette is not None:
+        band.palette = img.palette.copy()
+    return band
+
+def iter_row_bands(img, geometry):
+    """
+    Yield (band_upper, band, row) for each row of a GridGeometry, one row at a time.
+    For uncompressed sources only the rows of the current band are read from disk, so
+    memory stays proportional to one grid row. Other sources are decoded once by
+    Pillow and each band is cut from the decoded image, with band_upper set to 0.
+    """
+    strips = get_raw_strips(img)
+    for row in range(geometry.rows):
+        if strips is None:
+            yield 0, img, row
+            continue
+
+        band_upper, band_lower = geometry.row_edges[row], geometry.row_edges[row + 1]
+        band = read_band(img, strips, band_upper, band_lower)
+        yield band_upper, band, row
+        band = None
+
+def _raw_pixel_bytes(mode, rawmode):
+    """
+    Bytes per pixel in the given raw mode, or None if pixels are not byte aligned.
+    """
+    row_bytes = _raw_row_bytes(mode, rawmode, 8)
+    if row_bytes is None or row_bytes % 8:
+        return None
+    return row_bytes // 8
+
+class MappedImage:
+    """
+    Crop cells of an uncompressed image straight from a memory map of its file.
+    crop() builds a cell from its own rows at the file's stride, so only the pages
+    backing the cells that are cropped are ever read, and nothing else is decoded.
+    Where Pillow can map the raw layout directly (e.g. 8-bit grayscale, RGBA)
+    the cell even shares the mapped memory instead of copying it.
+    """
+
+    def __init__(self, img, strips):
+        self.img = img
+        self.mode = img.mode
+        self.size = img.size
+        self.strips = strips
+        self.file = open(img.filename, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.file.close()
+            raise
+
+    def load(self):
+        # Nothing to decode up front
+        pass
+
+    def _read(self, strip, left, upper, right, lower):
+        """
+        Build the pixels of one box that lies inside one strip.
+        """
+        pixel_bytes = strip['pixel_bytes']
+        stride = strip['stride']
+        # Bottom-up files (e.g. BMP) store the last row of the strip first
+        if strip['orientation'] < 0:
+            first_row = strip['lower'] - lower
+        else:
+            first_row = upper - strip['upper']
+        start = strip['offset'] + first_row * stride + (left - strip['left']) * pixel_bytes
+        # Full strides when the file has them, so Pillow can map the rows in place
+        end = min(start + (lower - upper) * stride, len(self.map))
+        data = memoryview(self.map)[start:end]
+        size = (right - left, lower - upper)
+        args = (strip['rawmode'], stride, strip['orientation'])
+        try:
+            return Image.frombuffer(self.mode, size, data, 'raw', *args)
+        except ValueError:
+            return Image.frombytes(self.mode, size, bytes(data), 'raw', *args)
+
+    def crop(self, box):
+        left, upper, right, lower = box
+        cell = None
+        for strip in self.strips:
+            part_box = (max(left, strip['left']), max(upper, strip['upper']), min(right, strip['right']), min(lower, strip['lower']))
+            if part_box[0] >= part_box[2] or part_box[1] >= part_box[3]:
+                continue
+            part = self._read(strip, *part_box)
+            if part_box == box:
+                # One strip holds the whole cell
+                cell = part
+                break
+            if cell is None:
+                cell = Image.new(self.mode, (right - left, lower - upper))
+            cell.paste(part, (part_box[0] - left, part_box[1] - upper))
+
+        if self.mode in ('P', 'PA') and self.img.palette is not None:
+            cell.palette = self.img.palette.copy()
+        return cell
+
+    def close(self):
+        self.file.close()
+        try:
+            self.map.close()
+        except BufferError:
+            # Tiles still share the mapped memory; it is unmapped once they are gone
+            pass
+
+def open_mapped_image(img):
+    """
+    Return a MappedImage for an uncompressed, not yet loaded image whose pixels are
+    byte aligned, or None if it has to be decoded by Pillow. Planar files, where each
+    band has strips of its own (see get_raw_strips()), are always decoded by Pillow.
+    """
+    strips = get_raw_strips(img)
+    if not strips:
+        return None
+    for strip in strips:
+        strip['pixel_bytes'] = _raw_pixel_bytes(img.mode, strip['rawmode'])
+        if strip['pixel_bytes'] is None:
+            return None
+    try:
+        return MappedImage(img, strips)
+    except (OSError, ValueError):
+        return None
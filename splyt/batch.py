@@ -0,0 +1,233 @@
+# batch.py
+
+import json
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, UnidentifiedImageError
+from .core import splyt
+from .dedupe import make_deduper, get_deduper
+from .naming import get_naming_index
+from .utils import create_save_directory_if_needed
+from .config import (
+    IMAGES_IN_FLIGHT_PER_JOB,
+    JOB_DEFAULT_SAVE_DIR,
+    ERROR_INVALID_JOB,
+    ERROR_CANNOT_IDENTIFY_IMAGE,
+    ERROR_PROCESSING_IMAGE,
+)
+
+SIZE_PATTERN = re.compile(r'^(\d+)[xX:/](\d+)$')
+
+def _parse_size(value, field):
+    """
+    Read a (x, y) pair given as [x, y] or as 'XxY' (also 'X:Y' and 'X/Y').
+    """
+    if isinstance(value, str):
+        match = SIZE_PATTERN.match(value.strip())
+        if match:
+            value = [match.group(1), match.group(2)]
+    try:
+        x, y = (int(number) for number in value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{field}' must be [x, y] or 'XxY', not {value!r}") from None
+    if x < 1 or y < 1:
+        raise ValueError(f"'{field}' must be positive, not {value!r}")
+    return x, y
+
+def parse_job(line, base_dir=''):
+    """
+    Parse one line of a jobs file into a job dict. A line is a JSON object with:
+    'source' (required), 'output' (the save directory, default JOB_DEFAULT_SAVE_DIR
+    next to the source), 'grid_size' (default [2, 1]), 'aspect_ratio', 'copy_metadata',
+    'add_metadata' and an optional 'id' that is echoed in the result.
+    Relative paths are resolved against base_dir. Raises ValueError for invalid jobs.
+    """
+    try:
+        spec = json.loads(line)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"not valid JSON ({exc.msg})") from None
+    if not isinstance(spec, dict):
+        raise ValueError("a job must be a JSON object")
+    if not isinstance(spec.get('source'), str) or not spec['source']:
+        raise ValueError("'source' is required")
+
+    source = os.path.abspath(os.path.join(base_dir, spec['source']))
+    output = spec.get('output')
+    if output is None:
+        output = os.path.join(os.path.dirname(source), JOB_DEFAULT_SAVE_DIR)
+    elif not isinstance(output, str):
+        raise ValueError("'output' must be a path")
+
+    job = {
+        'id': spec.get('id'),
+        'source': source,
+        'save_dir': os.path.abspath(os.path.join(base_dir, output)),
+        'grid_size': _parse_size(spec.get('grid_size', [2, 1]), 'grid_size'),
+        'aspect_ratio': _parse_size(spec['aspect_ratio'], 'aspect_ratio') if spec.get('aspect_ratio') is not None else None,
+    }
+    for flag in ('copy_metadata', 'add_metadata'):
+        value = spec.get(flag, True)
+        if not isinstance(value, bool):
+            raise ValueError(f"'{flag}' must be true or false")
+        job[flag] = value
+    return job
+
+def read_jobs_file(jobs_file):
+    """
+    Lazily yield (line_number, job, error) for every non-blank line of a JSONL jobs
+    file; error is the message for a line that is not a valid job, job is then None.
+    Relative paths in the jobs are resolved against the jobs file's directory.
+    """
+    base_dir = os.path.dirname(os.path.abspath(jobs_file))
+    with open(jobs_file, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, parse_job(line, base_dir), None
+            except ValueError as exc:
+                yield line_number, None, ERROR_INVALID_JOB.format(line=line_number, error=exc)
+
+def group_jobs(numbered_jobs):
+    """
+    Group (line_number, job) pairs by source, in the order each source first appears.
+    Returns a list of (source, [(line_number, job), ...]).
+    """
+    groups = {}
+    for line_number, job in numbered_jobs:
+        groups.setdefault(job['source'], []).append((line_number, job))
+    return list(groups.items())
+
+def _job_result(line_number, job, result):
+    job_result = {
+        'line': line_number,
+        'id': job['id'],
+        'image': job['source'],
+        'save_dir': job['save_dir'],
+        'grid_size': list(job['grid_size']),
+        'tiles': result['tiles'],
+        'errors': result['errors'],
+    }
+    for key in ('blank_tiles', 'duplicates'):
+        if key in result:
+            job_result[key] = result[key]
+    return job_result
+
+def _failed_results(numbered_jobs, message):
+    return [_job_result(line_number, job, {'tiles': [], 'errors': [message]}) for line_number, job in numbered_jobs]
+
+def split_source_jobs(source, numbered_jobs, threads=1, lossless_jpeg=False, naming='suffix', blank='keep', dedupe=None, max_tile_size=None, image_format=None, preset=None, all_frames=False):
+    """
+    Run every job of one source: the image is opened and decoded once, and each grid is
+    cut from that decoded image. Returns one result dict per job, in the given order.
+    blank and dedupe are passed on to splyt(); blank may be a TileDeduper shared with
+    other sources. With max_tile_size the tiles of every job are reduced from the one
+    full-size decode, which the grids share. With all_frames every job reads the
+    frames of the source one at a time.
+    """
+    try:
+        img = Image.open(source)
+        img.load()
+    except (UnidentifiedImageError, OSError):
+        return _failed_results(numbered_jobs, ERROR_CANNOT_IDENTIFY_IMAGE.format(image_path=source))
+
+    results = []
+    with img:
+        for line_number, job in numbered_jobs:
+            try:
+                naming_index = get_naming_index(create_save_directory_if_needed(job['save_dir']), naming)
+                result = splyt(
+                    img,
+                    job['save_dir'],
+                    job['grid_size'],
+                    aspect_ratio=job['aspect_ratio'],
+                    copy_metadata=job['copy_metadata'],
+                    add_metadata=job['add_metadata'],
+                    quiet=True,
+                    threads=threads,
+                    lossless_jpeg=lossless_jpeg,
+                    naming=naming_index,
+                    blank=blank,
+                    dedupe=dedupe,
+                    max_tile_size=max_tile_size,
+                    image_format=image_format,
+                    preset=preset,
+                    all_frames=all_frames,
+                )
+            except Exception as exc:
+                result = {'tiles': [], 'errors': [ERROR_PROCESSING_IMAGE.format(image=source, error=exc)]}
+            results.append(_job_result(line_number, job, result))
+    return results
+
+def _split_source_worker(source, numbered_jobs, split_options):
+    """
+    split_source_jobs() inside a worker process, isolating any failure to that source.
+    """
+    try:
+        if split_options['dedupe'] or split_options['blank'] != 'keep':
+            # One deduper per worker process, kept for the whole run
+            split_options = dict(split_options, blank=get_deduper(split_options['blank'], split_options['dedupe']))
+        return split_source_jobs(source, numbered_jobs, **split_options)
+    except Exception as exc:
+        return _failed_results(numbered_jobs, ERROR_PROCESSING_IMAGE.format(image=source, error=exc))
+
+def run_jobs_file(jobs_file, jobs=1, threads=1, lossless_jpeg=False, naming='suffix', blank='keep', dedupe=None, max_tile_size=None, image_format=None, preset=None, all_frames=False):
+    """
+    Run every job of a JSONL jobs file (see parse_job()), lazily yielding one result
+    dict per job: 'line', 'id', 'image', 'save_dir', 'grid_size', 'tiles' and 'errors'
+    (and 'blank_tiles' and 'duplicates' where splyt() reports them).
+    Jobs that share a source are grouped, so each image is decoded only once however
+    many grids are cut from it. Invalid lines are reported first, then the results
+    follow source by source in the order the sources first appear.
+    With jobs > 1 sources are split across a pool of worker processes; jobs=0 uses one
+    per CPU. threads, lossless_jpeg, naming, blank, dedupe, max_tile_size, image_format,
+    preset and all_frames are passed on to splyt(); repeated tiles are found across the
+    jobs of each worker.
+    """
+    valid_jobs = []
+    for line_number, job, error in read_jobs_file(jobs_file):
+        if error:
+            yield {'line': line_number, 'id': None, 'image': None, 'save_dir': None, 'grid_size': None, 'tiles': [], 'errors': [error]}
+        else:
+            valid_jobs.append((line_number, job))
+    groups = group_jobs(valid_jobs)
+    split_options = {
+        'threads': threads,
+        'lossless_jpeg': lossless_jpeg,
+        'naming': naming,
+        'blank': blank,
+        'dedupe': dedupe,
+        'max_tile_size': max_tile_size,
+        'image_format': image_format,
+        'preset': preset,
+        'all_frames': all_frames,
+    }
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1:
+        # One deduper for the whole run, so repeats are found across jobs
+        split_options['blank'] = make_deduper(blank, dedupe) or blank
+        for source, numbered_jobs in groups:
+            yield from split_source_jobs(source, numbered_jobs, **split_options)
+        return
+
+    # Keep a bounded number of sources queued, reporting them in order
+    max_pending = jobs * IMAGES_IN_FLIGHT_PER_JOB
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for source, numbered_jobs in groups:
+            if len(pending) >= max_pending:
+                yield from _finished_source(*pending.popleft())
+            pending.append((source, numbered_jobs, executor.submit(_split_source_worker, source, numbered_jobs, split_options)))
+        while pending:
+            yield from _finished_source(*pending.popleft())
+
+def _finished_source(source, numbered_jobs, future):
+    try:
+        return future.result()
+    except Exception as exc:
+        # The worker process itself died
+        return _failed_results(numbered_jobs, ERROR_PROCESSING_IMAGE.format(image=source, error=exc))
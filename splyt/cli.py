@@ -2,9 +2,14 @@
 
 import sys
 import os
+import contextlib
+import importlib
+import json
 import re
+import signal
+import threading
 import time
-from splyt.core import splyt, process_directory
+from splyt.events import SplitHooks, StatsCollector, combine_hooks
 from splyt.config import (
     USAGE_MESSAGE,
     ERROR_NO_TARGET_IMAGE,
@@ -14,12 +19,190 @@ from splyt.config import (
     COLOR_RESET,
     PROCESSING_IMAGE,
     COMPLETION_MESSAGE,
-    ETA_FORMAT
+    ETA_FORMAT,
+    ERROR_OPTION_REQUIRES_VALUE,
+    ERROR_INVALID_OPTION_VALUE,
+    RESUME_SKIPPED_MESSAGE,
+    NAMING_POLICIES,
+    BLANK_POLICIES,
+    DEDUPE_MODES,
+    FSYNC_POLICIES,
+    ERROR_WRITE_BEHIND_RESUME,
+    ERROR_FRAMES_WITH_SINK,
+    ERROR_SHARD_ARGUMENTS,
+    PYRAMID_LAYOUTS,
+    ENCODER_PRESETS,
+    OUTPUT_PLUGINS,
+    PYRAMID_TILE_SIZE,
+    PYRAMID_OVERLAP,
+    PYRAMID_COMPLETION_MESSAGE,
+    ERROR_NO_IMAGE_FILES,
+    IMAGE_PLUGINS,
+    ERROR_WATCH_TARGET,
+    ERROR_WATCH_WITH_OUTPUT,
+    ERROR_WATCH_OPTION,
+    ERROR_JOBS_FILE_OPTION,
+    ERROR_PYRAMID_OPTION,
+    ERROR_JOBS_FILE_NOT_FOUND,
+    WATCH_STARTED_MESSAGE,
+    WATCH_IMAGE_DONE_MESSAGE,
 )
-from splyt.utils import get_lowest_available_directory
+from splyt.utils import get_lowest_available_directory, get_latest_existing_directory, parse_shard, parse_output_format
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise ValueError(value)
+    return number
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise ValueError(value)
+    return number
+
+def pyramid_layout(value):
+    if value not in PYRAMID_LAYOUTS:
+        raise ValueError(value)
+    return value
+
+def blank_policy(value):
+    if value not in BLANK_POLICIES:
+        raise ValueError(value)
+    return value
+
+def dedupe_mode(value):
+    if value not in DEDUPE_MODES:
+        raise ValueError(value)
+    return value
+
+def fsync_policy(value):
+    if value not in FSYNC_POLICIES:
+        raise ValueError(value)
+    return value
+
+def encoder_preset(value):
+    if value not in ENCODER_PRESETS:
+        raise ValueError(value)
+    return value
+
+def naming_policy(value):
+    if value not in NAMING_POLICIES:
+        raise ValueError(value)
+    return value
+
+# Options that take a value: flag -> (option name, converter)
+VALUE_OPTIONS = {
+    '-j': ('jobs', non_negative_int),
+    '--jobs': ('jobs', non_negative_int),
+    '-t': ('threads', non_negative_int),
+    '--threads': ('threads', non_negative_int),
+    '-o': ('output', str),
+    '--output': ('output', str),
+    '--naming': ('naming', naming_policy),
+    '--jobs-file': ('jobs_file', str),
+    '--pyramid': ('pyramid', pyramid_layout),
+    '--tile-size': ('tile_size', positive_int),
+    '--overlap': ('overlap', non_negative_int),
+    '--blank': ('blank', blank_policy),
+    '--dedupe': ('dedupe', dedupe_mode),
+    '--fsync': ('fsync', fsync_policy),
+    '--shard': ('shard', parse_shard),
+    '--max-tile-size': ('max_tile_size', positive_int),
+    '--format': ('image_format', parse_output_format),
+    '--preset': ('preset', encoder_preset),
+}
+
+# Options that are simply switched on: flag -> option name
+SWITCH_OPTIONS = {
+    '--deterministic': 'deterministic',
+    '-r': 'recursive',
+    '--recursive': 'recursive',
+    '--stream': 'stream',
+    '--lossless': 'lossless_jpeg',
+    '--resume': 'resume',
+    '--stats': 'stats',
+    '--watch': 'watch',
+    '--write-behind': 'write_behind',
+    '--all-frames': 'all_frames',
+}
+
+DEFAULT_OPTIONS = {
+    'jobs': 1,
+    'threads': 1,
+    'deterministic': False,
+    'recursive': False,
+    'stream': False,
+    'lossless_jpeg': False,
+    'resume': False,
+    'output': None,
+    'naming': 'suffix',
+    'stats': False,
+    'watch': False,
+    'jobs_file': None,
+    'pyramid': None,
+    'tile_size': PYRAMID_TILE_SIZE,
+    'overlap': PYRAMID_OVERLAP,
+    'blank': 'keep',
+    'dedupe': None,
+    'write_behind': False,
+    'fsync': 'none',
+    'shard': None,
+    'max_tile_size': None,
+    'image_format': None,
+    'preset': None,
+    'all_frames': False,
+}
+
+# Options --pyramid makes use of; it splits each source on its own, into a directory
+PYRAMID_OPTIONS = ('pyramid', 'tile_size', 'overlap', 'image_format', 'preset')
+
+def option_flag(name):
+    """
+    The long command line flag of an option name, e.g. '--lossless' for 'lossless_jpeg'.
+    """
+    flags = [flag for flag, (option, _) in VALUE_OPTIONS.items() if option == name]
+    flags += [flag for flag, option in SWITCH_OPTIONS.items() if option == name]
+    return max(flags, key=len)
+
+def parse_options(args=None):
+    """
+    Extract the named options (e.g. '-j 4', '--deterministic') from the command line.
+    Returns the options dict and the remaining arguments.
+    """
+    args = sys.argv[1:] if args is None else args
+    options = dict(DEFAULT_OPTIONS)
+    remaining = []
+
+    idx = 0
+    while idx < len(args):
+        arg = args[idx]
+        flag, has_inline_value, inline_value = arg.partition('=')
+        if flag in VALUE_OPTIONS:
+            name, converter = VALUE_OPTIONS[flag]
+            if has_inline_value:
+                value = inline_value
+            elif idx + 1 < len(args):
+                idx += 1
+                value = args[idx]
+            else:
+                print(ERROR_OPTION_REQUIRES_VALUE.format(option=flag))
+                sys.exit(1)
+            try:
+                options[name] = converter(value)
+            except ValueError:
+                print(ERROR_INVALID_OPTION_VALUE.format(value=value, option=flag))
+                sys.exit(1)
+        elif arg in SWITCH_OPTIONS:
+            options[SWITCH_OPTIONS[arg]] = True
+        else:
+            remaining.append(arg)
+        idx += 1
+
+    return options, remaining
 
 def parse_arguments():
-    args = sys.argv[1:]
+    named_options, args = parse_options(sys.argv[1:])
 
     if len(args) < 1:
         print(USAGE_MESSAGE)
@@ -94,6 +277,11 @@ def parse_arguments():
         print(ERROR_NO_TARGET_IMAGE)
         sys.exit(1)
 
+    if named_options['shard'] and (save_dir is None or not os.path.isdir(target)):
+        # Shards running side by side must agree on one save directory
+        print(ERROR_SHARD_ARGUMENTS)
+        sys.exit(1)
+
     # Convert paths to absolute paths
     target = os.path.abspath(target)
     if save_dir is not None:
@@ -101,79 +289,309 @@ def parse_arguments():
     else:
         # Default save directory
         target_dir = os.path.dirname(target) if os.path.isfile(target) else target
-        save_dir = get_lowest_available_directory(os.path.join(target_dir, "splyt"))
+        save_dir = None
+        if named_options['resume']:
+            # Continue in the directory of the previous run
+            save_dir = get_latest_existing_directory(os.path.join(target_dir, "splyt"))
+        if save_dir is None:
+            save_dir = get_lowest_available_directory(os.path.join(target_dir, "splyt"))
         save_dir = os.path.abspath(save_dir)
 
-    # Ensure the save directory exists
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir)
+    # Ensure the save directory exists, unless tiles go to an --output sink
+    if not named_options['output']:
+        # Shards started side by side may create it at the same time
+        os.makedirs(save_dir, exist_ok=True)
 
     return grid_size, aspect_ratio, target, save_dir, copy_metadata, add_metadata
 
-def main():
-    grid_size, aspect_ratio, target, save_dir, copy_metadata, add_metadata = parse_arguments()
-
-    start_time = time.time()
+class CliProgress(SplitHooks):
+    """
+    Print a progress line per tile and a completion message per image.
+    The ETA is the time left for the current image, from its own tile rate so far.
+    """
 
-    if os.path.isdir(target):
-        total_images = len([f for f in os.listdir(target) if os.path.isfile(os.path.join(target, f))])
-    else:
-        total_images = 1
+    def __init__(self, aspect_ratio, output=None):
+        self.aspect_ratio = aspect_ratio
+        self.output = output
+        self.image_started = time.perf_counter()
 
-    processed_images = 0
+    def on_image_start(self, event):
+        self.image_started = time.perf_counter()
 
-    def print_progress(iteration, total, filename):
-        nonlocal start_time, processed_images
-
-        processed_images += 1
-        elapsed_time = time.time() - start_time
-        avg_time_per_image = elapsed_time / processed_images if processed_images else 0
-        remaining_images = total - iteration
-        eta_seconds = int(avg_time_per_image * remaining_images)
+    def on_tile_end(self, event):
+        iteration, total = event['index'], event['total']
+        elapsed_time = time.perf_counter() - self.image_started
+        eta_seconds = int(elapsed_time / iteration * (total - iteration))
         eta_minutes, eta_seconds = divmod(eta_seconds, 60)
         eta_formatted = ETA_FORMAT.format(minutes=eta_minutes, seconds=eta_seconds)
 
         progress_message = (
             f"{COLOR_GREEN}{PROCESSING_IMAGE.format(iteration=iteration, total=total, filename='')}{COLOR_RESET}"
-            f"{COLOR_WHITE}{filename}{COLOR_RESET} "
+            f"{COLOR_WHITE}{event['tile']}{COLOR_RESET} "
             f"{COLOR_BLUE}{eta_formatted}{COLOR_RESET}"
         )
 
         print(f"\r{progress_message}", end='', flush=True)
 
-    def print_completion_message(filename, total_splits, save_dir):
-        aspect_info = f" in [{aspect_ratio[0]}:{aspect_ratio[1]}]" if aspect_ratio else ""
-        total_images_str = f"{COLOR_GREEN}{total_splits}{COLOR_RESET}"
+    def on_image_end(self, event):
+        if event['total'] is None:
+            return
+        aspect_info = f" in [{self.aspect_ratio[0]}:{self.aspect_ratio[1]}]" if self.aspect_ratio else ""
+        total_images_str = f"{COLOR_GREEN}{event['total']}{COLOR_RESET}"
         eta_formatted = ETA_FORMAT.format(minutes=0, seconds=0)
         completion_message = COMPLETION_MESSAGE.format(
             total_images=total_images_str,
             aspect_info=aspect_info,
-            save_dir=save_dir,
+            save_dir=self.output or event['save_dir'],
             eta=f"{COLOR_BLUE}{eta_formatted}{COLOR_RESET}"
         )
         print(f"\r{' ' * 80}", end='\r')  # Clear the line
         print(completion_message)
 
+def register_image_plugins(image_format=None):
+    """
+    Load the Pillow plugins for the supported formats, and the one for the tile format
+    image_format if that is not read (e.g. WebP), before any image is opened. Pillow
+    then finds them registered instead of importing every plugin it has on the first
+    image that preinit() does not cover (e.g. TIFF); scanned sources are opened with
+    formats= on top. Other formats still load on demand.
+    Only done by the CLI, which owns the process; library users keep Pillow's defaults.
+    """
+    plugins = list(IMAGE_PLUGINS.values())
+    if image_format in OUTPUT_PLUGINS:
+        plugins.append(OUTPUT_PLUGINS[image_format])
+    for plugin in plugins:
+        importlib.import_module(f"PIL.{plugin}")
+
+def main():
+    options, _ = parse_options()
+    if options['jobs_file']:
+        # Every job names its own source, output and grid
+        register_image_plugins(options['image_format'])
+        run_jobs_file(options)
+        return
+
+    grid_size, aspect_ratio, target, save_dir, copy_metadata, add_metadata = parse_arguments()
+    register_image_plugins(options['image_format'])
+
+    if options['pyramid']:
+        pyramid(target, save_dir, options)
+        return
+
+    if options['watch']:
+        watch(target, save_dir, grid_size, aspect_ratio, copy_metadata, add_metadata, options)
+        return
+
+    stats = StatsCollector() if options['stats'] else None
+    # Tiles written through a sink report their names relative to it
+    hooks = combine_hooks(CliProgress(aspect_ratio, options['output'] or (save_dir if options['write_behind'] else None)), stats)
+
+    if options['write_behind'] and options['resume']:
+        print(ERROR_WRITE_BEHIND_RESUME)
+        sys.exit(1)
+    if options['all_frames'] and (options['output'] or options['write_behind']):
+        print(ERROR_FRAMES_WITH_SINK)
+        sys.exit(1)
+
+    with contextlib.ExitStack() as stack:
+        sink = write_behind = None
+        if options['output'] or options['write_behind']:
+            from splyt.sinks import open_sink, DirectorySink, WriteBehindSink
+            sink = open_sink(options['output'], options['naming']) if options['output'] else DirectorySink(save_dir, options['naming'])
+            if options['write_behind']:
+                sink = write_behind = WriteBehindSink(sink, fsync=options['fsync'])
+            stack.enter_context(sink)
+            if options['output'] == '-':
+                # Keep the TAR stream on stdout free of progress and error messages
+                stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+        results = run(target, None if sink else save_dir, grid_size, aspect_ratio, copy_metadata, add_metadata, options, sink, hooks)
+        if write_behind:
+            # Wait for the writer, so its errors and counters are complete
+            write_behind.close()
+            for result in results:
+                write_behind.remove_failed(result)
+            for message in write_behind.errors:
+                print(message)
+        if stats:
+            summary = stats.summary()
+            if write_behind:
+                summary['write_behind'] = write_behind.stats()
+            print(json.dumps(summary, indent=2))
+        if write_behind and write_behind.errors:
+            sys.exit(1)
+
+def run_jobs_file(options):
+    from splyt.batch import run_jobs_file as run_jobs
+
+    for option in ('watch', 'output', 'resume', 'stream', 'stats', 'write_behind', 'shard', 'pyramid'):
+        if options[option] != DEFAULT_OPTIONS[option]:
+            print(ERROR_JOBS_FILE_OPTION.format(option='--' + option.replace('_', '-')))
+            sys.exit(1)
+    if not os.path.isfile(options['jobs_file']):
+        print(ERROR_JOBS_FILE_NOT_FOUND.format(path=options['jobs_file']))
+        sys.exit(1)
+
+    # One JSON result per job, written as soon as its source is done
+    for result in run_jobs(
+        options['jobs_file'],
+        jobs=options['jobs'],
+        threads=options['threads'],
+        lossless_jpeg=options['lossless_jpeg'],
+        naming=options['naming'],
+        blank=options['blank'],
+        dedupe=options['dedupe'],
+        max_tile_size=options['max_tile_size'],
+        image_format=options['image_format'],
+        preset=options['preset'],
+        all_frames=options['all_frames']
+    ):
+        print(json.dumps(result), flush=True)
+
+def pyramid(target, save_dir, options):
+    from splyt.pyramid import build_pyramid
+    from splyt.utils import scan_image_files
+
+    for option in DEFAULT_OPTIONS:
+        if option not in PYRAMID_OPTIONS and options[option] != DEFAULT_OPTIONS[option]:
+            print(ERROR_PYRAMID_OPTION.format(option=option_flag(option)))
+            sys.exit(1)
+
     if os.path.isdir(target):
-        process_directory(
+        image_paths = [image_path for image_path, _ in scan_image_files(target)]
+        if not image_paths:
+            print(ERROR_NO_IMAGE_FILES.format(directory=target))
+            return
+    else:
+        image_paths = [target]
+
+    for image_path in image_paths:
+        result = build_pyramid(
+            image_path,
+            save_dir,
+            tile_size=options['tile_size'],
+            overlap=options['overlap'],
+            layout=options['pyramid'],
+            tile_format=options['image_format'],
+            preset=options['preset']
+        )
+        if result['tiles']:
+            print(PYRAMID_COMPLETION_MESSAGE.format(
+                tiles=f"{COLOR_GREEN}{len(result['tiles'])}{COLOR_RESET}",
+                levels=result['levels'],
+                image=os.path.basename(image_path),
+                save_dir=save_dir
+            ))
+
+def watch(target, save_dir, grid_size, aspect_ratio, copy_metadata, add_metadata, options):
+    from splyt.watch import watch_directory, format_status
+
+    if not os.path.isdir(target):
+        print(ERROR_WATCH_TARGET)
+        sys.exit(1)
+    if options['output']:
+        print(ERROR_WATCH_WITH_OUTPUT)
+        sys.exit(1)
+    for option in ('write_behind', 'shard'):
+        if options[option] != DEFAULT_OPTIONS[option]:
+            print(ERROR_WATCH_OPTION.format(option='--' + option.replace('_', '-')))
+            sys.exit(1)
+
+    # Stop on Ctrl+C or SIGTERM, after the images already being split
+    stop_event = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop_event.set())
+
+    def print_result(result):
+        for message in result['errors']:
+            print(message)
+        print(WATCH_IMAGE_DONE_MESSAGE.format(image=os.path.basename(result['image']), tiles=len(result['tiles'])), flush=True)
+
+    def print_status(snapshot):
+        print(f"{COLOR_BLUE}{format_status(snapshot)}{COLOR_RESET}", flush=True)
+
+    print(WATCH_STARTED_MESSAGE.format(directory=target, save_dir=save_dir), flush=True)
+    try:
+        watch_directory(
             target,
             save_dir,
             grid_size,
             aspect_ratio=aspect_ratio,
             copy_metadata=copy_metadata,
             add_metadata=add_metadata,
-            cli_callbacks=(print_progress, print_completion_message)
+            jobs=options['jobs'],
+            threads=options['threads'],
+            stream=options['stream'],
+            lossless_jpeg=options['lossless_jpeg'],
+            resume=options['resume'],
+            naming=options['naming'],
+            blank=options['blank'],
+            dedupe=options['dedupe'],
+            max_tile_size=options['max_tile_size'],
+            image_format=options['image_format'],
+            preset=options['preset'],
+            all_frames=options['all_frames'],
+            stop_event=stop_event,
+            on_result=print_result,
+            on_status=print_status
         )
-    else:
-        splyt(
+    except ValueError as exc:
+        print(exc)
+        sys.exit(1)
+
+def run(target, save_dir, grid_size, aspect_ratio, copy_metadata, add_metadata, options, sink, hooks):
+    from splyt.core import splyt, process_directory
+
+    if os.path.isdir(target):
+        results = process_directory(
             target,
             save_dir,
             grid_size,
             aspect_ratio=aspect_ratio,
             copy_metadata=copy_metadata,
             add_metadata=add_metadata,
-            cli_callbacks=(print_progress, print_completion_message)
+            hooks=hooks,
+            jobs=options['jobs'],
+            deterministic=options['deterministic'],
+            threads=options['threads'],
+            recursive=options['recursive'],
+            stream=options['stream'],
+            lossless_jpeg=options['lossless_jpeg'],
+            resume=options['resume'],
+            sink=sink,
+            naming=options['naming'],
+            blank=options['blank'],
+            dedupe=options['dedupe'],
+            shard=options['shard'],
+            max_tile_size=options['max_tile_size'],
+            image_format=options['image_format'],
+            preset=options['preset'],
+            all_frames=options['all_frames']
         )
+        skipped_images = sum(1 for result in results if result.get('skipped'))
+        if skipped_images:
+            print(RESUME_SKIPPED_MESSAGE.format(count=skipped_images))
+        return results
+    else:
+        return [splyt(
+            target,
+            save_dir,
+            grid_size,
+            aspect_ratio=aspect_ratio,
+            copy_metadata=copy_metadata,
+            add_metadata=add_metadata,
+            hooks=hooks,
+            threads=options['threads'],
+            stream=options['stream'],
+            lossless_jpeg=options['lossless_jpeg'],
+            sink=sink,
+            naming=options['naming'],
+            blank=options['blank'],
+            dedupe=options['dedupe'],
+            max_tile_size=options['max_tile_size'],
+            image_format=options['image_format'],
+            preset=options['preset'],
+            all_frames=options['all_frames']
+        )]
 
 if __name__ == "__main__":
     main()
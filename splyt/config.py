@@ -7,6 +7,10 @@ VERSION = "1.4"
 CREATED_WITH_METADATA = "Created with Splyt v{version}"
 COMMENT_KEY_PNG = "Comment"
 USER_COMMENT_TAG_JPEG = 0x9286  # UserComment EXIF tag
+# Image info keys that are not PNG text chunks
+PNG_NON_TEXT_KEYS = {'icc_profile', 'exif', 'dpi', 'gamma', 'transparency', 'aspect', 'srgb', 'chromaticity', 'interlace'}
+# Save profile keys that carry metadata, dropped if saving with them fails
+METADATA_SAVE_KEYS = {'pnginfo', 'exif', 'icc_profile', 'dpi'}
 
 # Error and progress messages
 USAGE_MESSAGE = "Usage: splyt <image_path|directory> [save_directory] [grid_size] [aspect_ratio] [options]"
@@ -17,6 +21,26 @@ ERROR_UNSUPPORTED_IMAGE_TYPE = "Error: The file type '{image_type}' is not curre
 ERROR_NO_TARGET_IMAGE = "Error: No target image or directory provided."
 ERROR_CANNOT_IDENTIFY_IMAGE = "Cannot identify image file '{image_path}'. The file may be corrupted or in an unsupported format."
 ERROR_UNABLE_TO_SAVE_IMAGE = "Error: Unable to save image '{image_name}' in format '{image_format}'."
+ERROR_PROCESSING_IMAGE = "Error: Failed to process '{image}': {error}"
+ERROR_OPTION_REQUIRES_VALUE = "Error: Option '{option}' requires a value."
+ERROR_INVALID_OPTION_VALUE = "Error: Invalid value '{value}' for option '{option}'."
+ERROR_RESUME_WITH_SINK = "Error: --resume only works when writing tiles to a directory."
+ERROR_WATCH_TARGET = "Error: --watch needs a directory to watch."
+ERROR_WATCH_SAVE_DIR = "Error: Tiles cannot be saved in the watched directory itself; choose another save directory."
+ERROR_WATCH_WITH_OUTPUT = "Error: --watch writes tiles to a save directory; --output is not supported."
+ERROR_WATCH_OPTION = "Error: --watch cannot be combined with {option}."
+ERROR_INVALID_JOB = "Error: Invalid job on line {line}: {error}"
+ERROR_JOBS_FILE_OPTION = "Error: --jobs-file cannot be combined with {option}."
+ERROR_PYRAMID_OPTION = "Error: --pyramid cannot be combined with {option}."
+ERROR_JOBS_FILE_NOT_FOUND = "Error: The jobs file '{path}' does not exist."
+ERROR_WRITE_BEHIND_FAILED = "Error: Unable to write tile '{tile}': {error}"
+ERROR_WRITE_BEHIND_RESUME = "Error: --write-behind cannot be combined with --resume."
+ERROR_SHARD_ARGUMENTS = "Error: --shard needs a directory to process and an explicit save directory shared by all shards."
+ERROR_FRAMES_WITH_SINK = "Error: --all-frames writes tiles to a directory; --output and --write-behind are not supported."
+ERROR_FRAMES_FORMAT = "Error: '{image}' has several frames, which {image_format} tiles cannot hold."
+ERROR_TILE_NAME_COLLISION = "Error: '{image}' would get the same tile names as '{other}'; rename one of them to resume with --format."
+ERROR_NUMPY_REQUIRED = "Error: Exporting grid boxes as an array requires NumPy (pip install numpy)."
+WARNING_CANNOT_ALIGN_JPEG = "Warning: The grid for '{image}' cannot be aligned to {block_width}x{block_height} JPEG blocks; tiles are cut at their exact positions."
 
 # Terminal output messages
 PROCESSING_IMAGE = "Processing {iteration}/{total}: {filename}"
@@ -30,6 +54,146 @@ COLOR_RESET = '\033[0m'
 
 # Supported image formats
 SUPPORTED_FORMATS = ['JPEG', 'JPG', 'PNG', 'BMP', 'GIF', 'TIFF', 'TIF']
+# Pillow plugin modules for the supported formats; the CLI registers only these
+IMAGE_PLUGINS = {
+    'JPEG': 'JpegImagePlugin',
+    'PNG': 'PngImagePlugin',
+    'BMP': 'BmpImagePlugin',
+    'GIF': 'GifImagePlugin',
+    'TIFF': 'TiffImagePlugin',
+}
+# Formats tiles can be written in (--format), and the Pillow plugins of those that
+# are not also read; the CLI registers them only when they are asked for
+OUTPUT_FORMATS = ('JPEG', 'PNG', 'WEBP', 'TIFF', 'BMP', 'GIF')
+OUTPUT_PLUGINS = {'WEBP': 'WebPImagePlugin'}
+# File extension written for each tile format
+TILE_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'BMP': '.bmp', 'GIF': '.gif', 'TIFF': '.tif', 'WEBP': '.webp'}
+# Format of each tile extension, including the long ones tiles inherit from sources
+EXTENSION_FORMATS = dict({extension: image_format for image_format, extension in TILE_EXTENSIONS.items()}, **{'.jpeg': 'JPEG', '.tiff': 'TIFF'})
+# Common names of formats that Pillow knows under another name
+FORMAT_ALIASES = {'JPG': 'JPEG', 'TIF': 'TIFF'}
+# Image modes each tile format can store; tiles in other modes are converted to RGB,
+# or to RGBA if they are transparent and the format takes it. Formats not listed
+# take any mode.
+ENCODER_MODES = {
+    'JPEG': ('1', 'L', 'RGB', 'CMYK'),
+    'PNG': ('1', 'L', 'LA', 'I', 'I;16', 'I;16B', 'P', 'RGB', 'RGBA'),
+    'WEBP': ('RGB', 'RGBA'),
+}
+
+# Tile formats that hold several frames, for splitting every frame (--all-frames)
+MULTI_FRAME_FORMATS = ('GIF', 'TIFF')
+
+# Encoder presets (--preset): encoder options per tile format, trading encoding speed
+# for file size. Pillow picks the PNG row filters itself, so zlib's level is what is
+# tuned there (its optimize option made tiles larger in bench_pipeline). Formats
+# that are not listed keep Pillow's defaults.
+ENCODER_PRESETS = {
+    'fast': {
+        'PNG': {'compress_level': 1},
+        'JPEG': {'quality': 85, 'subsampling': 2, 'optimize': False},
+        'WEBP': {'quality': 80, 'method': 0},
+    },
+    'balanced': {
+        'PNG': {'compress_level': 6},
+        'JPEG': {'quality': 90, 'subsampling': 2, 'optimize': True},
+        'WEBP': {'quality': 85, 'method': 4},
+    },
+    'small': {
+        'PNG': {'compress_level': 9},
+        'JPEG': {'quality': 80, 'subsampling': 2, 'optimize': True, 'progressive': True},
+        'WEBP': {'quality': 75, 'method': 6},
+    },
+}
+
+# File signatures of the supported formats, used to sniff files without opening them with Pillow
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'BM', 'BMP'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'II*\x00', 'TIFF'),
+    (b'MM\x00*', 'TIFF'),
+    # BigTIFF, the usual container for sources over 4 GB
+    (b'II+\x00', 'TIFF'),
+    (b'MM\x00+', 'TIFF'),
+]
+SIGNATURE_LENGTH = 8
+
+# Parallel processing
+STAGING_DIR_NAME = ".splyt-worker-{index}"
+TILES_IN_FLIGHT_PER_THREAD = 2
+IMAGES_IN_FLIGHT_PER_JOB = 4
+
+# asyncio API: images split at once, encoded tiles buffered per async tile iterator
+ASYNC_IMAGES_IN_FLIGHT = 4
+ASYNC_TILES_IN_MEMORY = 8
+
+# Statistics (--stats): histogram bucket upper bounds in milliseconds, slowest images listed
+STATS_HISTOGRAM_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+STATS_SLOWEST_IMAGES = 5
+
+# Grid geometry: cell orders, column-major (the default) or row-major
+CELL_ORDERS = ('col', 'row')
+
+# Watch mode: seconds a file must stay unchanged before it is split, seconds between
+# directory checks, images per pool task, pool tasks queued per worker, seconds between
+# status reports, and the window in seconds for the reported rates
+WATCH_SETTLE_SECONDS = 1.0
+WATCH_POLL_INTERVAL = 0.5
+WATCH_BATCH_SIZE = 8
+WATCH_BATCHES_IN_FLIGHT_PER_JOB = 2
+WATCH_STATUS_INTERVAL = 10
+WATCH_RATE_WINDOW = 60
+WATCH_STATUS_FILENAME = "splyt-watch-status.json"
+WATCH_STARTED_MESSAGE = "Watching {directory}, saving tiles in {save_dir}. Press Ctrl+C to stop."
+WATCH_STATUS_MESSAGE = "{queue_depth} waiting ({settling} settling, {queued} queued, {in_flight} splitting), {completed} done, {failed} failed, {images_per_s:.2f} images/s, {tiles_per_s:.1f} tiles/s"
+WATCH_IMAGE_DONE_MESSAGE = "{image}: {tiles} tiles"
+
+# Image pyramids (--pyramid): file layouts, default tile size and overlap in pixels,
+# JPEG quality of the tiles, and the Deep Zoom descriptor
+PYRAMID_LAYOUTS = ('dzi', 'xyz', 'grid')
+PYRAMID_TILE_SIZE = 254
+PYRAMID_OVERLAP = 1
+PYRAMID_JPEG_QUALITY = 90
+DZI_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{format}" Overlap="{overlap}" TileSize="{tile_size}">\n'
+    '  <Size Width="{width}" Height="{height}"/>\n'
+    '</Image>\n'
+)
+PYRAMID_COMPLETION_MESSAGE = "{tiles} tiles in {levels} levels created for {image} in {save_dir}"
+
+# Reduced tiles (--max-tile-size): when no DCT scaling is possible, tiles are first
+# shrunk by whole factors with a box reduce while they stay this many times larger
+# than their final size, then resampled once
+SCALED_TILE_REDUCING_GAP = 3.0
+
+# Jobs files: save directory next to the source for jobs without an 'output'
+JOB_DEFAULT_SAVE_DIR = "splyt"
+
+# Write-behind output (--write-behind): encoded tiles queued for the writer thread,
+# tiles written per batch, and fsync policies
+WRITE_BEHIND_QUEUE_SIZE = 64
+WRITE_BEHIND_BATCH_SIZE = 16
+FSYNC_POLICIES = ('none', 'image', 'run')
+
+# Output naming
+NAMING_POLICIES = ('suffix', 'overwrite', 'skip')
+TEMP_FILE_PREFIX = ".splyt-tmp-"
+
+# Blank and repeated tiles: blank tile policies, dedupe modes, and the file listing
+# duplicates that were not written
+BLANK_POLICIES = ('keep', 'skip', 'placeholder')
+DEDUPE_MODES = ('link', 'manifest')
+DUPLICATES_FILENAME = "splyt-duplicates.jsonl"
+
+# Resumable batch runs
+MANIFEST_FILENAME = "splyt-manifest.jsonl"
+SHARD_MANIFEST_FILENAME = "splyt-manifest.shard-{index}-of-{count}.jsonl"
+HASH_CHUNK_SIZE = 1024 * 1024
+RESUME_SKIPPED_MESSAGE = "{count} unchanged images skipped"
 
 # Other constants
 ETA_FORMAT = "{minutes:02d}:{seconds:02d}"
@@ -1,116 +1,859 @@
 # core.py
 
+import io
 import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from PIL import Image, UnidentifiedImageError
 from .utils import (
     create_save_directory_if_needed,
-    is_image_file,
-    calculate_cell_positions,
+    get_unique_filepath,
+    scan_image_files,
     col_to_letter,
+    get_jpeg_block_size,
+    shard_of,
+    parse_output_format,
 )
-from .metadata import prepare_metadata, save_image_with_metadata
+from .bands import iter_row_bands, open_mapped_image
+from .scaling import ScaledImage, tile_scale_factor, draft_scaled
+from .frames import frame_count, split_frames
+from .grid import GridGeometry
+from .manifest import JobManifest
+from .naming import NamingIndex, get_naming_index
+from .sinks import MemorySink
+from .dedupe import TileRef, make_deduper, get_deduper
+from .events import CallbackHooks, EventRecorder, combine_hooks, replay_events
+from .metadata import prepare_metadata, build_save_profile, save_image_with_profile, encode_image_with_profile, get_jpeg_encoder_params, get_encoder_params, convert_for_format
 from .config import (
     VERSION,
     SUPPORTED_FORMATS,
     ERROR_CANNOT_IDENTIFY_IMAGE,
     ERROR_UNSUPPORTED_IMAGE_TYPE,
     ERROR_UNABLE_TO_SAVE_IMAGE,
+    ERROR_PROCESSING_IMAGE,
+    STAGING_DIR_NAME,
+    TILES_IN_FLIGHT_PER_THREAD,
+    IMAGES_IN_FLIGHT_PER_JOB,
+    WARNING_CANNOT_ALIGN_JPEG,
+    FORMAT_ALIASES,
+    TILE_EXTENSIONS,
+    ENCODER_PRESETS,
+    MULTI_FRAME_FORMATS,
+    ERROR_FRAMES_WITH_SINK,
+    ERROR_FRAMES_FORMAT,
+    ERROR_RESUME_WITH_SINK,
+    ERROR_TILE_NAME_COLLISION,
+    MANIFEST_FILENAME,
+    SHARD_MANIFEST_FILENAME,
 )
 
-def splyt(image_path, save_dir=None, grid_size=(3, 3), aspect_ratio=None, copy_metadata=True, add_metadata=True, cli_callbacks=None):
+def splyt(image_path, save_dir=None, grid_size=(3, 3), aspect_ratio=None, copy_metadata=True, add_metadata=True, cli_callbacks=None, quiet=False, threads=1, stream=False, lossless_jpeg=False, sink=None, naming='suffix', hooks=None, blank='keep', dedupe=None, max_tile_size=None, image_format=None, preset=None, all_frames=False):
     """
     Split a single image into grid sections, accounting for aspect ratio if provided.
+    image_path may also be an already opened PIL image, which is used as is.
+    Returns a result dict with the source 'image', the 'tiles' written and any 'errors'.
+    Errors are printed as they occur unless quiet is True.
+    With threads > 1 the tiles are cropped, encoded and written by a thread pool;
+    threads=0 uses one thread per CPU.
+    With stream=True the image is processed one grid row at a time (see bands.py).
+    Otherwise uncompressed BMP and TIFF sources are cropped cell by cell from a memory
+    map of the file, without decoding the whole image.
+    With lossless_jpeg=True JPEG cells are snapped to the source's MCU grid and
+    re-encoded with its own quantization tables and chroma subsampling.
+    With a sink (see sinks.py) tiles are handed to it instead of being written to
+    save_dir; save_dir then is an optional name prefix inside the sink.
+    naming is the policy for tiles whose name already exists in save_dir ('suffix',
+    'overwrite' or 'skip'), or a NamingIndex shared between calls.
+    hooks (see events.py) receive image and tile events; cli_callbacks is the older
+    (print_progress, print_completion_message) form of the same.
+    blank ('keep', 'skip' or 'placeholder') and dedupe (None, 'link' or 'manifest')
+    handle blank and repeated tiles (see dedupe.py); blank may also be a TileDeduper
+    shared between calls. Skipped blank tiles are listed in the result's
+    'blank_tiles', and duplicates left to the duplicates file in 'duplicates'
+    (tile path -> path of the identical tile).
+    With max_tile_size, every tile is reduced by the same factor so that the longest
+    edge of the largest cell fits in that many pixels (see scaling.py). A JPEG that
+    is not decoded yet is then decoded at 1/2, 1/4 or 1/8 scale, and each tile is
+    resampled once from it; lossless_jpeg no longer aligns the cells then.
+    image_format (e.g. 'WEBP', see OUTPUT_FORMATS) transcodes the tiles into another
+    format, with metadata carried over where that format can hold it; tiles get its
+    extension. preset ('fast', 'balanced' or 'small', see ENCODER_PRESETS) picks
+    encoder options trading speed for size; lossless_jpeg only applies to JPEG tiles
+    of JPEG sources and keeps their tables over the preset's quality.
+    With all_frames=True every frame of an animated GIF or multi-page TIFF is split
+    (see frames.py), one frame at a time: each cell becomes an animated GIF or a
+    multi-page TIFF tile. Threads, stream, blank and dedupe do not apply to these
+    images, and they cannot be written to a sink.
     """
-    print_progress, print_completion_message = cli_callbacks if cli_callbacks else (None, None)
+    hooks = combine_hooks(hooks, CallbackHooks(*cli_callbacks) if cli_callbacks else None)
+    deduper = make_deduper(blank, dedupe)
+    if image_format is not None:
+        image_format = parse_output_format(image_format)
+    if preset is not None and preset not in ENCODER_PRESETS:
+        raise ValueError(f"Unknown encoder preset '{preset}'")
+    if all_frames and sink is not None:
+        raise ValueError(ERROR_FRAMES_WITH_SINK)
+    timed = hooks is not None and hooks.stages
+    started = time.perf_counter() if hooks is not None else None
+    image_stages = {}
+    bytes_out = 0
+
+    img = None
+    if isinstance(image_path, Image.Image):
+        img = image_path
+        image_path = img.filename
+
+    result = {'image': image_path, 'tiles': [], 'errors': []}
+
+    def report_error(message):
+        result['errors'].append(message)
+        if not quiet:
+            print(message)
 
     # Ensure save_dir is set and exists
-    save_dir = create_save_directory_if_needed(save_dir or os.path.dirname(image_path))
+    naming_index = None
+    if sink is not None:
+        save_dir = save_dir or ''
+    else:
+        save_dir = create_save_directory_if_needed(save_dir or os.path.dirname(image_path))
+        naming_index = naming if isinstance(naming, NamingIndex) else NamingIndex(save_dir, naming)
 
-    try:
-        img = Image.open(image_path)
-    except (UnidentifiedImageError, FileNotFoundError):
-        print(ERROR_CANNOT_IDENTIFY_IMAGE.format(image_path=image_path))
-        return
+    if hooks is not None:
+        hooks.on_image_start({'image': image_path, 'save_dir': save_dir})
+
+    def finish_image(total_splits=None):
+        if hasattr(sink, 'end_image'):
+            # Lets a write-behind sink flush this image's tiles
+            sink.end_image()
+        if hooks is not None:
+            event = {
+                'image': image_path,
+                'save_dir': save_dir,
+                'total': total_splits,
+                'tiles': len(result['tiles']),
+                'errors': list(result['errors']),
+                'seconds': time.perf_counter() - started,
+            }
+            if timed:
+                event['stages'] = image_stages
+                event['bytes_in'] = os.path.getsize(image_path) if image_path and os.path.isfile(image_path) else 0
+                event['bytes_out'] = bytes_out
+            hooks.on_image_end(event)
+        return result
+
+    if img is None:
+        stage_started = time.perf_counter() if timed else None
+        try:
+            img = Image.open(image_path)
+        except (UnidentifiedImageError, FileNotFoundError):
+            report_error(ERROR_CANNOT_IDENTIFY_IMAGE.format(image_path=image_path))
+            return finish_image()
+        if timed:
+            _add_stage(image_stages, 'open', stage_started)
 
     # Check if image format is supported
     img_format = img.format.upper()
     if img_format not in SUPPORTED_FORMATS:
-        print(ERROR_UNSUPPORTED_IMAGE_TYPE.format(image_type=img_format))
-        return
+        report_error(ERROR_UNSUPPORTED_IMAGE_TYPE.format(image_type=img_format))
+        return finish_image()
 
     width, height = img.size
     filename, ext = os.path.splitext(os.path.basename(image_path))
-    original_info = prepare_metadata(img, copy_metadata, add_metadata, VERSION)
+    # Tiles are saved in the source's format unless another one is asked for
+    tile_format = img_format
+    if image_format is not None and image_format != FORMAT_ALIASES.get(img_format, img_format):
+        tile_format = image_format
+        ext = TILE_EXTENSIONS[tile_format]
+    split_all_frames = all_frames and frame_count(img) > 1
+    if split_all_frames and tile_format not in MULTI_FRAME_FORMATS:
+        report_error(ERROR_FRAMES_FORMAT.format(image=image_path, image_format=tile_format))
+        return finish_image()
+    stage_started = time.perf_counter() if timed else None
+    original_info = prepare_metadata(img, copy_metadata, add_metadata, VERSION, tile_format)
+    if timed:
+        _add_stage(image_stages, 'metadata', stage_started)
+
+    # Cells are computed on demand from the grid's column and row edges
+    geometry = GridGeometry.from_grid((width, height), grid_size, aspect_ratio)
 
-    # Use utility function to calculate cell positions
-    cells = calculate_cell_positions((width, height), grid_size, aspect_ratio)
+    tile_factor = tile_scale_factor(geometry, max_tile_size) if max_tile_size is not None else 1.0
 
-    total_splits = len(cells)
+    save_params = get_encoder_params(tile_format, preset)
+    lossless = lossless_jpeg and img_format in ('JPEG', 'JPG') and tile_format in ('JPEG', 'JPG')
+    if lossless:
+        # The source's own tables replace the preset's quality
+        save_params.pop('quality', None)
+        save_params.update(get_jpeg_encoder_params(img))
+    if lossless and tile_factor == 1:
+        # Reduced tiles are resampled, so only full-size cells gain from the MCU grid
+        block_size = get_jpeg_block_size(img)
+        aligned_geometry = geometry.aligned_to_blocks(block_size)
+        if aligned_geometry is None:
+            if not quiet:
+                print(WARNING_CANNOT_ALIGN_JPEG.format(image=image_path, block_width=block_size[0], block_height=block_size[1]))
+        else:
+            geometry = aligned_geometry
+
+    # Serialize the metadata once for all tiles of this image
+    stage_started = time.perf_counter() if timed else None
+    save_profile = build_save_profile(original_info, tile_format, save_params)
+    if timed:
+        _add_stage(image_stages, 'metadata', stage_started)
+
+    total_splits = len(geometry)
     split_count = 0
+    dispatched_count = 0
+
+    def finish_tile(cropped_filename, outcome):
+        nonlocal split_count, bytes_out
+
+        saved_filepath, tile_stats = outcome
+        if isinstance(saved_filepath, TileRef):
+            if saved_filepath.original is None:
+                result.setdefault('blank_tiles', []).append(str(saved_filepath))
+            else:
+                result.setdefault('duplicates', {})[str(saved_filepath)] = saved_filepath.original
+        elif saved_filepath:
+            result['tiles'].append(saved_filepath)
+        else:
+            report_error(ERROR_UNABLE_TO_SAVE_IMAGE.format(image_name=cropped_filename, image_format=tile_format))
+        split_count += 1
+
+        if hooks is not None:
+            event = {'image': image_path, 'tile': cropped_filename, 'index': split_count, 'total': total_splits, 'path': saved_filepath}
+            if isinstance(saved_filepath, TileRef):
+                event['path'] = None
+                event['skipped'] = 'blank' if saved_filepath.original is None else 'duplicate'
+            event.update(tile_stats)
+            bytes_out += tile_stats.get('bytes', 0)
+            hooks.on_tile_end(event)
+
+    def tile_tasks(positions, offset=0):
+        nonlocal dispatched_count
 
-    for idx, cell in enumerate(cells):
-        col = cell['col']
-        row = cell['row']
-        left = cell['left']
-        upper = cell['upper']
-        right = cell['right']
-        lower = cell['lower']
+        for col, row in positions:
+            # Generate the filename for this specific grid split
+            col_letter = col_to_letter(col)
+            row_number = row + 1
+            cropped_filename = f"{filename}_{col_letter}{row_number}{ext}"
+            left, upper, right, lower = geometry.box(col, row)
+            dispatched_count += 1
+            if hooks is not None:
+                hooks.on_tile_start({'image': image_path, 'tile': cropped_filename, 'index': dispatched_count, 'total': total_splits})
+            yield cropped_filename, (left, upper - offset, right, lower - offset)
 
-        # Generate the filename for this specific grid split
-        col_letter = col_to_letter(col)
-        row_number = row + 1
-        cropped_filename = f"{filename}_{col_letter}{row_number}{ext}"
+    if threads == 0:
+        threads = os.cpu_count() or 1
 
+    # Decode JPEGs straight at a reduced scale when the tiles are reduced anyway
+    source_scale = draft_scaled(img, tile_factor)
+
+    def scaled(source):
+        if tile_factor == 1:
+            return source
+        # Row bands of uncompressed files keep their full size
+        return ScaledImage(source, tile_factor, source_scale if source is img else (1.0, 1.0))
+
+    def save_tile(source, cropped_filename, box):
         # Crop and save the image
-        success = crop_and_save_image(img, left, upper, right, lower, cropped_filename, ext, save_dir, original_info, img_format)
+        left, upper, right, lower = box
+        if hooks is None:
+            return crop_and_save_image(source, left, upper, right, lower, cropped_filename, ext, save_dir, original_info, tile_format, save_profile, sink, naming_index, None, deduper), None
 
-        if not success:
-            print(ERROR_UNABLE_TO_SAVE_IMAGE.format(image_name=cropped_filename, image_format=img_format))
-        split_count += 1
+        tile_started = time.perf_counter()
+        tile_stats = {'stages': {}} if timed else {}
+        saved_filepath = crop_and_save_image(source, left, upper, right, lower, cropped_filename, ext, save_dir, original_info, tile_format, save_profile, sink, naming_index, tile_stats if timed else None, deduper)
+        tile_stats['seconds'] = time.perf_counter() - tile_started
+        return saved_filepath, tile_stats
+
+    def split_cells(source, tasks):
+        if threads > 1 and total_splits > 1:
+            _split_threaded(source, tasks, save_tile, threads, finish_tile)
+        else:
+            for cropped_filename, box in tasks:
+                finish_tile(cropped_filename, save_tile(source, cropped_filename, box))
+
+    if split_all_frames:
+        # Each cell becomes one multi-frame tile, written frame by frame
+        tasks = list(tile_tasks(geometry.iter_positions()))
+        saved = split_frames(img, scaled(img), tasks, tile_format, save_profile, naming_index)
+        for (cropped_filename, _), (saved_filepath, seconds) in zip(tasks, saved):
+            tile_stats = {'seconds': seconds}
+            if timed and saved_filepath:
+                tile_stats['bytes'] = os.path.getsize(saved_filepath)
+            finish_tile(cropped_filename, (saved_filepath, tile_stats))
+        return finish_image(total_splits)
+
+    if stream:
+        bands = iter_row_bands(img, geometry)
+        if timed:
+            bands = _timed_iter(bands, image_stages, 'decode')
+        for band_upper, band, row in bands:
+            split_cells(scaled(band), tile_tasks(((col, row) for col in range(geometry.cols)), band_upper))
+    else:
+        # Uncompressed sources are cropped straight from a memory map of the file
+        mapped = open_mapped_image(img)
+        if mapped is not None:
+            try:
+                split_cells(scaled(mapped), tile_tasks(geometry.iter_positions()))
+            finally:
+                mapped.close()
+            return finish_image(total_splits)
+
+        if timed:
+            # Decode up front so it is not counted as part of the first crop
+            stage_started = time.perf_counter()
+            try:
+                img.load()
+            except Exception:
+                # Reported for every tile that cannot be cropped
+                pass
+            _add_stage(image_stages, 'decode', stage_started)
+        split_cells(scaled(img), tile_tasks(geometry.iter_positions()))
+
+    return finish_image(total_splits)
+
+def _add_stage(stages, stage, started):
+    stages[stage] = stages.get(stage, 0) + time.perf_counter() - started
+
+def _timed_iter(iterable, stages, stage):
+    """
+    Yield from iterable, adding the time spent producing each item to stages[stage].
+    """
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        _add_stage(stages, stage, started)
+        yield item
+
+def iter_tiles(source, grid_size=(3, 3), aspect_ratio=None, image_format=None, copy_metadata=True, add_metadata=True, save_params=None, order='col', preset=None):
+    """
+    Split an image in memory, lazily yielding (col, row, box, tile) for every cell,
+    column by column (order='col', like calculate_cell_positions()) or row by row
+    (order='row'). Nothing is written to disk.
+    source may be a path, bytes, a binary file object or a PIL image; an image opened
+    here is closed once the tiles are exhausted or the iterator is closed.
+    tile is a PIL image, or the encoded bytes when image_format (e.g. 'PNG') is given.
+    Encoded tiles carry the source metadata like the files splyt() writes, and are
+    encoded into one reused buffer; save_params are extra encoder options, on top of
+    those of preset (see ENCODER_PRESETS).
+    """
+    # Checked up front, so bad arguments fail on the call rather than the first tile
+    if image_format:
+        image_format = parse_output_format(image_format)
+    if preset is not None and preset not in ENCODER_PRESETS:
+        raise ValueError(f"Unknown encoder preset '{preset}'")
+    return _iter_tiles(source, grid_size, aspect_ratio, image_format, copy_metadata, add_metadata, save_params, order, preset)
+
+def _iter_tiles(source, grid_size, aspect_ratio, image_format, copy_metadata, add_metadata, save_params, order, preset):
+    if isinstance(source, Image.Image):
+        img = source
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        img = Image.open(io.BytesIO(source))
+    else:
+        img = Image.open(source)
 
-        if print_progress:
-            print_progress(split_count, total_splits, cropped_filename)
+    try:
+        save_profile = None
+        if image_format:
+            # Images created in memory have no source format and no metadata to carry over
+            original_info = prepare_metadata(img, copy_metadata, add_metadata, VERSION, image_format) if img.format else {}
+            save_profile = build_save_profile(original_info, image_format, dict(get_encoder_params(image_format, preset), **(save_params or {})))
+            save_profile['format'] = image_format
+            buffer = io.BytesIO()
 
-    if print_completion_message:
-        print_completion_message(f"{filename}{ext}", total_splits, save_dir)
+        for col, row, box in GridGeometry.from_grid(img.size, grid_size, aspect_ratio).iter_boxes(order):
+            tile = img.crop(box)
+            if save_profile is not None:
+                buffer.seek(0)
+                buffer.truncate()
+                save_image_with_profile(convert_for_format(tile, image_format), buffer, save_profile)
+                tile = buffer.getvalue()
+            yield col, row, box, tile
+    finally:
+        if img is not source:
+            img.close()
 
-def crop_and_save_image(img, left, upper, right, lower, base_filename, ext, save_dir, original_info, img_format):
+def _split_threaded(img, tasks, save_tile, threads, finish_tile):
+    """
+    Crop, encode and write tiles on a thread pool. Pillow releases the GIL while it
+    encodes, so the tiles are compressed in parallel. At most TILES_IN_FLIGHT_PER_THREAD
+    tiles per thread are pending at once, and results are reported in grid order.
+    """
+    # Decode once up front so the worker threads only ever read the pixel data
+    img.load()
+
+    max_pending = threads * TILES_IN_FLIGHT_PER_THREAD
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        try:
+            for cropped_filename, box in tasks:
+                if len(pending) >= max_pending:
+                    finished_filename, future = pending.popleft()
+                    finish_tile(finished_filename, future.result())
+
+                future = executor.submit(save_tile, img, cropped_filename, box)
+                pending.append((cropped_filename, future))
+        finally:
+            # Tiles already handed to the pool are reported even if the tasks stop early
+            while pending:
+                finished_filename, future = pending.popleft()
+                finish_tile(finished_filename, future.result())
+
+def crop_and_save_image(img, left, upper, right, lower, base_filename, ext, save_dir, original_info, img_format, save_profile=None, sink=None, naming_index=None, tile_stats=None, deduper=None):
     """
     Crop the image and save it with metadata.
+    save_profile is the source's metadata serialized once by build_save_profile();
+    without it original_info is serialized for this tile alone.
+    With a sink the tile is handed to it under save_dir/base_filename.
+    With a naming_index (for save_dir) the file is created through it.
+    With a tile_stats dict, the crop, encode and write stages are timed into
+    tile_stats['stages'] and the encoded size is stored in tile_stats['bytes'].
+    With a deduper (see dedupe.py) blank and repeated tiles are skipped or linked
+    before they are encoded; tiles that are not written are returned as a TileRef.
+    Returns the path (or sink entry name) the tile was saved to, or None if saving failed.
     """
-    cropped_img = img.crop((left, upper, right, lower))
-    cropped_filepath = os.path.join(save_dir, base_filename)
-
-    # Ensure unique filename to avoid overwriting
-    if os.path.exists(cropped_filepath):
-        base_name, extension = os.path.splitext(base_filename)
-        counter = 1
-        while True:
-            new_filename = f"{base_name}({counter}){extension}"
-            new_filepath = os.path.join(save_dir, new_filename)
-            if not os.path.exists(new_filepath):
-                cropped_filepath = new_filepath
-                break
-            counter += 1
+    if tile_stats is not None:
+        return _crop_and_save_timed(img, (left, upper, right, lower), base_filename, save_dir, original_info, img_format, save_profile, sink, naming_index, tile_stats, deduper)
+
+    cropped_img = convert_for_format(img.crop((left, upper, right, lower)), img_format)
+    if save_profile is None:
+        save_profile = build_save_profile(original_info, img_format)
+    dedupe_key = None
+    if deduper is not None:
+        referenced, dedupe_key = _dedupe_tile(deduper, cropped_img, img_format, save_profile, base_filename, save_dir, sink, naming_index)
+        if referenced is not None:
+            return referenced
+
+    saved = None
+    if sink is not None:
+        try:
+            saved = sink.save_image(cropped_img, os.path.join(save_dir, base_filename), save_profile)
+        except Exception:
+            pass
     else:
-        cropped_filepath = os.path.join(save_dir, base_filename)
+        try:
+            if naming_index is not None:
+                saved = naming_index.create(base_filename, lambda path: save_image_with_profile(cropped_img, path, save_profile))
+            else:
+                # Ensure unique filename to avoid overwriting
+                saved = get_unique_filepath(save_dir, base_filename)
+                save_image_with_profile(cropped_img, saved, save_profile)
+        except Exception:
+            # You can log the exception if needed
+            saved = None
+    if deduper is not None:
+        deduper.remember(dedupe_key, saved)
+    return saved
+
+def _dedupe_tile(deduper, cropped_img, img_format, save_profile, base_filename, save_dir, sink, naming_index):
+    """
+    Check a cropped tile with deduper. Returns (referenced, key): referenced is the
+    result for a tile that does not need to be encoded, or None if it has to be
+    saved and then remembered under key.
+    Archives cannot hold links, so with a sink only blank tiles are skipped.
+    """
+    original, key = deduper.check(cropped_img, img_format, save_profile)
+    if original == 'skip':
+        return TileRef(os.path.join(save_dir, base_filename)), None
+    if sink is not None:
+        return None, None
+    if original is None:
+        return None, key
 
     try:
-        save_image_with_metadata(cropped_img, cropped_filepath, original_info, img_format)
-        return True
+        if deduper.reference_mode == 'manifest':
+            path = os.path.join(save_dir, base_filename)
+            deduper.record(save_dir, path, original)
+            return TileRef(path, original), None
+        if naming_index is not None:
+            return naming_index.create(base_filename, lambda path: deduper.link(original, path)), None
+        path = get_unique_filepath(save_dir, base_filename)
+        deduper.link(original, path)
+        return path, None
+    except Exception:
+        # Fall back to writing the tile itself
+        return None, None
+
+def _crop_and_save_timed(img, box, base_filename, save_dir, original_info, img_format, save_profile, sink, naming_index, tile_stats, deduper=None):
+    """
+    crop_and_save_image() with every stage timed: the tile is encoded into memory
+    first, so encoding and writing can be told apart.
+    """
+    stages = tile_stats['stages']
+    try:
+        started = time.perf_counter()
+        cropped_img = convert_for_format(img.crop(box), img_format)
+        if save_profile is None:
+            save_profile = build_save_profile(original_info, img_format)
+        dedupe_key = None
+        if deduper is not None:
+            referenced, dedupe_key = _dedupe_tile(deduper, cropped_img, img_format, save_profile, base_filename, save_dir, sink, naming_index)
+            if referenced is not None:
+                _add_stage(stages, 'crop', started)
+                return referenced
+        _add_stage(stages, 'crop', started)
+
+        started = time.perf_counter()
+        data = encode_image_with_profile(cropped_img, dict(save_profile, format=img_format))
+        _add_stage(stages, 'encode', started)
+        tile_stats['bytes'] = len(data)
+
+        started = time.perf_counter()
+        if sink is not None:
+            saved = sink.write(os.path.join(save_dir, base_filename), data)
+        else:
+            def write_data(path):
+                with open(path, 'wb') as f:
+                    f.write(data)
+
+            if naming_index is not None:
+                saved = naming_index.create(base_filename, write_data)
+            else:
+                saved = get_unique_filepath(save_dir, base_filename)
+                write_data(saved)
+        _add_stage(stages, 'write', started)
+        if deduper is not None:
+            deduper.remember(dedupe_key, saved)
+        return saved
     except Exception:
-        # You can log the exception if needed
-        return False
+        return None
 
-def process_directory(directory_path, save_dir, grid_size, aspect_ratio=None, copy_metadata=True, add_metadata=True, cli_callbacks=None):
+def process_directory(directory_path, save_dir, grid_size, aspect_ratio=None, copy_metadata=True, add_metadata=True, cli_callbacks=None, jobs=1, deterministic=False, threads=1, recursive=False, stream=False, lossless_jpeg=False, resume=False, sink=None, naming='suffix', hooks=None, blank='keep', dedupe=None, shard=None, max_tile_size=None, image_format=None, preset=None, all_frames=False):
     """
     Process all valid images in a directory.
+    With jobs > 1 the images are split across a pool of worker processes; jobs=0 uses
+    one worker per CPU. threads, stream, lossless_jpeg, naming, max_tile_size,
+    image_format, preset and all_frames are passed on to splyt() for each image.
+    With recursive=True images in subdirectories are processed too, and their tiles are
+    saved in the matching subdirectory of save_dir.
+    With resume=True a manifest in save_dir records every finished source, and sources
+    a previous run already completed with the same parameters are skipped; redone
+    sources always overwrite their own tiles. Sources whose tiles would get the names
+    of another source's (see TileNameClaims) are reported as errors instead.
+    With a sink (see sinks.py) tiles are handed to it instead of being written to
+    save_dir, which then is an optional name prefix inside the sink.
+    hooks (see events.py) receive the events of every image; skipped images have none.
+    blank and dedupe are passed on to splyt(); repeated tiles are found across all
+    images, or across the images of each worker with jobs > 1.
+    With shard=(index, count) only the images whose relative path hashes to shard
+    index of count are processed (see shard_of()), so count independent runs over the
+    same directory split every image exactly once. Each shard keeps its own manifest
+    (SHARD_MANIFEST_FILENAME), which records the finished sources also without resume.
+    Returns the list of per-image results in directory order.
     """
-    save_dir = create_save_directory_if_needed(save_dir)
+    hooks = combine_hooks(hooks, CallbackHooks(*cli_callbacks) if cli_callbacks else None)
+
+    if sink is not None and resume:
+        raise ValueError(ERROR_RESUME_WITH_SINK)
+    if sink is not None and all_frames:
+        raise ValueError(ERROR_FRAMES_WITH_SINK)
+    save_dir, image_jobs = _scan_image_jobs(directory_path, save_dir, recursive, sink, shard)
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    # Keyword arguments passed on to splyt() for every image
+    split_options = {
+        'grid_size': grid_size,
+        'aspect_ratio': aspect_ratio,
+        'copy_metadata': copy_metadata,
+        'add_metadata': add_metadata,
+        'threads': threads,
+        'stream': stream,
+        'lossless_jpeg': lossless_jpeg,
+        'sink': sink,
+        'naming': 'overwrite' if resume else naming,
+        'hooks': hooks,
+        'blank': blank,
+        'dedupe': dedupe,
+        'max_tile_size': max_tile_size,
+        'image_format': image_format,
+        'preset': preset,
+        'all_frames': all_frames,
+    }
+
+    manifest = None
+    if resume or (shard is not None and sink is None):
+        manifest_filename = SHARD_MANIFEST_FILENAME.format(index=shard[0], count=shard[1]) if shard is not None else MANIFEST_FILENAME
+        manifest = JobManifest(directory_path, save_dir, _manifest_params(split_options), manifest_filename, skip_completed=resume)
+
+    # Resumed runs overwrite tiles, so two sources must never share tile names
+    claims = TileNameClaims(image_format) if resume and image_format else None
 
-    image_files = [f for f in os.listdir(directory_path) if is_image_file(os.path.join(directory_path, f))]
-    total_images = len(image_files)
+    if jobs > 1:
+        return _process_parallel(image_jobs, split_options, jobs, deterministic, manifest, claims)
 
-    for idx, image_file in enumerate(image_files):
-        image_path = os.path.join(directory_path, image_file)
-        splyt(image_path, save_dir, grid_size, aspect_ratio, copy_metadata, add_metadata, cli_callbacks)
+    # One deduper for the whole run, so repeats are found across images
+    split_options['blank'] = make_deduper(blank, dedupe) or blank
+
+    # One naming index per output directory, so it is listed only once
+    naming_indexes = {}
+
+    results = []
+    for image_path, source_format, image_save_dir in image_jobs:
+        image_save_dir = os.path.normpath(image_save_dir)
+        collision = claims.claim(image_path, source_format, image_save_dir) if claims else None
+        if collision:
+            print(collision)
+            results.append({'image': image_path, 'tiles': [], 'errors': [collision]})
+            continue
+        if manifest:
+            completed_tiles = manifest.completed_tiles(image_path)
+            if completed_tiles is not None:
+                results.append({'image': image_path, 'tiles': completed_tiles, 'errors': [], 'skipped': True})
+                continue
+            manifest.start(image_path, image_save_dir)
+
+        image_options = split_options
+        if sink is None:
+            if image_save_dir not in naming_indexes:
+                naming_indexes[image_save_dir] = NamingIndex(create_save_directory_if_needed(image_save_dir), split_options['naming'])
+            image_options = dict(split_options, naming=naming_indexes[image_save_dir])
+
+        result = _split_scanned_image(image_path, source_format, image_save_dir, **image_options)
+
+        if manifest:
+            manifest.finish(result)
+        results.append(result)
+    return results
+
+def _manifest_params(split_options):
+    """
+    The splyt() options recorded in a manifest: only the options that change the
+    written tiles decide whether a source is done.
+    """
+    manifest_params = {key: split_options[key] for key in ('grid_size', 'aspect_ratio', 'copy_metadata', 'add_metadata', 'lossless_jpeg')}
+    for key in ('max_tile_size', 'image_format', 'preset', 'all_frames'):
+        # Left out when not set, so manifests of earlier runs stay valid
+        if split_options.get(key):
+            manifest_params[key] = split_options[key]
+    return manifest_params
+
+class TileNameClaims:
+    """
+    Track which source owns the tile names in each save directory. Transcoded tiles
+    of sources that share a stem get the same names (img.png and img.jpg both give
+    img_a1.webp), which the 'overwrite' naming of resumed runs would silently mix up.
+    """
+
+    def __init__(self, image_format):
+        self.image_format = parse_output_format(image_format)
+        self.owners = {}
+
+    def claim(self, image_path, source_format, save_dir):
+        """
+        Claim the tile names of image_path in save_dir. Returns an error message if
+        another source that still exists owns them, otherwise None.
+        """
+        stem, ext = os.path.splitext(os.path.basename(image_path))
+        if self.image_format != FORMAT_ALIASES.get(source_format, source_format):
+            ext = TILE_EXTENSIONS[self.image_format]
+        key = os.path.normcase(os.path.join(os.path.normpath(save_dir), stem + ext))
+        owner = self.owners.get(key)
+        if owner is not None and owner != image_path and os.path.exists(owner):
+            return ERROR_TILE_NAME_COLLISION.format(image=image_path, other=owner)
+        self.owners[key] = image_path
+        return None
+
+def _scan_image_jobs(directory_path, save_dir, recursive=False, sink=None, shard=None):
+    """
+    Prepare save_dir and lazily list (image_path, source_format, image_save_dir) for
+    every image in a directory, or only those of shard (index, count).
+    Returns the save_dir and the job iterator.
+    """
+    if sink is not None:
+        save_dir = save_dir or ''
+        # A directory sink may live inside the directory being processed
+        sink_root = getattr(sink, 'root', None)
+        scanned_images = scan_image_files(directory_path, recursive=recursive, exclude=(sink_root,) if sink_root else ())
+    else:
+        save_dir = create_save_directory_if_needed(save_dir)
+        # The save directory often lives inside the directory being processed
+        scanned_images = scan_image_files(directory_path, recursive=recursive, exclude=(save_dir,))
+
+    if shard is not None:
+        shard_index, shard_count = shard
+        scanned_images = (
+            (image_path, source_format) for image_path, source_format in scanned_images
+            if shard_of(os.path.relpath(image_path, directory_path), shard_count) == shard_index
+        )
+
+    image_jobs = (
+        (image_path, source_format, os.path.join(save_dir, os.path.relpath(os.path.dirname(image_path), directory_path)))
+        for image_path, source_format in scanned_images
+    )
+    return save_dir, image_jobs
+
+def _open_scanned_image(image_path, source_format):
+    """
+    Open a file found by scan_image_files() with only the plugin for its sniffed format.
+    Falls back to the path, so splyt() can report files that fail to open.
+    """
+    try:
+        return Image.open(image_path, formats=[source_format])
+    except (UnidentifiedImageError, OSError):
+        return image_path
+
+def _split_scanned_image(image_path, source_format, save_dir, **split_options):
+    """
+    Split a file found by scan_image_files() and close it again.
+    """
+    source = _open_scanned_image(image_path, source_format)
+    try:
+        return splyt(source, save_dir, **split_options)
+    finally:
+        if isinstance(source, Image.Image):
+            source.close()
+
+def _split_worker(image_path, source_format, save_dir, split_options, shared_save_dir=True):
+    """
+    Split one image inside a worker process, isolating any failure to that image.
+    Workers keep one naming index per shared save directory for the whole run.
+    """
+    try:
+        if split_options['sink'] is None and shared_save_dir:
+            naming_index = get_naming_index(create_save_directory_if_needed(save_dir), split_options['naming'])
+            split_options = dict(split_options, naming=naming_index)
+        if split_options.get('dedupe') or split_options.get('blank', 'keep') != 'keep':
+            split_options = dict(split_options, blank=get_deduper(split_options.get('blank', 'keep'), split_options.get('dedupe')))
+        result = _split_scanned_image(image_path, source_format, save_dir, quiet=True, **split_options)
+        if isinstance(split_options['sink'], MemorySink):
+            result['entries'] = split_options['sink'].entries
+        if isinstance(split_options['hooks'], EventRecorder):
+            result['events'] = split_options['hooks'].events
+        return result
+    except Exception as exc:
+        return {'image': image_path, 'tiles': [], 'errors': [ERROR_PROCESSING_IMAGE.format(image=image_path, error=exc)]}
+
+def _process_parallel(image_jobs, split_options, jobs, deterministic, manifest=None, claims=None):
+    """
+    Split images across a process pool, reporting results in submission order.
+    At most IMAGES_IN_FLIGHT_PER_JOB images per worker are queued at once, so the
+    directory scan stays lazy.
+    In deterministic mode every worker writes into its own staging directory and the
+    tiles are moved into place in directory order, so collision suffixes never
+    depend on which worker finishes first.
+    Hooks cannot cross processes: workers record their events, which are replayed to
+    hooks here once the image is finished.
+    """
+    max_pending = jobs * IMAGES_IN_FLIGHT_PER_JOB
+
+    # Workers cannot share the caller's sink; they encode into memory and the
+    # tiles are handed to the real sink here, in directory order
+    sink = split_options['sink']
+    if sink is not None:
+        split_options = dict(split_options, sink=MemorySink())
+        deterministic = False
+    if split_options.get('blank', 'keep') != 'keep' or split_options.get('dedupe'):
+        # Linked and referenced tiles point at paths, which must not move afterwards
+        deterministic = False
+
+    hooks = split_options['hooks']
+    if hooks is not None:
+        split_options = dict(split_options, hooks=EventRecorder(hooks.stages))
+
+    # Tiles moved out of staging directories are named by the parent
+    naming_indexes = {}
+    pending = deque()
+    results = []
+
+    def finish_image(idx, image_path, image_save_dir, future):
+        try:
+            result = future.result()
+        except Exception as exc:
+            # The worker process itself died (e.g. killed by the OS)
+            result = {'image': image_path, 'tiles': [], 'errors': [ERROR_PROCESSING_IMAGE.format(image=image_path, error=exc)]}
+
+        if result.get('skipped'):
+            results.append(result)
+            return
+
+        worker_tiles = result['tiles']
+        if sink is not None:
+            result['tiles'] = [sink.write(name, data) for name, data in result.pop('entries', [])]
+            if hasattr(sink, 'end_image'):
+                sink.end_image()
+
+        if deterministic:
+            if image_save_dir not in naming_indexes:
+                naming_indexes[image_save_dir] = NamingIndex(image_save_dir, split_options['naming'])
+            result['tiles'] = [_move_staged_tile(tile, naming_indexes[image_save_dir]) for tile in result['tiles']]
+            _remove_staging_directory(os.path.join(image_save_dir, STAGING_DIR_NAME.format(index=idx)))
+
+        if manifest:
+            manifest.finish(result)
+
+        for message in result['errors']:
+            print(message)
+
+        events = result.pop('events', None)
+        if hooks is not None:
+            if events is None:
+                # The image failed before its worker could record anything
+                events = [
+                    ('on_image_start', {'image': image_path, 'save_dir': image_save_dir}),
+                    ('on_image_end', {'image': image_path, 'save_dir': image_save_dir, 'total': None, 'tiles': 0, 'errors': result['errors'], 'seconds': 0}),
+                ]
+            # Tiles were renamed by the sink or moved out of staging since they were recorded
+            final_paths = dict(zip(worker_tiles, result['tiles']))
+            for method, event in events:
+                if event.get('path') is not None:
+                    event['path'] = final_paths.get(event['path'], event['path'])
+                if 'save_dir' in event:
+                    event['save_dir'] = image_save_dir
+            replay_events(events, hooks)
+
+        results.append(result)
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for idx, (image_path, source_format, image_save_dir) in enumerate(image_jobs):
+            if len(pending) >= max_pending:
+                finish_image(*pending.popleft())
+
+            image_save_dir = os.path.normpath(image_save_dir)
+            collision = claims.claim(image_path, source_format, image_save_dir) if claims else None
+            if collision:
+                future = Future()
+                future.set_result({'image': image_path, 'tiles': [], 'errors': [collision]})
+                pending.append((idx, image_path, image_save_dir, future))
+                continue
+            if manifest:
+                completed_tiles = manifest.completed_tiles(image_path)
+                if completed_tiles is not None:
+                    # Keep skipped images in line so results stay in directory order
+                    future = Future()
+                    future.set_result({'image': image_path, 'tiles': completed_tiles, 'errors': [], 'skipped': True})
+                    pending.append((idx, image_path, image_save_dir, future))
+                    continue
+                manifest.start(image_path, image_save_dir)
+
+            worker_dir = os.path.join(image_save_dir, STAGING_DIR_NAME.format(index=idx)) if deterministic else image_save_dir
+            future = executor.submit(_split_worker, image_path, source_format, worker_dir, split_options, not deterministic)
+            pending.append((idx, image_path, image_save_dir, future))
+
+        while pending:
+            finish_image(*pending.popleft())
+
+    return results
+
+def _move_staged_tile(staged_filepath, naming_index):
+    """
+    Move a tile out of a worker's staging directory into the naming index's directory.
+    """
+    return naming_index.create(os.path.basename(staged_filepath), lambda path: os.replace(staged_filepath, path))
+
+def _remove_staging_directory(staging_dir):
+    """
+    Remove a worker's staging directory once its tiles have been moved out.
+    """
+    try:
+        os.rmdir(staging_dir)
+    except OSError:
+        pass
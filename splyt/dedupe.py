@@ -0,0 +1,153 @@
+# dedupe.py
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from .config import BLANK_POLICIES, DEDUPE_MODES, DUPLICATES_FILENAME
+
+class TileRef(str):
+    """
+    Path of a tile that was not written: a skipped blank tile (original is None), or a
+    duplicate whose content is the identical tile at original.
+    """
+
+    def __new__(cls, path, original=None):
+        ref = super().__new__(cls, path)
+        ref.original = original
+        return ref
+
+def profile_fingerprint(image_format, profile):
+    """
+    Digest of an output format and a save profile from build_save_profile(), so tiles
+    are only shared between images whose files would carry the same metadata.
+    """
+    digest = hashlib.blake2b(image_format.encode(), digest_size=16)
+    for key in sorted(profile):
+        value = profile[key]
+        if hasattr(value, 'chunks'):
+            # PngInfo text chunks
+            value = b''.join(b''.join(chunk[:2]) for chunk in value.chunks)
+        digest.update(key.encode())
+        digest.update(value if isinstance(value, bytes) else repr(value).encode())
+    return digest.digest()
+
+def _band_extrema(tile):
+    extrema = tile.getextrema()
+    # Single-band images return one (min, max) pair instead of one per band
+    return extrema if isinstance(extrema[0], tuple) else (extrema,)
+
+class TileDeduper:
+    """
+    Find blank and repeated tiles before they are encoded.
+
+    A tile is blank when every band holds a single value or its alpha band is fully
+    transparent, which getextrema() tells without copying any pixels. Blank policies:
+    - 'keep': write blank tiles like any other (the default)
+    - 'skip': do not write them at all
+    - 'placeholder': write each distinct blank tile once and reference it for the rest
+
+    With dedupe, every tile is keyed by a hash of its pixels and repeats reference the
+    first copy: 'link' makes them hard links to it, 'manifest' does not write them and
+    records them in DUPLICATES_FILENAME in their save directory instead.
+    Placeholders are referenced the same way, by hard link unless dedupe='manifest'.
+    One deduper can be shared between images, so repeats are found across them; only
+    tiles with the same format and metadata are ever shared.
+    """
+
+    def __init__(self, blank='keep', dedupe=None):
+        if blank not in BLANK_POLICIES:
+            raise ValueError(f"Unknown blank tile policy '{blank}'")
+        if dedupe is not None and dedupe not in DEDUPE_MODES:
+            raise ValueError(f"Unknown dedupe mode '{dedupe}'")
+        self.blank = blank
+        self.dedupe = dedupe
+        self.reference_mode = dedupe or 'link'
+        self.originals = {}
+        self.lock = threading.Lock()
+        # Fingerprint of the last save profile seen; tiles of one image share it
+        self.profile = self.fingerprint = None
+
+    def check(self, tile, image_format, profile):
+        """
+        Decide what to do with a cropped tile that would be saved as image_format with
+        profile. Returns (original, key): original is 'skip' for a blank tile that is not
+        written, the path of an identical tile already written, or None if the tile
+        must be written; the tile is then remembered under key (if not None) once
+        remember() is called.
+        """
+        extrema = _band_extrema(tile)
+        uniform = all(low == high for low, high in extrema)
+        bands = tile.getbands()
+        transparent = 'A' in bands and extrema[bands.index('A')][1] == 0
+        key = None
+        if uniform or transparent:
+            if self.blank == 'skip':
+                return 'skip', None
+            if self.blank == 'placeholder' or self.dedupe:
+                # All fully transparent tiles of a size look alike, whatever their colour
+                key = ('blank', tile.mode, tile.size, None if transparent else extrema)
+        elif self.dedupe:
+            key = ('pixels', tile.mode, tile.size, hashlib.blake2b(tile.tobytes(), digest_size=16).digest())
+
+        if key is None:
+            return None, None
+        if tile.mode in ('P', 'PA'):
+            key += (bytes(tile.getpalette() or ()),)
+        with self.lock:
+            if self.profile is not profile:
+                self.profile, self.fingerprint = profile, profile_fingerprint(image_format, profile)
+            key += (self.fingerprint,)
+            return self.originals.get(key), key
+
+    def remember(self, key, path):
+        if key is not None and path:
+            with self.lock:
+                self.originals.setdefault(key, path)
+
+    def link(self, original, path):
+        """
+        Create path as a hard link to original, or as a copy where linking fails
+        (e.g. across file systems).
+        """
+        try:
+            os.link(original, path)
+        except OSError:
+            shutil.copyfile(original, path)
+
+    def record(self, save_dir, path, original):
+        """
+        Append a duplicate to the duplicates file of save_dir.
+        """
+        line = json.dumps({'tile': path, 'original': original}) + '\n'
+        with self.lock:
+            with open(os.path.join(save_dir, DUPLICATES_FILENAME), 'a', encoding='utf-8') as f:
+                f.write(line)
+
+def make_deduper(blank='keep', dedupe=None):
+    """
+    Return a TileDeduper for the given policies, or None if nothing is to be done.
+    blank may also be a TileDeduper, which is returned as is.
+    """
+    if isinstance(blank, TileDeduper):
+        return blank
+    if blank == 'keep' and dedupe is None:
+        return None
+    return TileDeduper(blank, dedupe)
+
+# Dedupers of the current process, shared by the images a worker splits
+_process_dedupers = {}
+_process_dedupers_lock = threading.Lock()
+
+def get_deduper(blank='keep', dedupe=None):
+    """
+    Return this process's TileDeduper for the given policies, creating it on first use,
+    or None if nothing is to be done.
+    """
+    if isinstance(blank, TileDeduper) or (blank == 'keep' and dedupe is None):
+        return make_deduper(blank, dedupe)
+    with _process_dedupers_lock:
+        if (blank, dedupe) not in _process_dedupers:
+            _process_dedupers[blank, dedupe] = TileDeduper(blank, dedupe)
+        return _process_dedupers[blank, dedupe]
@@ -0,0 +1,220 @@
+# events.py
+
+import heapq
+import os
+import threading
+import time
+from .config import STATS_HISTOGRAM_BOUNDS_MS, STATS_SLOWEST_IMAGES
+
+class SplitHooks:
+    """
+    Receives events while images are split. Subclass it and override the methods you
+    need; every event is a dict.
+
+    - on_image_start: 'image', 'save_dir'
+    - on_tile_start: 'image', 'tile' (filename), 'index' (1-based), 'total'
+    - on_tile_end: as on_tile_start, plus 'path' (None if saving failed), 'seconds',
+      and with stages enabled 'stages' ({'crop', 'encode', 'write'} in seconds) and 'bytes'
+    - on_image_end: 'image', 'save_dir', 'total' (cells in the grid, None if the image
+      could not be split), 'tiles' (written), 'errors', 'seconds', and with stages
+      enabled 'stages' ({'open', 'decode', 'metadata'} in seconds), 'bytes_in' and
+      'bytes_out'
+
+    Timing each stage separately encodes tiles into memory before writing them, so it
+    is only done when a hook sets stages = True. Without hooks nothing is measured.
+    Tile events are delivered in grid order from the calling thread; with worker
+    processes they are replayed once the image is finished.
+    """
+
+    stages = False
+
+    def on_image_start(self, event):
+        pass
+
+    def on_tile_start(self, event):
+        pass
+
+    def on_tile_end(self, event):
+        pass
+
+    def on_image_end(self, event):
+        pass
+
+class HookGroup(SplitHooks):
+    """
+    Forward every event to several hooks.
+    """
+
+    def __init__(self, *hooks):
+        self.hooks = [hook for hook in hooks if hook is not None]
+        self.stages = any(hook.stages for hook in self.hooks)
+
+    def on_image_start(self, event):
+        for hook in self.hooks:
+            hook.on_image_start(event)
+
+    def on_tile_start(self, event):
+        for hook in self.hooks:
+            hook.on_tile_start(event)
+
+    def on_tile_end(self, event):
+        for hook in self.hooks:
+            hook.on_tile_end(event)
+
+    def on_image_end(self, event):
+        for hook in self.hooks:
+            hook.on_image_end(event)
+
+def combine_hooks(*hooks):
+    """
+    Return a single hook for the given hooks (None entries are ignored), or None.
+    """
+    hooks = [hook for hook in hooks if hook is not None]
+    if not hooks:
+        return None
+    return hooks[0] if len(hooks) == 1 else HookGroup(*hooks)
+
+class CallbackHooks(SplitHooks):
+    """
+    Adapt the older (print_progress, print_completion_message) cli_callbacks tuple.
+    """
+
+    def __init__(self, print_progress=None, print_completion_message=None):
+        self.print_progress = print_progress
+        self.print_completion_message = print_completion_message
+
+    def on_tile_end(self, event):
+        if self.print_progress:
+            self.print_progress(event['index'], event['total'], event['tile'])
+
+    def on_image_end(self, event):
+        # Images that could not be opened have no grid and no completion message
+        if self.print_completion_message and event['total'] is not None:
+            self.print_completion_message(os.path.basename(event['image'] or ''), event['total'], event['save_dir'])
+
+class EventRecorder(SplitHooks):
+    """
+    Record events so they can be replayed to other hooks, e.g. from a worker process
+    to the hooks of the parent.
+    """
+
+    def __init__(self, stages=False):
+        self.stages = stages
+        self.events = []
+
+    def on_image_start(self, event):
+        self.events.append(('on_image_start', event))
+
+    def on_tile_start(self, event):
+        self.events.append(('on_tile_start', event))
+
+    def on_tile_end(self, event):
+        self.events.append(('on_tile_end', event))
+
+    def on_image_end(self, event):
+        self.events.append(('on_image_end', event))
+
+def replay_events(events, hooks):
+    for method, event in events:
+        getattr(hooks, method)(event)
+
+class _Histogram:
+    """
+    Count, total, maximum and bucketed distribution of durations.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(STATS_HISTOGRAM_BOUNDS_MS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        milliseconds = seconds * 1000
+        for idx, bound in enumerate(STATS_HISTOGRAM_BOUNDS_MS):
+            if milliseconds <= bound:
+                self.buckets[idx] += 1
+                return
+        self.buckets[-1] += 1
+
+    def summary(self):
+        labels = [f"<={bound}" for bound in STATS_HISTOGRAM_BOUNDS_MS] + [f">{STATS_HISTOGRAM_BOUNDS_MS[-1]}"]
+        return {
+            'count': self.count,
+            'total_seconds': round(self.total, 6),
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0,
+            'max_ms': round(self.max * 1000, 3),
+            'histogram_ms': {label: count for label, count in zip(labels, self.buckets) if count},
+        }
+
+class StatsCollector(SplitHooks):
+    """
+    Aggregate per-stage timings, throughput and the slowest images of a run.
+    """
+
+    stages = True
+
+    def __init__(self, slowest=STATS_SLOWEST_IMAGES):
+        self.started = time.perf_counter()
+        self.slowest = slowest
+        self.histograms = {}
+        self.slowest_images = []
+        self.images = self.tiles = self.errors = 0
+        self.bytes_in = self.bytes_out = 0
+        self.lock = threading.Lock()
+
+    def _add(self, stage, seconds):
+        if stage not in self.histograms:
+            self.histograms[stage] = _Histogram()
+        self.histograms[stage].add(seconds)
+
+    def on_tile_end(self, event):
+        with self.lock:
+            self._add('tile', event['seconds'])
+            for stage, seconds in event.get('stages', {}).items():
+                self._add(stage, seconds)
+
+    def on_image_end(self, event):
+        with self.lock:
+            self.images += 1
+            self.tiles += event['tiles']
+            self.errors += len(event['errors'])
+            self.bytes_in += event.get('bytes_in', 0)
+            self.bytes_out += event.get('bytes_out', 0)
+            self._add('image', event['seconds'])
+            for stage, seconds in event.get('stages', {}).items():
+                self._add(stage, seconds)
+
+            # Keep the slowest images in a bounded min-heap
+            entry = (event['seconds'], event['image'] or '', event['tiles'])
+            if len(self.slowest_images) < self.slowest:
+                heapq.heappush(self.slowest_images, entry)
+            else:
+                heapq.heappushpop(self.slowest_images, entry)
+
+    def summary(self):
+        """
+        Return the collected statistics as a JSON-serializable dict.
+        """
+        wall_seconds = time.perf_counter() - self.started
+        per_second = (lambda value: round(value / wall_seconds, 3)) if wall_seconds > 0 else (lambda value: 0)
+        return {
+            'images': self.images,
+            'tiles': self.tiles,
+            'errors': self.errors,
+            'wall_seconds': round(wall_seconds, 6),
+            'throughput': {
+                'images_per_s': per_second(self.images),
+                'tiles_per_s': per_second(self.tiles),
+                'source_mb_per_s': per_second(self.bytes_in / 1e6),
+                'output_mb_per_s': per_second(self.bytes_out / 1e6),
+            },
+            'stages': {stage: histogram.summary() for stage, histogram in self.histograms.items()},
+            'slowest_images': [
+                {'image': image, 'seconds': round(seconds, 6), 'tiles': tiles}
+                for seconds, image, tiles in sorted(self.slowest_images, reverse=True)
+            ],
+        }
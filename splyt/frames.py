@@ -0,0 +1,157 @@
+# frames.py
+
+import os
+import time
+from PIL import GifImagePlugin, TiffImagePlugin
+from .metadata import encode_image_with_profile
+from .config import MULTI_FRAME_FORMATS
+
+def frame_count(img):
+    return getattr(img, 'n_frames', 1)
+
+def iter_frames(img):
+    """
+    Seek through the frames of an image one at a time, yielding the index of each
+    frame while img is on it. Only the current frame is decoded; img is back on the
+    frame it started on afterwards.
+    """
+    start = img.tell()
+    try:
+        for index in range(frame_count(img)):
+            img.seek(index)
+            yield index
+    finally:
+        img.seek(start)
+
+def _gif_frame(tile):
+    """
+    Bring a tile into a mode GIF frames can hold. Pillow hands out the frames after
+    the first one as RGB or RGBA, so those are quantized, with fully transparent
+    pixels mapped to a palette entry of their own. Returns (frame, transparency).
+    """
+    if tile.mode in ('P', 'L'):
+        return tile, tile.info.get('transparency')
+    if tile.mode == 'RGBA' and tile.getextrema()[3][0] == 0:
+        # Leave the last palette entry free for the transparent pixels
+        frame = tile.convert('RGB').quantize(255)
+        palette = frame.getpalette()
+        frame.putpalette(palette + [0, 0, 0] * (256 - len(palette) // 3))
+        frame.paste(255, mask=tile.getchannel('A').point(lambda alpha: 255 if alpha == 0 else 0))
+        return frame, 255
+    return tile.convert('RGB').quantize(256), None
+
+class GifTileWriter:
+    """
+    Write an animated GIF one frame at a time, appending each frame to the file as it
+    comes instead of collecting the whole animation first. Every frame carries its
+    own colour table, duration and disposal; close() ends the file.
+    """
+
+    def __init__(self, path, loop=None):
+        self.path = path
+        self.loop = loop
+        self.frames = 0
+
+    def add(self, tile, duration=None, disposal=0):
+        frame, transparency = _gif_frame(tile)
+        params = {'include_color_table': True, 'disposal': disposal}
+        if duration:
+            params['duration'] = duration
+        if transparency is not None:
+            params['transparency'] = transparency
+
+        with open(self.path, 'ab' if self.frames else 'wb') as f:
+            if not self.frames:
+                # Durations and disposal need GIF89a
+                frame.info['version'] = b'89a'
+                header, _ = GifImagePlugin.getheader(frame, None, {} if self.loop is None else {'loop': self.loop})
+                f.write(b''.join(header))
+            f.write(b''.join(GifImagePlugin.getdata(frame, **params)))
+        self.frames += 1
+
+    def close(self):
+        with open(self.path, 'ab') as f:
+            f.write(b';')
+
+class TiffTileWriter:
+    """
+    Write a multi-page TIFF one page at a time: each page is encoded on its own with
+    the save profile and appended to the file.
+    """
+
+    def __init__(self, path, profile):
+        self.path = path
+        self.profile = dict(profile, format='TIFF')
+        self.frames = 0
+
+    def add(self, tile, duration=None, disposal=0):
+        # TIFF pages have no timing
+        data = encode_image_with_profile(tile, self.profile)
+        with TiffImagePlugin.AppendingTiffWriter(self.path, new=not self.frames) as tf:
+            tf.write(data)
+        self.frames += 1
+
+    def close(self):
+        pass
+
+def split_frames(img, source, cells, tile_format, save_profile, naming_index):
+    """
+    Cut every frame of a multi-frame image into the same cells and write each cell as
+    one multi-frame tile: an animated GIF that keeps each frame's duration and
+    disposal, or a multi-page TIFF. Frames are read one at a time and each one is
+    appended to all tiles before the next is decoded, so memory stays at one frame
+    whatever the frame count. cells is a list of (filename, box), with boxes laid out
+    on the first frame; frames of another size (e.g. TIFF pages) are cut at the same
+    relative positions. source is what the cells are cropped from: img, or a
+    ScaledImage of it. Tiles are built under temporary names and only published
+    through naming_index once complete.
+    Returns a (path, seconds) pair for each cell: the final path of its tile, or None
+    where writing failed, and the time spent on that tile over all frames.
+    """
+    if tile_format not in MULTI_FRAME_FORMATS:
+        raise ValueError(f"Tiles with several frames cannot be saved as {tile_format}")
+
+    temp_paths = [naming_index.temp_path(filename) for filename, _ in cells]
+    if tile_format == 'GIF':
+        writers = [GifTileWriter(path, img.info.get('loop')) for path in temp_paths]
+    else:
+        writers = [TiffTileWriter(path, save_profile) for path in temp_paths]
+    failed = [False] * len(cells)
+    seconds = [0.0] * len(cells)
+
+    try:
+        width, height = img.size
+        for _ in iter_frames(img):
+            frame_info = {'duration': img.info.get('duration'), 'disposal': getattr(img, 'disposal_method', 0)}
+            scale_x, scale_y = img.width / width, img.height / height
+            for idx, (_, (left, upper, right, lower)) in enumerate(cells):
+                if failed[idx]:
+                    continue
+                box = (round(left * scale_x), round(upper * scale_y), round(right * scale_x), round(lower * scale_y))
+                started = time.perf_counter()
+                try:
+                    writers[idx].add(source.crop(box), **frame_info)
+                except Exception:
+                    failed[idx] = True
+                seconds[idx] += time.perf_counter() - started
+
+        saved = []
+        for idx, (filename, _) in enumerate(cells):
+            if failed[idx]:
+                saved.append((None, seconds[idx]))
+                continue
+            started = time.perf_counter()
+            try:
+                writers[idx].close()
+                path = naming_index.create(filename, lambda path: os.replace(temp_paths[idx], path))
+            except Exception:
+                path = None
+            saved.append((path, seconds[idx] + time.perf_counter() - started))
+        return saved
+    finally:
+        # Only left behind for tiles that failed or were not published
+        for path in temp_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
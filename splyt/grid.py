@@ -0,0 +1,186 @@
+# grid.py
+
+from array import array
+from .config import CELL_ORDERS, ERROR_NUMPY_REQUIRED
+
+class GridGeometry:
+    """
+    Cell layout of a grid, stored as two boundary arrays instead of one dict per cell.
+    Column c spans col_edges[c] to col_edges[c + 1] and row r spans row_edges[r] to
+    row_edges[r + 1], so a 1000x1000 grid takes two arrays of 1001 integers.
+
+    Cells are indexed and iterated column-major by default ('col': all rows of the first
+    column, then the next column), which is the order of calculate_cell_positions();
+    order='row' walks the grid row by row instead.
+    """
+
+    def __init__(self, col_edges, row_edges):
+        self.col_edges = array('q', col_edges)
+        self.row_edges = array('q', row_edges)
+
+    @classmethod
+    def from_grid(cls, image_size, grid_size, aspect_ratio=None):
+        """
+        Lay out a grid_size (cols, rows) grid over an image, accounting for aspect ratio
+        if provided. With an aspect ratio, leftover pixels form an extra column or row.
+        """
+        width, height = image_size
+        num_cols, num_rows = grid_size
+
+        if aspect_ratio is None:
+            # Evenly split the image
+            col_width = width / num_cols
+            row_height = height / num_rows
+            cols, rows = num_cols, num_rows
+        else:
+            aspect_x, aspect_y = aspect_ratio
+
+            # Compute scaling factor
+            scale_x = width / (aspect_x * num_cols)
+            scale_y = height / (aspect_y * num_rows)
+            scaling_factor = min(scale_x, scale_y)
+
+            col_width = aspect_x * scaling_factor
+            row_height = aspect_y * scaling_factor
+
+            # Adjust for any remaining pixels to cover the entire image
+            cols = num_cols + (1 if width - col_width * num_cols > 0 else 0)
+            rows = num_rows + (1 if height - row_height * num_rows > 0 else 0)
+
+        # The last column and row always end at the image edge
+        col_edges = [int(col * col_width) for col in range(cols)] + [width]
+        row_edges = [int(row * row_height) for row in range(rows)] + [height]
+        return cls(col_edges, row_edges)
+
+    @classmethod
+    def from_tile_size(cls, image_size, tile_size):
+        """
+        Lay out fixed-size (width, height) cells from the top left corner; the last
+        column and row hold whatever is left and may be smaller.
+        """
+        width, height = image_size
+        tile_width, tile_height = tile_size
+        return cls(list(range(0, width, tile_width)) + [width], list(range(0, height, tile_height)) + [height])
+
+    @property
+    def cols(self):
+        return len(self.col_edges) - 1
+
+    @property
+    def rows(self):
+        return len(self.row_edges) - 1
+
+    def __len__(self):
+        return self.cols * self.rows
+
+    def box(self, col, row):
+        """
+        Return the (left, upper, right, lower) box of a cell.
+        """
+        if not (0 <= col < self.cols and 0 <= row < self.rows):
+            raise IndexError(f"Cell ({col}, {row}) is outside the {self.cols}x{self.rows} grid")
+        return self.col_edges[col], self.row_edges[row], self.col_edges[col + 1], self.row_edges[row + 1]
+
+    def cell(self, col, row):
+        """
+        Return a cell as the dict calculate_cell_positions() produces.
+        """
+        left, upper, right, lower = self.box(col, row)
+        return {'col': col, 'row': row, 'left': left, 'upper': upper, 'right': right, 'lower': lower}
+
+    def position(self, index, order='col'):
+        """
+        Return the (col, row) of the index-th cell in the given order.
+        """
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError(f"Cell index {index} is out of range for {size} cells")
+        if order == 'row':
+            row, col = divmod(index, self.cols)
+        else:
+            col, row = divmod(index, self.rows)
+        return col, row
+
+    def __getitem__(self, index):
+        return self.cell(*self.position(index))
+
+    def iter_positions(self, order='col'):
+        """
+        Lazily yield the (col, row) of every cell in the given order ('col' or 'row').
+        """
+        if order not in CELL_ORDERS:
+            raise ValueError(f"Unknown cell order '{order}'")
+        if order == 'row':
+            for row in range(self.rows):
+                for col in range(self.cols):
+                    yield col, row
+        else:
+            for col in range(self.cols):
+                for row in range(self.rows):
+                    yield col, row
+
+    def iter_boxes(self, order='col'):
+        """
+        Lazily yield (col, row, box) for every cell in the given order.
+        """
+        for col, row in self.iter_positions(order):
+            yield col, row, self.box(col, row)
+
+    def iter_cells(self, order='col'):
+        """
+        Lazily yield every cell as a dict, in the given order.
+        """
+        for col, row in self.iter_positions(order):
+            yield self.cell(col, row)
+
+    def __iter__(self):
+        return self.iter_cells()
+
+    def to_list(self):
+        """
+        Return all cells as a list of dicts, exactly like calculate_cell_positions().
+        """
+        return list(self.iter_cells())
+
+    def to_numpy(self, order='col'):
+        """
+        Return the boxes of all cells as an (N, 4) NumPy array of left, upper, right and
+        lower, in the given order. Requires NumPy.
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError(ERROR_NUMPY_REQUIRED) from None
+
+        if order not in CELL_ORDERS:
+            raise ValueError(f"Unknown cell order '{order}'")
+        col_edges = np.asarray(self.col_edges, dtype=np.int64)
+        row_edges = np.asarray(self.row_edges, dtype=np.int64)
+        indexing = 'ij' if order == 'col' else 'xy'
+        cols, rows = np.meshgrid(np.arange(self.cols), np.arange(self.rows), indexing=indexing)
+        cols, rows = cols.ravel(), rows.ravel()
+        return np.stack([col_edges[cols], row_edges[rows], col_edges[cols + 1], row_edges[rows + 1]], axis=1)
+
+    def aligned_to_blocks(self, block_size):
+        """
+        Snap the inner edges to multiples of block_size, keeping the image edges.
+        Returns a new GridGeometry, or None if snapping would collapse a column or row.
+        """
+        block_width, block_height = block_size
+        col_edges = _snap_edges(self.col_edges, block_width)
+        row_edges = _snap_edges(self.row_edges, block_height)
+        if col_edges is None or row_edges is None:
+            return None
+        return GridGeometry(col_edges, row_edges)
+
+def _snap_edges(edges, step):
+    limit = edges[-1]
+    snapped = [edges[0]]
+    for edge in edges[1:-1]:
+        snapped.append(min(int(round(edge / step)) * step, limit))
+    snapped.append(limit)
+    if any(left >= right for left, right in zip(snapped, snapped[1:])):
+        return None
+    return snapped
@@ -0,0 +1,138 @@
+# manifest.py
+
+import hashlib
+import json
+import os
+import re
+from .utils import parse_output_format
+from .config import MANIFEST_FILENAME, HASH_CHUNK_SIZE, TILE_EXTENSIONS
+
+def fingerprint_file(filepath, with_hash=True):
+    """
+    Describe the current state of a file by its size, mtime and (optionally) SHA-256.
+    """
+    stat = os.stat(filepath)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        sha256 = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+        fingerprint['sha256'] = sha256.hexdigest()
+    return fingerprint
+
+class JobManifest:
+    """
+    Append-only record of the sources a batch run has completed, stored as JSON lines
+    in the save directory. A run that dies part way leaves every finished image
+    recorded, so a rerun only redoes new, changed or partially written sources.
+    """
+
+    def __init__(self, directory_path, save_dir, params, filename=MANIFEST_FILENAME, skip_completed=True):
+        self.directory_path = directory_path
+        # Without it the manifest only records the run and never skips or removes tiles
+        self.skip_completed = skip_completed
+        self.save_dir = save_dir
+        # Round-trip through JSON so tuples compare equal to the stored lists
+        self.params = json.loads(json.dumps(params))
+        self.path = os.path.join(save_dir, filename)
+        self.entries = self._load()
+
+    def _load(self):
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write can leave a truncated last line
+                    continue
+                entries[entry['source']] = entry
+        return entries
+
+    def _append(self, entry):
+        self.entries[entry['source']] = entry
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def source_key(self, image_path):
+        return os.path.relpath(image_path, self.directory_path).replace(os.sep, '/')
+
+    def completed_tiles(self, image_path):
+        """
+        Return the tiles of image_path if a previous run already split it with the same
+        parameters and the source is unchanged, otherwise None.
+        """
+        if not self.skip_completed:
+            return None
+        entry = self.entries.get(self.source_key(image_path))
+        if not entry or entry.get('status') != 'complete' or entry.get('params') != self.params:
+            return None
+
+        tiles = [os.path.join(self.save_dir, tile) for tile in entry['tiles']]
+        if not all(os.path.exists(tile) for tile in tiles):
+            return None
+
+        recorded = entry['fingerprint']
+        current = fingerprint_file(image_path, with_hash=False)
+        if current['size'] != recorded['size']:
+            return None
+        if current['mtime_ns'] != recorded['mtime_ns']:
+            # Touched but possibly unchanged; fall back to the content hash
+            current = fingerprint_file(image_path)
+            if current['sha256'] != recorded.get('sha256'):
+                return None
+            self._append(dict(entry, fingerprint=current))
+        return tiles
+
+    def start(self, image_path, image_save_dir):
+        """
+        Remove what an earlier run wrote for image_path and record that it is in progress.
+        """
+        key = self.source_key(image_path)
+        entry = self.entries.get(key) if self.skip_completed else None
+        if entry and entry.get('status') == 'complete':
+            stale_tiles = [os.path.join(self.save_dir, tile) for tile in entry['tiles']]
+        elif entry:
+            # Interrupted mid-image: the tile names were never recorded, but the
+            # parameters of that run tell which extension its tiles have
+            params = entry.get('params', self.params)
+            stale_tiles = _find_tiles_of(image_path, image_save_dir, params.get('image_format'))
+        else:
+            stale_tiles = []
+        for tile in stale_tiles:
+            try:
+                os.remove(tile)
+            except FileNotFoundError:
+                pass
+        self._append({'source': key, 'status': 'started', 'params': self.params})
+
+    def finish(self, result):
+        """
+        Record a finished image. Images with errors stay 'started' and are redone next run.
+        """
+        if result['errors']:
+            return
+        self._append({
+            'source': self.source_key(result['image']),
+            'status': 'complete',
+            'fingerprint': fingerprint_file(result['image']),
+            'params': self.params,
+            'tiles': [os.path.relpath(tile, self.save_dir).replace(os.sep, '/') for tile in result['tiles']],
+        })
+
+def _find_tiles_of(image_path, save_dir, image_format=None):
+    """
+    Find the tiles splyt() writes for image_path in save_dir, including (n) suffixed ones.
+    Tiles transcoded to image_format carry its extension instead of the source's.
+    """
+    filename, ext = os.path.splitext(os.path.basename(image_path))
+    extensions = {ext}
+    if image_format:
+        extensions.add(TILE_EXTENSIONS[parse_output_format(image_format)])
+    pattern = re.compile(re.escape(filename) + r'_[a-z]+\d+(\(\d+\))?(' + '|'.join(map(re.escape, sorted(extensions))) + ')$')
+    if not os.path.isdir(save_dir):
+        return []
+    return [os.path.join(save_dir, name) for name in os.listdir(save_dir) if pattern.match(name)]
@@ -1,18 +1,37 @@
 # metadata.py
 
+import io
 from PIL import Image, ExifTags
-from .config import CREATED_WITH_METADATA, VERSION, COMMENT_KEY_PNG, USER_COMMENT_TAG_JPEG
+from .config import (
+    CREATED_WITH_METADATA,
+    VERSION,
+    COMMENT_KEY_PNG,
+    USER_COMMENT_TAG_JPEG,
+    PNG_NON_TEXT_KEYS,
+    METADATA_SAVE_KEYS,
+    ENCODER_MODES,
+    ENCODER_PRESETS,
+)
 
-def prepare_metadata(img, copy_metadata, add_metadata, version):
+def prepare_metadata(img, copy_metadata, add_metadata, version, image_format=None):
     """
     Prepare the metadata dictionary for saving images.
+    image_format is the format the tiles are saved in, if not the source's own; the
+    splyt comment is then stored where that format keeps it.
     """
     original_info = img.info.copy() if copy_metadata else {}
+    format_lower = (image_format or img.format).lower()
+
+    # Read the EXIF block once; without copy_metadata start from an empty one
+    exif_data = None
+    if format_lower in ['jpeg', 'jpg', 'webp']:
+        # TIFF tags would read as EXIF too, so other sources only bring an EXIF block
+        copy_exif = copy_metadata and (img.format == 'JPEG' or 'exif' in img.info)
+        exif_data = img.getexif() if copy_exif else Image.Exif()
 
     # Add custom metadata
     if add_metadata:
         metadata_text = CREATED_WITH_METADATA.format(version=version)
-        format_lower = img.format.lower()
         if format_lower == 'png':
             # For PNG, add to 'Comment'
             comments = original_info.get(COMMENT_KEY_PNG, '')
@@ -20,46 +39,114 @@ def prepare_metadata(img, copy_metadata, add_metadata, version):
                 original_info[COMMENT_KEY_PNG] = comments + '\n' + metadata_text
             else:
                 original_info[COMMENT_KEY_PNG] = metadata_text
-        elif format_lower in ['jpeg', 'jpg']:
-            # For JPEG, use EXIF
-            exif_data = img.getexif()
+        elif exif_data is not None:
+            # For JPEG and WebP, use EXIF
             exif_data[USER_COMMENT_TAG_JPEG] = metadata_text
-            original_info['exif'] = exif_data
         # Other formats may not support metadata
 
     # Ensure EXIF data is included if copy_metadata is True
-    if copy_metadata and img.format.lower() in ['jpeg', 'jpg']:
-        exif_data = img.getexif()
-        if exif_data:
-            original_info['exif'] = exif_data
+    if exif_data:
+        original_info['exif'] = exif_data
 
     return original_info
 
-def save_image_with_metadata(image, file_path, metadata, image_format):
+def build_save_profile(metadata, image_format, save_params=None):
     """
-    Save the image to the specified file path, including metadata.
+    Serialize prepared metadata once into the keyword arguments Pillow's encoder for
+    image_format expects (PNG text chunks, EXIF bytes, ICC profile, DPI), so every tile
+    of a source reuses them. save_params are extra encoder options to include.
     """
     format_lower = image_format.lower() if image_format else ''
+    profile = dict(save_params or {})
+
+    if format_lower == 'png':
+        from PIL import PngImagePlugin
+        info = PngImagePlugin.PngInfo()
+        for k, v in metadata.items():
+            if k in PNG_NON_TEXT_KEYS:
+                continue
+            if isinstance(v, str):
+                info.add_text(k, v)
+            elif isinstance(v, bytes):
+                info.add_text(k, v.decode('utf-8', 'ignore'))
+        profile['pnginfo'] = info
+    if format_lower in ['png', 'jpeg', 'jpg', 'webp']:
+        exif_data = metadata.get('exif')
+        if exif_data:
+            profile['exif'] = exif_data if isinstance(exif_data, bytes) else exif_data.tobytes()
+    if format_lower in ['png', 'jpeg', 'jpg', 'tiff', 'tif', 'webp']:
+        if metadata.get('icc_profile'):
+            profile['icc_profile'] = metadata['icc_profile']
+    if format_lower in ['png', 'jpeg', 'jpg', 'tiff', 'tif', 'bmp']:
+        if metadata.get('dpi'):
+            profile['dpi'] = metadata['dpi']
+    # Other formats are saved without metadata
+
+    return profile
+
+def save_image_with_profile(image, file_path, profile):
+    """
+    Save the image to the specified file path using a profile from build_save_profile().
+    """
     try:
-        if format_lower == 'png':
-            from PIL import PngImagePlugin
-            info = PngImagePlugin.PngInfo()
-            for k, v in metadata.items():
-                if isinstance(v, str):
-                    info.add_text(k, v)
-                elif isinstance(v, bytes):
-                    info.add_text(k, v.decode('utf-8', 'ignore'))
-            image.save(file_path, pnginfo=info)
-        elif format_lower in ['jpeg', 'jpg']:
-            exif_data = metadata.get('exif')
-            if exif_data:
-                exif_bytes = exif_data.tobytes()
-                image.save(file_path, exif=exif_bytes)
-            else:
-                image.save(file_path)
-        else:
-            # For other formats, save without metadata
-            image.save(file_path)
+        image.save(file_path, **profile)
     except Exception:
         # If saving with metadata fails, save without it
-        image.save(file_path)
+        image.save(file_path, **{k: v for k, v in profile.items() if k not in METADATA_SAVE_KEYS})
+
+def encode_image_with_profile(image, profile):
+    """
+    Encode the image into bytes using a profile from build_save_profile(); the profile
+    must name the 'format'.
+    """
+    buffer = io.BytesIO()
+    try:
+        image.save(buffer, **profile)
+    except Exception:
+        # If saving with metadata fails, start over without it
+        buffer = io.BytesIO()
+        image.save(buffer, **{k: v for k, v in profile.items() if k not in METADATA_SAVE_KEYS})
+    return buffer.getvalue()
+
+def get_jpeg_encoder_params(img):
+    """
+    Encoder options that re-encode JPEG tiles with the source's own quantization
+    tables and chroma subsampling, instead of Pillow's default quality settings.
+    """
+    from PIL import JpegImagePlugin
+    return {
+        'qtables': img.quantization,
+        'subsampling': JpegImagePlugin.get_sampling(img),
+    }
+
+def get_encoder_params(image_format, preset=None):
+    """
+    Encoder options of a preset from ENCODER_PRESETS ('fast', 'balanced' or 'small')
+    for image_format; empty for no preset or a format the preset does not tune.
+    """
+    if preset is None:
+        return {}
+    if preset not in ENCODER_PRESETS:
+        raise ValueError(f"Unknown encoder preset '{preset}'")
+    return dict(ENCODER_PRESETS[preset].get(image_format.upper(), {}))
+
+def convert_for_format(image, image_format):
+    """
+    Convert an image into a mode image_format can store (see ENCODER_MODES), keeping
+    transparency where the format has an alpha channel. Returns image itself if it
+    can be saved as it is.
+    """
+    modes = ENCODER_MODES.get(image_format.upper())
+    if modes is None or image.mode in modes:
+        return image
+    if 'RGBA' in modes and (image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info):
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+def save_image_with_metadata(image, file_path, metadata, image_format, save_params=None):
+    """
+    Save the image to the specified file path, including metadata.
+    save_params are extra keyword arguments for the encoder. When saving many tiles
+    of one source, build the profile once and use save_image_with_profile() instead.
+    """
+    save_image_with_profile(image, file_path, build_save_profile(metadata, image_format, save_params))
@@ -0,0 +1,132 @@
+# naming.py
+
+import itertools
+import os
+import threading
+from .config import NAMING_POLICIES, TEMP_FILE_PREFIX
+
+class NamingIndex:
+    """
+    Collision-free output naming for one directory.
+    The directory is listed once and collisions are resolved from in-memory counters,
+    instead of probing os.path.exists for every tile. Files are written under a
+    temporary name and only then moved into place; a name is claimed with an
+    exclusive create first, so concurrent writers never clobber each other.
+
+    Policies:
+    - 'suffix': add (1), (2), ... to names that are already taken (the default)
+    - 'overwrite': replace existing files
+    - 'skip': keep existing files and do not write the tile
+    """
+
+    def __init__(self, directory, policy='suffix'):
+        if policy not in NAMING_POLICIES:
+            raise ValueError(f"Unknown naming policy '{policy}'")
+        self.directory = directory
+        self.policy = policy
+        self.taken = set(os.listdir(directory)) if os.path.isdir(directory) else set()
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.temp_ids = itertools.count()
+
+    def _next_candidate(self, filename):
+        if filename not in self.taken:
+            return filename
+        base_name, extension = os.path.splitext(filename)
+        counter = self.counters.get(filename, 1)
+        while f"{base_name}({counter}){extension}" in self.taken:
+            counter += 1
+        self.counters[filename] = counter + 1
+        return f"{base_name}({counter}){extension}"
+
+    def create(self, filename, write):
+        """
+        Create filename in the directory according to the policy.
+        write(path) must write the file's content to the given (temporary) path.
+        Returns the final path; with the 'skip' policy this may be the existing file.
+        """
+        with self.lock:
+            if self.policy == 'skip' and filename in self.taken:
+                return os.path.join(self.directory, filename)
+
+        temp_path = self.temp_path(filename)
+        try:
+            write(temp_path)
+            return self._publish(temp_path, filename)
+        finally:
+            # Only left behind if writing or publishing failed
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+
+    def temp_path(self, filename):
+        """
+        A fresh temporary path in the directory for content that becomes filename.
+        """
+        # The temporary name keeps the extension so Pillow picks the right format
+        return os.path.join(self.directory, f"{TEMP_FILE_PREFIX}{os.getpid()}-{next(self.temp_ids)}-{filename}")
+
+    def _publish(self, temp_path, filename):
+        final_path, new = self.claim(filename)
+        if new:
+            os.replace(temp_path, final_path)
+        return final_path
+
+    def claim(self, filename):
+        """
+        Decide the final path for filename now, before its content exists.
+        Returns (path, new); new is False when the 'skip' policy keeps an existing file.
+        Except with 'overwrite', the name is claimed with an exclusive create, and the
+        empty file is then replaced with the content.
+        """
+        if self.policy == 'overwrite':
+            with self.lock:
+                self.taken.add(filename)
+            return os.path.join(self.directory, filename), True
+
+        while True:
+            with self.lock:
+                if self.policy == 'skip' and filename in self.taken:
+                    return os.path.join(self.directory, filename), False
+                candidate = filename if self.policy == 'skip' else self._next_candidate(filename)
+                self.taken.add(candidate)
+            final_path = os.path.join(self.directory, candidate)
+            try:
+                # Claim the name; fails if another writer got there first
+                fd = os.open(final_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+            except FileExistsError:
+                if self.policy == 'skip':
+                    return final_path, False
+                continue
+            os.close(fd)
+            return final_path, True
+
+    def write_claimed(self, path, data):
+        """
+        Write data to a path returned by claim(), through a temporary file.
+        """
+        temp_path = self.temp_path(os.path.basename(path))
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        finally:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+
+# Indexes of the current process, shared by all images written to the same directory
+_process_indexes = {}
+_process_indexes_lock = threading.Lock()
+
+def get_naming_index(directory, policy='suffix'):
+    """
+    Return this process's NamingIndex for directory, creating it on first use.
+    """
+    key = (os.path.realpath(directory), policy)
+    with _process_indexes_lock:
+        if key not in _process_indexes:
+            _process_indexes[key] = NamingIndex(directory, policy)
+        return _process_indexes[key]
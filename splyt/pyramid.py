@@ -0,0 +1,140 @@
+# pyramid.py
+
+import math
+import os
+from PIL import Image, UnidentifiedImageError
+from .grid import GridGeometry
+from .utils import create_save_directory_if_needed, col_to_letter, parse_output_format
+from .metadata import get_encoder_params, convert_for_format
+from .config import (
+    PYRAMID_LAYOUTS,
+    PYRAMID_TILE_SIZE,
+    PYRAMID_OVERLAP,
+    PYRAMID_JPEG_QUALITY,
+    DZI_XML,
+    TILE_EXTENSIONS,
+    ERROR_CANNOT_IDENTIFY_IMAGE,
+    ERROR_UNABLE_TO_SAVE_IMAGE,
+)
+
+def pyramid_levels(image_size):
+    """
+    Number of Deep Zoom levels for an image: level 0 is 1x1 pixel and the last level
+    is the full resolution, each level half the size of the next (rounded up).
+    """
+    return math.ceil(math.log2(max(image_size))) + 1 if max(image_size) > 1 else 1
+
+def level_size(image_size, level, levels):
+    """
+    Width and height of a pyramid level.
+    """
+    scale = 2 ** (levels - 1 - level)
+    return tuple(max(1, math.ceil(side / scale)) for side in image_size)
+
+def _reducible(img):
+    """
+    Convert modes that Image.reduce() cannot average into the nearest one it can.
+    """
+    if img.mode == 'P':
+        return img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    if img.mode == '1':
+        return img.convert('L')
+    if img.mode.startswith('I;16'):
+        return img.convert('I')
+    return img
+
+def _tile_path(layout, save_dir, name, level, zoom, col, row, ext):
+    if layout == 'dzi':
+        return os.path.join(save_dir, f"{name}_files", str(level), f"{col}_{row}{ext}")
+    if layout == 'xyz':
+        return os.path.join(save_dir, name, str(zoom), str(col), f"{row}{ext}")
+    return os.path.join(save_dir, name, str(level), f"{name}_{col_to_letter(col)}{row + 1}{ext}")
+
+def build_pyramid(image_path, save_dir=None, tile_size=PYRAMID_TILE_SIZE, overlap=PYRAMID_OVERLAP, layout='dzi', tile_format=None, quiet=False, preset=None):
+    """
+    Cut an image into fixed-size tiles at every zoom level, for tiled viewers.
+    layout picks the file structure:
+    - 'dzi': Deep Zoom, name_files/level/col_row.ext plus a name.dzi descriptor;
+      levels go down to 1x1 pixel
+    - 'xyz': name/z/x/y.ext, z 0 being the first level that fits in one tile
+    - 'grid': name/level/name_a1.ext, the naming splyt() uses for grid cells
+    Tiles are tile_size pixels square (smaller at the right and bottom edges) plus
+    overlap pixels shared with each neighbour; overlap is only used by 'dzi' and 'grid'.
+    tile_format (see OUTPUT_FORMATS) defaults to JPEG for JPEG sources and PNG
+    otherwise; preset picks its encoder options (see ENCODER_PRESETS), and JPEG tiles
+    are saved at PYRAMID_JPEG_QUALITY without one.
+    Levels are produced from full resolution downwards, and each one is downsampled
+    from the previous level with a 2x2 box filter rather than from the original, so
+    at most two levels are held in memory at once.
+    Returns a result dict with the source 'image', the 'levels', the 'tiles' written
+    and any 'errors'.
+    """
+    if layout not in PYRAMID_LAYOUTS:
+        raise ValueError(f"Unknown pyramid layout '{layout}'")
+    if tile_size < 1 or overlap < 0:
+        raise ValueError("The tile size must be positive and the overlap not negative")
+    if layout == 'xyz':
+        overlap = 0
+
+    result = {'image': image_path, 'levels': 0, 'tiles': [], 'errors': []}
+
+    def report_error(message):
+        result['errors'].append(message)
+        if not quiet:
+            print(message)
+
+    try:
+        img = Image.open(image_path)
+        img.load()
+    except (UnidentifiedImageError, OSError):
+        report_error(ERROR_CANNOT_IDENTIFY_IMAGE.format(image_path=image_path))
+        return result
+
+    save_dir = create_save_directory_if_needed(save_dir or os.path.dirname(image_path))
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    if tile_format is None:
+        tile_format = 'JPEG' if img.format == 'JPEG' else 'PNG'
+    tile_format = parse_output_format(tile_format)
+    ext = TILE_EXTENSIONS[tile_format]
+    if preset is not None:
+        save_params = get_encoder_params(tile_format, preset)
+    else:
+        save_params = {'quality': PYRAMID_JPEG_QUALITY} if tile_format == 'JPEG' else {}
+
+    full_size = img.size
+    levels = pyramid_levels(full_size)
+    # Level of the xyz zoom 0: the largest level that still fits in one tile
+    first_level = 0
+    if layout == 'xyz':
+        while first_level < levels - 1 and max(level_size(full_size, first_level + 1, levels)) <= tile_size:
+            first_level += 1
+    result['levels'] = levels - first_level
+
+    current = _reducible(img)
+    if current is not img:
+        img.close()
+    for level in range(levels - 1, first_level - 1, -1):
+        width, height = current.size
+        geometry = GridGeometry.from_tile_size(current.size, (tile_size, tile_size))
+        source = convert_for_format(current, tile_format)
+        for col, row, (left, upper, right, lower) in geometry.iter_boxes():
+            box = (max(left - overlap, 0), max(upper - overlap, 0), min(right + overlap, width), min(lower + overlap, height))
+            tile_path = _tile_path(layout, save_dir, name, level, level - first_level, col, row, ext)
+            try:
+                os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+                source.crop(box).save(tile_path, format=tile_format, **save_params)
+                result['tiles'].append(tile_path)
+            except Exception:
+                report_error(ERROR_UNABLE_TO_SAVE_IMAGE.format(image_name=tile_path, image_format=tile_format))
+
+        # The next level down replaces this one, so only two levels are ever in memory
+        if level > first_level:
+            reduced = current.reduce(2)
+            current.close()
+            current = reduced
+    current.close()
+
+    if layout == 'dzi':
+        with open(os.path.join(save_dir, f"{name}.dzi"), 'w', encoding='utf-8') as f:
+            f.write(DZI_XML.format(format=ext[1:], overlap=overlap, tile_size=tile_size, width=full_size[0], height=full_size[1]))
+    return result
@@ -0,0 +1,67 @@
+# scaling.py
+
+import math
+from PIL import Image
+from .config import SCALED_TILE_REDUCING_GAP
+
+# Final resample of every reduced tile (Image.Resampling only exists from Pillow 9.1)
+TILE_RESAMPLE = getattr(Image, 'Resampling', Image).LANCZOS
+
+def tile_scale_factor(geometry, max_tile_size):
+    """
+    Factor by which every cell of a GridGeometry is shrunk so that the longest edge of
+    the largest cell fits in max_tile_size pixels, or 1 if every cell already fits.
+    All cells share the factor, so the reduced tiles still line up; cells are never
+    enlarged.
+    """
+    if max_tile_size < 1:
+        raise ValueError("The maximum tile size must be positive")
+    widths = (right - left for left, right in zip(geometry.col_edges, geometry.col_edges[1:]))
+    heights = (lower - upper for upper, lower in zip(geometry.row_edges, geometry.row_edges[1:]))
+    largest = max(max(widths, default=0), max(heights, default=0))
+    return min(1.0, max_tile_size / largest) if largest else 1.0
+
+def draft_scaled(img, factor):
+    """
+    Let a JPEG that is not decoded yet decode straight at the smallest DCT scale
+    (1/2, 1/4 or 1/8) that still holds factor times its size, so the full-size image
+    is never decoded. Returns the (x, y) scale that maps full-size coordinates onto
+    the drafted image: (1, 1) when it was not drafted, e.g. for other formats or
+    images that are already loaded.
+    """
+    if factor >= 1 or img.format != 'JPEG':
+        return 1.0, 1.0
+    full_width, full_height = img.size
+    requested = (max(1, math.ceil(full_width * factor)), max(1, math.ceil(full_height * factor)))
+    if img.draft(None, requested) is None:
+        return 1.0, 1.0
+    return img.width / full_width, img.height / full_height
+
+class ScaledImage:
+    """
+    Hand out cells of a source reduced by factor, with a single resample per cell.
+    Boxes are given in full-size coordinates; source_scale maps them onto a source
+    that is already smaller (a drafted JPEG, see draft_scaled()). Pillow images are
+    resampled straight from the box of the cell, without cropping it first; other
+    sources (e.g. a MappedImage) are cropped and the crop is resampled.
+    """
+
+    def __init__(self, source, factor, source_scale=(1.0, 1.0)):
+        self.source = source
+        self.factor = factor
+        self.source_scale = source_scale
+        self.mode = source.mode
+
+    def load(self):
+        self.source.load()
+
+    def crop(self, box):
+        left, upper, right, lower = box
+        size = (max(1, round((right - left) * self.factor)), max(1, round((lower - upper) * self.factor)))
+        if not isinstance(self.source, Image.Image):
+            return self.source.crop(box).resize(size, TILE_RESAMPLE, reducing_gap=SCALED_TILE_REDUCING_GAP)
+
+        scale_x, scale_y = self.source_scale
+        width, height = self.source.size
+        source_box = (left * scale_x, upper * scale_y, min(right * scale_x, width), min(lower * scale_y, height))
+        return self.source.resize(size, TILE_RESAMPLE, box=source_box, reducing_gap=SCALED_TILE_REDUCING_GAP)
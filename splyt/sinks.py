@@ -0,0 +1,405 @@
+# sinks.py
+
+import io
+import os
+import queue
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from PIL import Image
+from .metadata import save_image_with_profile, encode_image_with_profile
+from .naming import NamingIndex
+from .config import EXTENSION_FORMATS, WRITE_BEHIND_QUEUE_SIZE, WRITE_BEHIND_BATCH_SIZE, FSYNC_POLICIES, ERROR_WRITE_BEHIND_FAILED
+
+def _format_for_name(name):
+    """
+    Pillow format name for a tile filename, based on its extension. Only unusual
+    extensions are looked up in Pillow, which then loads every plugin it has.
+    """
+    extension = os.path.splitext(name)[1].lower()
+    return EXTENSION_FORMATS.get(extension) or Image.registered_extensions().get(extension)
+
+def _normalize_name(name):
+    return os.path.normpath(name).replace(os.sep, '/').lstrip('/')
+
+def _fsync_path(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Directories cannot be opened on every platform
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class DirectorySink:
+    """
+    Write tiles as files below a root directory. Existing files are handled according
+    to the naming policy (see naming.py).
+    """
+
+    def __init__(self, root, naming='suffix'):
+        self.root = root
+        self.naming = naming
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def _index_for(self, name):
+        directory = os.path.dirname(os.path.join(self.root, _normalize_name(name)))
+        with self.lock:
+            if directory not in self.indexes:
+                os.makedirs(directory, exist_ok=True)
+                self.indexes[directory] = NamingIndex(directory, self.naming)
+            return self.indexes[directory]
+
+    def save_image(self, image, name, profile):
+        return self._index_for(name).create(os.path.basename(name), lambda path: save_image_with_profile(image, path, profile))
+
+    def write(self, name, data):
+        def write_data(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+        return self._index_for(name).create(os.path.basename(name), write_data)
+
+    def reserve(self, name):
+        """
+        Decide the final path of a tile now and write it later with write_reserved().
+        Returns (path, new); new is False if the naming policy keeps an existing file.
+        """
+        return self._index_for(name).claim(os.path.basename(name))
+
+    def write_reserved(self, path, data):
+        index = self._index_for(os.path.relpath(path, self.root))
+        try:
+            index.write_claimed(path, data)
+        except Exception:
+            if self.naming != 'overwrite':
+                # Do not leave the empty file that claimed the name
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise
+        return path
+
+    def sync(self, paths):
+        """
+        Flush written tiles, and the directory entries naming them, to disk.
+        """
+        for path in paths:
+            _fsync_path(path)
+        for directory in {os.path.dirname(path) for path in paths}:
+            _fsync_path(directory)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ArchiveSink:
+    """
+    Base class for sinks that encode tiles in memory and append them to one archive.
+    Entries are written as they arrive; names that were already used get a (n) suffix.
+    """
+
+    def __init__(self):
+        self.names = set()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def _unique_name(self, name):
+        name = _normalize_name(name)
+        if name not in self.names:
+            return name
+        base_name, extension = os.path.splitext(name)
+        counter = self.counters.get(name, 1)
+        while f"{base_name}({counter}){extension}" in self.names:
+            counter += 1
+        self.counters[name] = counter + 1
+        return f"{base_name}({counter}){extension}"
+
+    def save_image(self, image, name, profile):
+        return self.write(name, encode_image_with_profile(image, dict(profile, format=_format_for_name(name))))
+
+    def write(self, name, data):
+        with self.lock:
+            name = self._unique_name(name)
+            self.names.add(name)
+            self._add_entry(name, data)
+        return name
+
+    def reserve(self, name):
+        with self.lock:
+            name = self._unique_name(name)
+            self.names.add(name)
+        return name, True
+
+    def write_reserved(self, name, data):
+        with self.lock:
+            self._add_entry(name, data)
+        return name
+
+    def sync(self, names):
+        # The archive is only complete once it is closed
+        pass
+
+    def _add_entry(self, name, data):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ZipSink(ArchiveSink):
+    """
+    Write tiles into a ZIP archive. Entries are stored, not deflated, since image
+    formats are already compressed.
+    """
+
+    def __init__(self, file):
+        super().__init__()
+        self.archive = zipfile.ZipFile(file, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    def _add_entry(self, name, data):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        self.archive.writestr(info, data)
+
+    def close(self):
+        self.archive.close()
+
+class TarSink(ArchiveSink):
+    """
+    Write tiles into an uncompressed TAR stream. The stream is never seeked, so it can
+    point at a pipe.
+    """
+
+    def __init__(self, file):
+        super().__init__()
+        if isinstance(file, (str, os.PathLike)):
+            self.archive = tarfile.open(file, 'w|')
+        else:
+            self.archive = tarfile.open(fileobj=file, mode='w|')
+
+    def _add_entry(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.archive.close()
+
+class StdoutTarSink(TarSink):
+    """
+    Stream tiles as a TAR archive to standard output.
+    """
+
+    def __init__(self):
+        super().__init__(sys.stdout.buffer)
+
+    def close(self):
+        super().close()
+        sys.stdout.buffer.flush()
+
+class MemorySink(ArchiveSink):
+    """
+    Collect encoded tiles in memory, e.g. to hand them from a worker process back
+    to the process that owns the real sink.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+
+    def _add_entry(self, name, data):
+        self.entries.append((name, data))
+
+    def close(self):
+        pass
+
+    def __getstate__(self):
+        # Locks cannot be pickled; a fresh one is created on the other side
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+class WriteBehindSink:
+    """
+    Decouple encoding from file system writes: tiles are encoded into memory by the
+    caller and handed through a bounded queue to a writer thread, which writes them to
+    the wrapped sink in batches. When the queue is full the encoder waits, so memory
+    stays bounded by queue_size tiles.
+    Tile names are decided by the wrapped sink when a tile is queued, so the returned
+    path is final. Tiles that cannot be written are collected in errors; once the sink
+    is closed, remove_failed() takes them out of split results.
+
+    fsync policies (directory output only):
+    - 'none': leave flushing to the operating system (the default)
+    - 'image': flush the tiles of each image when end_image() is called
+    - 'run': flush every tile when the sink is closed
+
+    stats() reports the queue occupancy, which shows whether a run is bound by
+    encoding (the queue is mostly empty) or by writing (it is mostly full).
+    """
+
+    def __init__(self, sink, queue_size=WRITE_BEHIND_QUEUE_SIZE, fsync='none', batch_size=WRITE_BEHIND_BATCH_SIZE):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}'")
+        self.sink = sink
+        self.root = getattr(sink, 'root', None)
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.queue = queue.Queue(max(1, queue_size))
+        self.errors = []
+        self.failed = {}
+        self.unsynced = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+        self.puts = self.full_puts = self.occupancy_total = 0
+        self.encoder_wait_seconds = self.writer_idle_seconds = self.writer_busy_seconds = 0.0
+        self.tiles_written = self.bytes_written = self.batches = 0
+
+        self.thread = threading.Thread(target=self._run, name='splyt-writer', daemon=True)
+        self.thread.start()
+
+    def save_image(self, image, name, profile):
+        return self.write(name, encode_image_with_profile(image, dict(profile, format=_format_for_name(name))))
+
+    def write(self, name, data):
+        final_name, new = self.sink.reserve(name)
+        if new:
+            self._put(('write', final_name, data))
+        return final_name
+
+    def end_image(self):
+        if self.fsync == 'image':
+            self._put(('sync', None, None))
+
+    def _put(self, item):
+        with self.lock:
+            self.puts += 1
+            self.occupancy_total += self.queue.qsize()
+            full = self.queue.full()
+            if full:
+                self.full_puts += 1
+        started = time.perf_counter()
+        self.queue.put(item)
+        if full:
+            with self.lock:
+                self.encoder_wait_seconds += time.perf_counter() - started
+
+    def _run(self):
+        running = True
+        while running:
+            started = time.perf_counter()
+            batch = [self.queue.get()]
+            self.writer_idle_seconds += time.perf_counter() - started
+
+            # Take whatever else is already waiting, up to one batch
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            started = time.perf_counter()
+            self.batches += 1
+            for kind, name, data in batch:
+                if kind == 'stop':
+                    running = False
+                elif kind == 'sync':
+                    self._sync()
+                else:
+                    try:
+                        self.unsynced.append(self.sink.write_reserved(name, data))
+                        self.tiles_written += 1
+                        self.bytes_written += len(data)
+                    except Exception as exc:
+                        self.failed[name] = ERROR_WRITE_BEHIND_FAILED.format(tile=name, error=exc)
+                        self.errors.append(self.failed[name])
+            if self.fsync == 'none':
+                self.unsynced.clear()
+            self.writer_busy_seconds += time.perf_counter() - started
+
+    def _sync(self):
+        self.sink.sync(self.unsynced)
+        self.unsynced = []
+
+    def stats(self):
+        """
+        Return the queue and writer counters as a JSON-serializable dict.
+        """
+        with self.lock:
+            puts = self.puts
+            return {
+                'queue_size': self.queue.maxsize,
+                'mean_occupancy': round(self.occupancy_total / puts / self.queue.maxsize, 3) if puts else 0,
+                'full_fraction': round(self.full_puts / puts, 3) if puts else 0,
+                'encoder_wait_seconds': round(self.encoder_wait_seconds, 6),
+                'writer_idle_seconds': round(self.writer_idle_seconds, 6),
+                'writer_busy_seconds': round(self.writer_busy_seconds, 6),
+                'tiles_written': self.tiles_written,
+                'bytes_written': self.bytes_written,
+                'batches': self.batches,
+                'bound': 'io' if self.encoder_wait_seconds > self.writer_idle_seconds else 'cpu',
+            }
+
+    def remove_failed(self, result):
+        """
+        Take the tiles that could not be written out of a split result and add their
+        errors to it. Only complete once the sink is closed.
+        """
+        failed = [tile for tile in result['tiles'] if tile in self.failed]
+        if failed:
+            result['tiles'] = [tile for tile in result['tiles'] if tile not in self.failed]
+            result['errors'] = result['errors'] + [self.failed[tile] for tile in failed]
+        return result
+
+    def close(self):
+        """
+        Wait until every queued tile is written, then close the wrapped sink.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(('stop', None, None))
+        self.thread.join()
+        if self.fsync != 'none':
+            self._sync()
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def open_sink(output, naming='suffix'):
+    """
+    Pick a sink for an output argument: '-' streams a TAR to stdout, *.zip and *.tar
+    name archives, anything else is a directory using the naming policy.
+    """
+    if output == '-':
+        return StdoutTarSink()
+    lower = output.lower()
+    if lower.endswith('.zip'):
+        return ZipSink(output)
+    if lower.endswith('.tar'):
+        return TarSink(output)
+    return DirectorySink(output, naming)
@@ -1,19 +1,86 @@
 # utils.py
 
+import hashlib
 import os
-from PIL import Image, UnidentifiedImageError
-from .config import SUPPORTED_FORMATS
+from .config import SUPPORTED_FORMATS, IMAGE_SIGNATURES, SIGNATURE_LENGTH, OUTPUT_FORMATS, FORMAT_ALIASES
+from .grid import GridGeometry
 
 def is_image_file(filepath):
     """
     Check if the given file path points to a valid image of a supported format.
     """
+    from PIL import Image, UnidentifiedImageError
     try:
         with Image.open(filepath) as img:
             return img.format.upper() in SUPPORTED_FORMATS
     except (FileNotFoundError, UnidentifiedImageError):
         return False
 
+def sniff_image_format(filepath):
+    """
+    Identify a supported image format from the first bytes of the file.
+    Returns the Pillow format name, or None if the file is not a supported image.
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            header = f.read(SIGNATURE_LENGTH)
+    except OSError:
+        return None
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    return None
+
+def scan_image_files(directory, recursive=False, exclude=()):
+    """
+    Lazily yield (path, format) for every supported image in a directory.
+    Only the first few bytes of each file are read. With recursive=True subdirectories
+    are scanned too, except the directories listed in exclude.
+    """
+    excluded = {os.path.realpath(path) for path in exclude}
+    with os.scandir(directory) as entries:
+        subdirectories = []
+        for entry in entries:
+            if entry.is_file():
+                image_format = sniff_image_format(entry.path)
+                if image_format:
+                    yield entry.path, image_format
+            elif recursive and entry.is_dir(follow_symlinks=False):
+                if os.path.realpath(entry.path) not in excluded:
+                    subdirectories.append(entry.path)
+
+    for subdirectory in subdirectories:
+        yield from scan_image_files(subdirectory, recursive, exclude)
+
+def parse_shard(value):
+    """
+    Parse a 'K/N' shard spec into (K, N): shard K of N, counting from 0.
+    Raises ValueError for anything else.
+    """
+    index, separator, count = value.partition('/')
+    index, count = int(index), int(count) if separator else 0
+    if not 0 <= index < count:
+        raise ValueError(value)
+    return index, count
+
+def parse_output_format(value):
+    """
+    Pillow name of a tile format given as e.g. 'jpg' or 'WebP'.
+    Raises ValueError for formats tiles cannot be written in (see OUTPUT_FORMATS).
+    """
+    image_format = FORMAT_ALIASES.get(value.upper(), value.upper())
+    if image_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{value}'")
+    return image_format
+
+def shard_of(relative_path, count):
+    """
+    Stable shard number of a source, from a hash of its path relative to the processed
+    directory. Every machine computes the same number, whatever its platform.
+    """
+    key = relative_path.replace(os.sep, '/').encode('utf-8')
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], 'big') % count
+
 def get_lowest_available_directory(base_dir):
     """
     Determine the lowest available directory to avoid overwriting directories.
@@ -25,12 +92,38 @@ def get_lowest_available_directory(base_dir):
         new_dir = f"{base_dir}/{iteration}"
     return new_dir
 
+def get_unique_filepath(save_dir, filename):
+    """
+    Return a path in save_dir for filename, adding an iteration number if the file already exists.
+    """
+    filepath = os.path.join(save_dir, filename)
+    if not os.path.exists(filepath):
+        return filepath
+
+    base_name, extension = os.path.splitext(filename)
+    counter = 1
+    while True:
+        new_filepath = os.path.join(save_dir, f"{base_name}({counter}){extension}")
+        if not os.path.exists(new_filepath):
+            return new_filepath
+        counter += 1
+
+def get_latest_existing_directory(base_dir):
+    """
+    Return the highest numbered directory created by get_lowest_available_directory(), or None.
+    """
+    if not os.path.isdir(base_dir):
+        return None
+    numbered = [int(name) for name in os.listdir(base_dir) if name.isdigit() and os.path.isdir(os.path.join(base_dir, name))]
+    if not numbered:
+        return None
+    return f"{base_dir}/{max(numbered)}"
+
 def create_save_directory_if_needed(save_dir):
     """
     Ensure the save directory exists.
     """
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir)
+    os.makedirs(save_dir, exist_ok=True)
     return save_dir
 
 def col_to_letter(col):
@@ -54,70 +147,15 @@ def calculate_cell_positions(image_size, grid_size, aspect_ratio=None):
     - 'upper': upper pixel coordinate
     - 'right': right pixel coordinate
     - 'lower': lower pixel coordinate
+    For large grids use GridGeometry (see grid.py), which computes cells on demand.
+    """
+    return GridGeometry.from_grid(image_size, grid_size, aspect_ratio).to_list()
+
+def get_jpeg_block_size(img):
+    """
+    Return the (width, height) in pixels of one MCU (minimum coded unit) of a JPEG.
     """
-    width, height = image_size
-    num_cols, num_rows = grid_size
-
-    cells = []
-
-    if aspect_ratio is None:
-        # Evenly split the image
-        col_width = width / num_cols
-        row_height = height / num_rows
-        for col in range(num_cols):
-            for row in range(num_rows):
-                left = int(col * col_width)
-                upper = int(row * row_height)
-                right = int((col + 1) * col_width) if col < num_cols - 1 else width
-                lower = int((row + 1) * row_height) if row < num_rows - 1 else height
-                cells.append({
-                    'col': col,
-                    'row': row,
-                    'left': left,
-                    'upper': upper,
-                    'right': right,
-                    'lower': lower
-                })
-    else:
-        aspect_x, aspect_y = aspect_ratio
-
-        # Compute scaling factor
-        scale_x = width / (aspect_x * num_cols)
-        scale_y = height / (aspect_y * num_rows)
-        scaling_factor = min(scale_x, scale_y)
-
-        cell_width = aspect_x * scaling_factor
-        cell_height = aspect_y * scaling_factor
-
-        total_width = cell_width * num_cols
-        total_height = cell_height * num_rows
-
-        # Adjust for any remaining pixels to cover the entire image
-        extra_width = width - total_width
-        extra_height = height - total_height
-
-        cols = num_cols + (1 if extra_width > 0 else 0)
-        rows = num_rows + (1 if extra_height > 0 else 0)
-
-        for col in range(cols):
-            for row in range(rows):
-                left = int(col * cell_width)
-                upper = int(row * cell_height)
-                right = int((col + 1) * cell_width)
-                lower = int((row + 1) * cell_height)
-
-                if col == cols - 1:
-                    right = width
-                if row == rows - 1:
-                    lower = height
-
-                cells.append({
-                    'col': col,
-                    'row': row,
-                    'left': left,
-                    'upper': upper,
-                    'right': right,
-                    'lower': lower
-                })
-
-    return cells
+    layers = getattr(img, 'layer', None) or [(None, 1, 1, None)]
+    max_h = max(layer[1] for layer in layers)
+    max_v = max(layer[2] for layer in layers)
+    return 8 * max_h, 8 * max_v
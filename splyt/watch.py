@@ -0,0 +1,366 @@
+# watch.py
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from .core import TileNameClaims, _split_worker, _manifest_params
+from .dedupe import make_deduper
+from .manifest import JobManifest
+from .naming import NamingIndex
+from .utils import create_save_directory_if_needed, scan_image_files, sniff_image_format
+from .config import (
+    WATCH_SETTLE_SECONDS,
+    WATCH_POLL_INTERVAL,
+    WATCH_BATCH_SIZE,
+    WATCH_BATCHES_IN_FLIGHT_PER_JOB,
+    WATCH_STATUS_INTERVAL,
+    WATCH_RATE_WINDOW,
+    WATCH_STATUS_FILENAME,
+    WATCH_STATUS_MESSAGE,
+    ERROR_PROCESSING_IMAGE,
+    ERROR_WATCH_SAVE_DIR,
+)
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+class InotifyWatcher:
+    """
+    Report files written, moved or deleted in a directory, using Linux inotify through ctypes.
+    Raises OSError where inotify is not available.
+    """
+
+    method = 'inotify'
+
+    def __init__(self, directory):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.directory = directory
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed")
+
+    def poll(self, timeout):
+        """
+        Wait up to timeout seconds and return the paths that changed, or None if
+        events were lost and the directory has to be rescanned.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            _, mask, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if name:
+                changed.add(os.path.join(self.directory, os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """
+    Report files whose size or modification time changed, or that are gone, by listing
+    the directory every poll. Used where inotify is not available.
+    """
+
+    method = 'polling'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.states = {}
+
+    def poll(self, timeout):
+        time.sleep(timeout)
+        changed = set()
+        states = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                states[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                if self.states.get(entry.path) != states[entry.path]:
+                    changed.add(entry.path)
+        changed.update(self.states.keys() - states.keys())
+        self.states = states
+        return changed
+
+    def close(self):
+        pass
+
+def open_watcher(directory, method=None):
+    """
+    Watch directory with inotify where available, otherwise by polling.
+    method forces 'inotify' or 'polling'.
+    """
+    if method != 'polling':
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError):
+            if method == 'inotify':
+                raise
+    return PollingWatcher(directory)
+
+class WatchStats:
+    """
+    Counters of a watch run: how many files wait to settle, wait for a worker or are
+    being split, what has been done, and the recent throughput.
+    """
+
+    def __init__(self, method=None):
+        self.method = method
+        self.started = time.time()
+        self.settling = 0
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.tiles = 0
+        self.recent = deque()
+
+    def record(self, result):
+        now = time.time()
+        self.completed += 1
+        self.tiles += len(result['tiles'])
+        if result['errors']:
+            self.failed += 1
+        self.recent.append((now, len(result['tiles'])))
+        while self.recent and self.recent[0][0] < now - WATCH_RATE_WINDOW:
+            self.recent.popleft()
+
+    def snapshot(self):
+        """
+        Return the counters as a JSON-serializable dict. Rates cover the last
+        WATCH_RATE_WINDOW seconds (or the uptime, if shorter).
+        """
+        now = time.time()
+        window = min(WATCH_RATE_WINDOW, max(now - self.started, 1e-9))
+        recent = [entry for entry in self.recent if entry[0] >= now - WATCH_RATE_WINDOW]
+        return {
+            'method': self.method,
+            'uptime_seconds': round(now - self.started, 3),
+            'settling': self.settling,
+            'queued': self.queued,
+            'in_flight': self.in_flight,
+            'queue_depth': self.settling + self.queued + self.in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'tiles': self.tiles,
+            'images_per_s': round(len(recent) / window, 3),
+            'tiles_per_s': round(sum(tiles for _, tiles in recent) / window, 3),
+        }
+
+def _ignore_interrupts():
+    # Ctrl+C reaches the whole process group; the parent decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _split_batch(batch, split_options):
+    """
+    Split a batch of (image_path, image_format, save_dir) inside a pool worker.
+    Naming indexes and the deduper only live for the batch: workers stay up for the
+    whole watch, and tiles may be deleted from the save directory in the meantime.
+    """
+    indexes = {}
+    split_options = dict(split_options, blank=make_deduper(split_options['blank'], split_options['dedupe']) or 'keep')
+    results = []
+    for image_path, image_format, save_dir in batch:
+        if save_dir not in indexes:
+            indexes[save_dir] = NamingIndex(create_save_directory_if_needed(save_dir), split_options['naming'])
+        image_options = dict(split_options, naming=indexes[save_dir])
+        results.append(_split_worker(image_path, image_format, save_dir, image_options, shared_save_dir=False))
+    return results
+
+def watch_directory(directory_path, save_dir, grid_size, aspect_ratio=None, copy_metadata=True, add_metadata=True, jobs=1, threads=1, stream=False, lossless_jpeg=False, resume=False, naming='suffix', blank='keep', dedupe=None, max_tile_size=None, image_format=None, preset=None, all_frames=False, settle=WATCH_SETTLE_SECONDS, poll_interval=WATCH_POLL_INTERVAL, method=None, stop_event=None, on_result=None, on_status=None):
+    """
+    Split images as they arrive in a directory, until stop_event is set.
+    Files already in the directory are split first. A file is only split once its size
+    and modification time have not changed for settle seconds; settled files are
+    handed in batches to a pool of jobs worker processes that stays up for the whole
+    run (jobs=0 uses one per CPU), so every image after the first skips the start-up cost.
+    on_result(result) is called for every finished image and on_status(stats) every
+    WATCH_STATUS_INTERVAL seconds with WatchStats.snapshot(), which is also written to
+    WATCH_STATUS_FILENAME in save_dir. With resume=True a manifest (see manifest.py)
+    skips sources completed by an earlier run, also across restarts.
+    threads, stream, lossless_jpeg, naming, blank, dedupe, max_tile_size, image_format,
+    preset and all_frames are passed on to splyt() for each image; repeated tiles are
+    found across the images of each batch.
+    Only the directory itself is watched, not its subdirectories. Returns the WatchStats.
+    """
+    if os.path.realpath(save_dir) == os.path.realpath(directory_path):
+        # New tiles would be picked up and split again
+        raise ValueError(ERROR_WATCH_SAVE_DIR)
+    stop_event = stop_event or threading.Event()
+    save_dir = create_save_directory_if_needed(save_dir)
+    status_path = os.path.join(save_dir, WATCH_STATUS_FILENAME)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    # Keyword arguments passed on to splyt() for every image
+    split_options = {
+        'grid_size': grid_size,
+        'aspect_ratio': aspect_ratio,
+        'copy_metadata': copy_metadata,
+        'add_metadata': add_metadata,
+        'threads': threads,
+        'stream': stream,
+        'lossless_jpeg': lossless_jpeg,
+        'sink': None,
+        'naming': 'overwrite' if resume else naming,
+        'hooks': None,
+        'blank': blank,
+        'dedupe': dedupe,
+        'max_tile_size': max_tile_size,
+        'image_format': image_format,
+        'preset': preset,
+        'all_frames': all_frames,
+    }
+    manifest = None
+    if resume:
+        manifest = JobManifest(directory_path, save_dir, _manifest_params(split_options))
+    # Resumed runs overwrite tiles, so two sources must never share tile names
+    claims = TileNameClaims(image_format) if resume and image_format else None
+
+    settling = {}   # path -> ((size, mtime_ns), time of the last change)
+    done = {}       # path -> (size, mtime_ns) when it was split
+    ready = deque()
+    running = deque()
+    last_status = 0
+
+    def track(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            settling.pop(path, None)
+            # Split again if a file of the same name shows up later
+            done.pop(path, None)
+            return
+        state = (stat.st_size, stat.st_mtime_ns)
+        if done.get(path) == state:
+            return
+        previous = settling.get(path)
+        if previous is None or previous[0] != state:
+            settling[path] = (state, time.monotonic())
+
+    def promote_settled():
+        now = time.monotonic()
+        for path, (state, changed_at) in list(settling.items()):
+            if now - changed_at < settle:
+                continue
+            del settling[path]
+            done[path] = state
+            image_format = sniff_image_format(path)
+            if not image_format:
+                continue
+            collision = claims.claim(path, image_format, save_dir) if claims else None
+            if collision:
+                report({'image': path, 'tiles': [], 'errors': [collision]})
+                continue
+            if manifest and manifest.completed_tiles(path) is not None:
+                continue
+            ready.append((path, image_format, save_dir))
+
+    def collect(block=False):
+        while running and (block or running[0][1].done()):
+            batch, future = running.popleft()
+            try:
+                results = future.result()
+            except Exception as exc:
+                # The worker process itself died
+                results = [{'image': image_path, 'tiles': [], 'errors': [ERROR_PROCESSING_IMAGE.format(image=image_path, error=exc)]} for image_path, _, _ in batch]
+            for result in results:
+                if manifest:
+                    manifest.finish(result)
+                report(result)
+
+    def report(result):
+        stats.record(result)
+        if on_result:
+            on_result(result)
+
+    def report_status():
+        snapshot = stats.snapshot()
+        temp_path = status_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, status_path)
+        if on_status:
+            on_status(snapshot)
+
+    watcher = open_watcher(directory_path, method)
+    stats = WatchStats(watcher.method)
+    try:
+        # Files that were dropped before the watch started
+        for image_path, _ in scan_image_files(directory_path):
+            track(image_path)
+
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_ignore_interrupts) as executor:
+            while not stop_event.is_set():
+                changed = watcher.poll(poll_interval)
+                if changed is None:
+                    # The kernel queue overflowed; fall back to a rescan
+                    changed = {entry.path for entry in os.scandir(directory_path) if entry.is_file()} | set(done)
+                for path in changed:
+                    track(path)
+                for path in list(settling):
+                    # Sizes are re-checked even when no event arrives
+                    track(path)
+                promote_settled()
+
+                # Feed the pool in batches, keeping a bounded number of batches in flight
+                while ready and len(running) < jobs * WATCH_BATCHES_IN_FLIGHT_PER_JOB:
+                    batch = [ready.popleft() for _ in range(min(WATCH_BATCH_SIZE, len(ready)))]
+                    if manifest:
+                        for image_path, _, image_save_dir in batch:
+                            manifest.start(image_path, image_save_dir)
+                    running.append((batch, executor.submit(_split_batch, batch, split_options)))
+                collect()
+
+                stats.settling = len(settling)
+                stats.queued = len(ready)
+                stats.in_flight = sum(len(batch) for batch, future in running)
+                if time.monotonic() - last_status >= WATCH_STATUS_INTERVAL:
+                    last_status = time.monotonic()
+                    report_status()
+
+            # Let the images already handed to the pool finish
+            collect(block=True)
+            stats.in_flight = 0
+            report_status()
+    finally:
+        watcher.close()
+    return stats
+
+def format_status(snapshot):
+    return WATCH_STATUS_MESSAGE.format(**snapshot)
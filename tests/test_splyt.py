@@ -1,16 +1,30 @@
 # test_splyt.py
 
+import asyncio
+import json
 import os
+import subprocess
+import sys
+import threading
+import time
 import pytest
 from unittest.mock import patch, MagicMock
-from splyt.core import splyt, process_directory
-from splyt.cli import parse_arguments
-from splyt.utils import is_image_file
+from splyt.core import splyt, process_directory, iter_tiles
+from splyt.cli import parse_arguments, parse_options
+from splyt.utils import is_image_file, scan_image_files, sniff_image_format, calculate_cell_positions
+from splyt.grid import GridGeometry
+from splyt.events import EventRecorder, StatsCollector, SplitHooks
+from splyt.aio import asplyt, aprocess_directory, aiter_tiles
+from splyt.watch import watch_directory
+from splyt.batch import run_jobs_file, parse_job
+from splyt.pyramid import build_pyramid, level_size
+from splyt.metadata import save_image_with_profile
 from splyt.config import USAGE_MESSAGE, ERROR_NO_TARGET_IMAGE, SUPPORTED_FORMATS
 from PIL import Image
 
 # Test CLI arguments
-def test_parse_arguments_valid(monkeypatch):
+def test_parse_arguments_valid(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
     monkeypatch.setattr('sys.argv', ['splyt', '3', '3', '1:1', 'image.png', 'output_dir'])
     grid_size, aspect_ratio, target, save_dir, copy_metadata, add_metadata = parse_arguments()
     assert grid_size == (3, 3)
@@ -20,7 +34,8 @@ def test_parse_arguments_valid(monkeypatch):
     assert copy_metadata is True
     assert add_metadata is True
 
-def test_parse_arguments_options(monkeypatch):
+def test_parse_arguments_options(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
     monkeypatch.setattr('sys.argv', ['splyt', '-cC', 'image.png'])
     grid_size, aspect_ratio, target, save_dir, copy_metadata, add_metadata = parse_arguments()
     assert copy_metadata is False
@@ -108,3 +123,956 @@ def test_process_directory(tmp_path):
 
     assert (output_dir / 'img1_a1.jpg').exists()
     assert (output_dir / 'img2_a1.png').exists()
+
+# Testing parallel directory processing
+def test_parse_options_jobs(monkeypatch, tmp_path):
+    # The save directory is created next to the relative target
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr('sys.argv', ['splyt', 'input', '-j', '4', '3', '3', '--deterministic'])
+    grid_size, aspect_ratio, target, save_dir, copy_metadata, add_metadata = parse_arguments()
+    options, remaining = parse_options()
+    assert grid_size == (3, 3)
+    assert target.endswith('input')
+    assert options['jobs'] == 4
+    assert options['deterministic'] is True
+    assert remaining == ['input', '3', '3']
+
+def test_process_directory_parallel(tmp_path):
+    input_dir = tmp_path / 'input'
+    output_dir = tmp_path / 'output'
+    input_dir.mkdir()
+    for idx in range(4):
+        Image.new('RGB', (40, 20)).save(str(input_dir / f'img{idx}.png'))
+    # A valid header with truncated pixel data fails only once the worker decodes it
+    Image.effect_noise((64, 64), 50).save(str(input_dir / 'broken.png'))
+    truncated = (input_dir / 'broken.png').read_bytes()[:200]
+    (input_dir / 'broken.png').write_bytes(truncated)
+
+    results = process_directory(str(input_dir), str(output_dir), grid_size=(2, 1), jobs=2, deterministic=True)
+
+    by_name = {os.path.basename(r['image']): r for r in results}
+    assert [os.path.basename(r['image']) for r in results] == [f for f in os.listdir(str(input_dir))]
+    assert by_name['broken.png']['errors']
+    for idx in range(4):
+        assert len(by_name[f'img{idx}.png']['tiles']) == 2
+        assert not by_name[f'img{idx}.png']['errors']
+    for idx in range(4):
+        assert (output_dir / f'img{idx}_a1.png').exists()
+        assert (output_dir / f'img{idx}_b1.png').exists()
+    assert not any(name.startswith('.splyt-worker') for name in os.listdir(str(output_dir)))
+
+# Testing threaded tile encoding
+def test_splyt_threaded_matches_serial(tmp_path):
+    img_path = tmp_path / 'noise.png'
+    Image.effect_noise((90, 60), 40).save(str(img_path))
+
+    serial = splyt(str(img_path), str(tmp_path / 'serial'), grid_size=(3, 2))
+    threaded = splyt(str(img_path), str(tmp_path / 'threaded'), grid_size=(3, 2), threads=4)
+
+    assert [os.path.basename(t) for t in threaded['tiles']] == [os.path.basename(t) for t in serial['tiles']]
+    for serial_tile, threaded_tile in zip(serial['tiles'], threaded['tiles']):
+        with Image.open(serial_tile) as a, Image.open(threaded_tile) as b:
+            assert a.tobytes() == b.tobytes()
+
+# Testing the streaming directory scanner
+def test_sniff_image_format(tmp_path):
+    img_path = tmp_path / 'photo.dat'
+    Image.new('RGB', (10, 10)).save(str(img_path), format='JPEG')
+    (tmp_path / 'notes.txt').write_text('Not an image')
+    assert sniff_image_format(str(img_path)) == 'JPEG'
+    assert sniff_image_format(str(tmp_path / 'notes.txt')) is None
+    assert sniff_image_format(str(tmp_path / 'missing.png')) is None
+
+def test_scan_finds_bigtiff(tmp_path):
+    Image.new('RGB', (20, 10)).save(str(tmp_path / 'big.tif'), big_tiff=True)
+    assert sniff_image_format(str(tmp_path / 'big.tif')) == 'TIFF'
+    result, = process_directory(str(tmp_path), str(tmp_path / 'out'), grid_size=(2, 1))
+    assert len(result['tiles']) == 2 and not result['errors']
+
+def test_process_directory_recursive(tmp_path):
+    input_dir = tmp_path / 'input'
+    nested_dir = input_dir / 'nested'
+    save_dir = input_dir / 'splyt'
+    nested_dir.mkdir(parents=True)
+    save_dir.mkdir()
+    Image.new('RGB', (20, 10)).save(str(input_dir / 'top.png'))
+    Image.new('RGB', (20, 10)).save(str(nested_dir / 'deep.gif'))
+    Image.new('RGB', (20, 10)).save(str(save_dir / 'old_tile.png'))
+    (nested_dir / 'readme.txt').write_text('Not an image')
+
+    scanned = scan_image_files(str(input_dir), recursive=True, exclude=(str(save_dir),))
+    assert not isinstance(scanned, list)
+    assert sorted(os.path.relpath(path, str(input_dir)) for path, _ in scanned) == ['nested/deep.gif', 'top.png']
+
+    process_directory(str(input_dir), str(save_dir), grid_size=(2, 1), recursive=True)
+
+    assert (save_dir / 'top_a1.png').exists()
+    assert (save_dir / 'nested' / 'deep_b1.gif').exists()
+    assert not (save_dir / 'old_tile_a1.png').exists()
+
+# Testing streaming band processing
+@pytest.mark.parametrize('filename, mode', [('scan.bmp', 'RGB'), ('scan.tif', 'L'), ('scan.png', 'RGB'), ('palette.bmp', 'P')])
+def test_splyt_stream_matches_full_decode(tmp_path, filename, mode):
+    img_path = tmp_path / filename
+    Image.effect_noise((61, 47), 40).convert(mode).save(str(img_path))
+
+    full = splyt(str(img_path), str(tmp_path / 'full'), grid_size=(3, 4), aspect_ratio=(1, 1))
+    streamed = splyt(str(img_path), str(tmp_path / 'streamed'), grid_size=(3, 4), aspect_ratio=(1, 1), stream=True)
+
+    assert sorted(os.path.basename(t) for t in streamed['tiles']) == sorted(os.path.basename(t) for t in full['tiles'])
+    for tile in full['tiles']:
+        with Image.open(tile) as a, Image.open(str(tmp_path / 'streamed' / os.path.basename(tile))) as b:
+            assert a.convert('RGB').tobytes() == b.convert('RGB').tobytes()
+
+def make_planar_tiff(path, img):
+    # Pillow cannot write PlanarConfiguration=2, so the file is laid out by hand:
+    # one uncompressed strip per band, each covering the whole image
+    import struct
+    planes = [band.tobytes() for band in img.split()]
+    data_offset = 8 + 2 + 10 * 12 + 4 + 6 + 12 + 12
+    entries = [(256, 3, 1, img.width), (257, 3, 1, img.height), (258, 3, 3, data_offset - 30), (259, 3, 1, 1),
+               (262, 3, 1, 2), (273, 4, 3, data_offset - 24), (277, 3, 1, 3), (278, 3, 1, img.height),
+               (279, 4, 3, data_offset - 12), (284, 3, 1, 2)]
+    data = bytearray(b'II*\x00' + struct.pack('<IH', 8, len(entries)))
+    for tag, field_type, count, value in entries:
+        data += struct.pack('<HHI', tag, field_type, count) + struct.pack('<HH' if field_type == 3 and count == 1 else '<I', *((value, 0) if field_type == 3 and count == 1 else (value,)))
+    data += struct.pack('<I3H', 0, 8, 8, 8)
+    data += struct.pack('<3I', *(data_offset + idx * len(planes[0]) for idx in range(3)))
+    data += struct.pack('<3I', *(len(plane) for plane in planes))
+    path.write_bytes(bytes(data) + b''.join(planes))
+
+def test_splyt_stream_planar_tiff(tmp_path):
+    original = Image.merge('RGB', [Image.linear_gradient('L').resize((60, 40)), Image.new('L', (60, 40), 185), Image.new('L', (60, 40), 128)])
+    make_planar_tiff(tmp_path / 'planar.tif', original)
+    result = splyt(str(tmp_path / 'planar.tif'), str(tmp_path / 'out'), (2, 2), quiet=True, stream=True)
+    # Streamed tiles come row by row
+    for tile_path, box in zip(result['tiles'], GridGeometry.from_grid((60, 40), (2, 2)).iter_boxes(order='row')):
+        assert Image.open(tile_path).tobytes() == original.crop(box[2]).tobytes()
+
+# Testing MCU-aligned JPEG splitting
+def test_align_cells_to_blocks():
+    geometry = GridGeometry([0, 33, 70], [0, 50])
+    aligned = geometry.aligned_to_blocks((16, 16))
+    assert [aligned.box(col, 0) for col in range(2)] == [(0, 0, 32, 50), (32, 0, 70, 50)]
+    assert geometry.aligned_to_blocks((128, 128)) is None
+
+def test_splyt_lossless_jpeg(tmp_path):
+    img_path = tmp_path / 'photo.jpg'
+    Image.effect_noise((100, 60), 40).convert('RGB').save(str(img_path), quality=95)
+
+    result = splyt(str(img_path), str(tmp_path / 'output'), grid_size=(3, 1), lossless_jpeg=True)
+
+    with Image.open(str(img_path)) as source:
+        source_tables = source.quantization
+    widths = []
+    for tile in result['tiles']:
+        with Image.open(tile) as img_out:
+            assert img_out.quantization == source_tables
+            widths.append(img_out.width)
+    assert widths == [32, 32, 36]
+
+# Testing resumable batch runs
+def test_process_directory_resume(tmp_path):
+    input_dir = tmp_path / 'input'
+    output_dir = tmp_path / 'output'
+    input_dir.mkdir()
+    for name in ('one.png', 'two.png', 'three.png'):
+        Image.new('RGB', (20, 10), 'red').save(str(input_dir / name))
+
+    first = process_directory(str(input_dir), str(output_dir), grid_size=(2, 1), resume=True)
+    assert not any(r.get('skipped') for r in first)
+
+    # Change one source and leave a partial tile of an interrupted image behind
+    Image.new('RGB', (30, 10), 'blue').save(str(input_dir / 'two.png'))
+    Image.new('RGB', (20, 10), 'green').save(str(input_dir / 'four.png'))
+    Image.new('RGB', (10, 10)).save(str(output_dir / 'four_a1.png'))
+    with open(str(output_dir / 'splyt-manifest.jsonl'), 'a') as f:
+        f.write('{"source": "four.png", "status": "started"}\n{"source": "trunc')
+
+    second = process_directory(str(input_dir), str(output_dir), grid_size=(2, 1), resume=True)
+    by_name = {os.path.basename(r['image']): r for r in second}
+    assert by_name['one.png'].get('skipped') and by_name['three.png'].get('skipped')
+    assert not by_name['two.png'].get('skipped') and not by_name['four.png'].get('skipped')
+    assert sorted(os.listdir(str(output_dir))) == sorted(
+        ['splyt-manifest.jsonl'] + [f'{stem}_{col}1.png' for stem in ('one', 'two', 'three', 'four') for col in 'ab'])
+
+    # A different grid invalidates every source
+    third = process_directory(str(input_dir), str(output_dir), grid_size=(1, 1), resume=True)
+    assert not any(r.get('skipped') for r in third)
+
+def test_process_directory_resume_transcoded(tmp_path):
+    input_dir = tmp_path / 'input'
+    output_dir = tmp_path / 'output'
+    input_dir.mkdir()
+    output_dir.mkdir()
+    Image.new('RGB', (20, 10), 'red').save(str(input_dir / 'one.png'))
+
+    # A run with another grid was interrupted after writing one WebP tile
+    Image.new('RGB', (5, 10)).save(str(output_dir / 'one_c1.webp'))
+    with open(str(output_dir / 'splyt-manifest.jsonl'), 'w') as f:
+        f.write('{"source": "one.png", "status": "started", "params": {"image_format": "webp"}}\n')
+
+    result, = process_directory(str(input_dir), str(output_dir), grid_size=(2, 1), resume=True, image_format='webp')
+    assert sorted(os.listdir(str(output_dir))) == ['one_a1.webp', 'one_b1.webp', 'splyt-manifest.jsonl']
+    assert process_directory(str(input_dir), str(output_dir), grid_size=(2, 1), resume=True, image_format='webp')[0].get('skipped')
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_process_directory_resume_stem_collision(tmp_path, jobs):
+    input_dir = tmp_path / 'input'
+    output_dir = tmp_path / 'output'
+    input_dir.mkdir()
+    output_dir.mkdir()
+    Image.new('RGB', (20, 10), 'red').save(str(input_dir / 'img.png'))
+    Image.new('RGB', (20, 10), 'blue').save(str(input_dir / 'img.jpg'))
+
+    # Both sources would be transcoded to img_a1.webp and img_b1.webp
+    results = process_directory(str(input_dir), str(output_dir), grid_size=(2, 1), resume=True, image_format='webp', jobs=jobs)
+    written = [r for r in results if r['tiles']]
+    rejected = [r for r in results if r.get('errors')]
+    assert len(written) == 1 and len(rejected) == 1
+    assert 'same tile names' in rejected[0]['errors'][0]
+    assert sorted(os.listdir(str(output_dir))) == ['img_a1.webp', 'img_b1.webp', 'splyt-manifest.jsonl']
+    with Image.open(str(output_dir / 'img_a1.webp')) as tile:
+        red, _, blue = tile.convert('RGB').getpixel((0, 0))
+        assert (red > blue) == written[0]['image'].endswith('.png')
+
+# Testing per-source save profiles
+def test_splyt_save_profile_metadata(tmp_path):
+    img_path = tmp_path / 'test_image.jpg'
+    img = Image.new('RGB', (40, 40))
+    img_exif = img.getexif()
+    img_exif[271] = 'Test Camera'
+    img.save(str(img_path), exif=img_exif.tobytes(), dpi=(300, 300), icc_profile=b'test icc')
+
+    splyt(str(img_path), str(tmp_path / 'copied'), grid_size=(2, 1))
+    splyt(str(img_path), str(tmp_path / 'not_copied'), grid_size=(2, 1), copy_metadata=False)
+
+    with Image.open(str(tmp_path / 'copied' / 'test_image_b1.jpg')) as img_out:
+        assert img_out.getexif()[271] == 'Test Camera'
+        assert img_out.info['icc_profile'] == b'test icc'
+        assert img_out.info['dpi'] == (300, 300)
+    with Image.open(str(tmp_path / 'not_copied' / 'test_image_b1.jpg')) as img_out:
+        exif = img_out.getexif()
+        assert 271 not in exif
+        assert 0x9286 in exif
+        assert 'icc_profile' not in img_out.info
+
+# Testing the in-memory tile API
+def test_iter_tiles_from_bytes(tmp_path):
+    import io
+    buffer = io.BytesIO()
+    Image.new('RGB', (60, 40), 'red').save(buffer, format='PNG')
+
+    tiles = iter_tiles(buffer.getvalue(), grid_size=(3, 2), image_format='png')
+    first = next(tiles)
+    rest = list(tiles)
+
+    assert first[:3] == (0, 0, (0, 0, 20, 20))
+    assert len(rest) == 5
+    for col, row, box, data in [first] + rest:
+        with Image.open(io.BytesIO(data)) as tile:
+            assert tile.format == 'PNG'
+            assert tile.size == (box[2] - box[0], box[3] - box[1])
+            assert 'Created with Splyt' in tile.info['Comment']
+
+def test_iter_tiles_from_image():
+    tiles = list(iter_tiles(Image.new('L', (10, 10)), grid_size=(2, 1)))
+    assert [(col, row) for col, row, _, _ in tiles] == [(0, 0), (1, 0)]
+    assert all(isinstance(tile, Image.Image) and tile.size == (5, 10) for _, _, _, tile in tiles)
+
+def test_iter_tiles_closes_opened_image(tmp_path):
+    Image.new('RGB', (20, 10)).save(tmp_path / 'image.png')
+    opened = []
+    real_open = Image.open
+    with patch('splyt.core.Image.open', side_effect=lambda *args: opened.append(real_open(*args)) or opened[-1]):
+        tiles = iter_tiles(str(tmp_path / 'image.png'), grid_size=(2, 1))
+        next(tiles)
+        tiles.close()
+    with pytest.raises(ValueError):
+        opened[0].getpixel((0, 0))
+
+    # Images passed in are left open
+    source = Image.new('RGB', (20, 10))
+    list(iter_tiles(source, grid_size=(2, 1)))
+    assert source.getpixel((0, 0)) == (0, 0, 0)
+
+    with pytest.raises(ValueError):
+        iter_tiles(str(tmp_path / 'image.png'), image_format='psd')
+
+# Testing archive output sinks
+def test_process_directory_zip_sink(tmp_path):
+    import zipfile
+    from splyt.sinks import ZipSink
+    input_dir = tmp_path / 'input'
+    (input_dir / 'nested').mkdir(parents=True)
+    Image.new('RGB', (20, 10)).save(str(input_dir / 'top.png'))
+    Image.new('RGB', (20, 10)).save(str(input_dir / 'nested' / 'deep.jpg'))
+
+    with ZipSink(str(tmp_path / 'tiles.zip')) as sink:
+        process_directory(str(input_dir), None, grid_size=(2, 1), recursive=True, jobs=2, sink=sink)
+
+    with zipfile.ZipFile(str(tmp_path / 'tiles.zip')) as archive:
+        assert sorted(archive.namelist()) == ['nested/deep_a1.jpg', 'nested/deep_b1.jpg', 'top_a1.png', 'top_b1.png']
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+    assert sorted(os.listdir(str(tmp_path))) == ['input', 'tiles.zip']
+
+def test_splyt_tar_sink_stream(tmp_path):
+    import io
+    import tarfile
+    from splyt.sinks import TarSink
+    img_path = tmp_path / 'test_image.png'
+    Image.new('RGB', (20, 20)).save(str(img_path))
+
+    stream = io.BytesIO()
+    with TarSink(stream) as sink:
+        result = splyt(str(img_path), grid_size=(2, 2), sink=sink)
+        splyt(str(img_path), grid_size=(1, 1), sink=sink)
+
+    stream.seek(0)
+    with tarfile.open(fileobj=stream, mode='r|') as archive:
+        names = [member.name for member in archive]
+    assert result['tiles'] == ['test_image_a1.png', 'test_image_a2.png', 'test_image_b1.png', 'test_image_b2.png']
+    assert names == result['tiles'] + ['test_image_a1(1).png']
+
+# Testing collision-free output naming
+def test_naming_index_policies(tmp_path):
+    from splyt.naming import NamingIndex
+    (tmp_path / 'tile.txt').write_text('original')
+
+    def writer(text):
+        def write(path):
+            with open(path, 'w') as f:
+                f.write(text)
+        return write
+
+    suffix = NamingIndex(str(tmp_path), 'suffix')
+    assert os.path.basename(suffix.create('tile.txt', writer('one'))) == 'tile(1).txt'
+    assert os.path.basename(suffix.create('tile.txt', writer('two'))) == 'tile(2).txt'
+
+    skip = NamingIndex(str(tmp_path), 'skip')
+    assert skip.create('tile.txt', writer('never')) == str(tmp_path / 'tile.txt')
+    assert (tmp_path / 'tile.txt').read_text() == 'original'
+
+    overwrite = NamingIndex(str(tmp_path), 'overwrite')
+    overwrite.create('tile.txt', writer('replaced'))
+    assert (tmp_path / 'tile.txt').read_text() == 'replaced'
+    assert sorted(os.listdir(str(tmp_path))) == ['tile(1).txt', 'tile(2).txt', 'tile.txt']
+
+def test_naming_index_concurrent_writers(tmp_path):
+    from splyt.naming import NamingIndex
+    # Two indexes stand in for two worker processes that both listed the empty directory
+    first = NamingIndex(str(tmp_path))
+    second = NamingIndex(str(tmp_path))
+
+    paths = []
+    for idx, index in enumerate([first, second, first, second]):
+        def write(path, idx=idx):
+            with open(path, 'w') as f:
+                f.write(str(idx))
+        paths.append(index.create('tile.txt', write))
+
+    assert len(set(paths)) == 4
+    assert sorted(open(path).read() for path in paths) == ['0', '1', '2', '3']
+
+def test_splyt_naming_policy_skip(tmp_path):
+    img_path = tmp_path / 'test_image.png'
+    save_dir = tmp_path / 'output'
+    Image.new('RGB', (20, 10), 'red').save(str(img_path))
+
+    splyt(str(img_path), str(save_dir), grid_size=(2, 1))
+    # Collisions are resolved from the index, without probing every tile name
+    with patch('splyt.core.get_unique_filepath', side_effect=AssertionError('probed')):
+        splyt(str(img_path), str(save_dir), grid_size=(2, 1))
+    splyt(str(img_path), str(save_dir), grid_size=(2, 1), naming='skip')
+
+    assert sorted(os.listdir(str(save_dir))) == ['test_image_a1(1).png', 'test_image_a1.png', 'test_image_b1(1).png', 'test_image_b1.png']
+
+# Testing the grid geometry
+def test_grid_geometry_matches_cell_positions():
+    for aspect_ratio in (None, (16, 9)):
+        geometry = GridGeometry.from_grid((1001, 777), (7, 5), aspect_ratio)
+        cells = calculate_cell_positions((1001, 777), (7, 5), aspect_ratio)
+        assert geometry.to_list() == cells
+        assert len(geometry) == len(cells)
+        assert geometry[-1] == cells[-1]
+    geometry = GridGeometry.from_grid((100, 50), (3, 2))
+    assert [cell['col'] for cell in geometry.iter_cells('row')] == [0, 1, 2, 0, 1, 2]
+    assert geometry.cell(2, 1) == geometry[geometry.rows * 2 + 1]
+
+def test_grid_geometry_large_grid_is_lazy():
+    geometry = GridGeometry.from_grid((100000, 100000), (1000, 1000))
+    assert len(geometry) == 1000000
+    assert geometry.box(999, 999) == (99900, 99900, 100000, 100000)
+    assert next(geometry.iter_boxes('row'))[2] == (0, 0, 100, 100)
+
+def test_grid_geometry_to_numpy():
+    np = pytest.importorskip('numpy')
+    geometry = GridGeometry.from_grid((100, 50), (3, 2))
+    boxes = geometry.to_numpy('row')
+    assert boxes.shape == (6, 4)
+    assert [tuple(box) for box in boxes.tolist()] == [box for _, _, box in geometry.iter_boxes('row')]
+
+# Testing split events and statistics
+def test_splyt_hooks_events(tmp_path):
+    img_path = tmp_path / 'test_image.png'
+    Image.new('RGB', (60, 40), color='green').save(img_path)
+    recorder = EventRecorder(stages=True)
+    result = splyt(str(img_path), str(tmp_path / 'out'), grid_size=(2, 2), hooks=recorder)
+
+    methods = [method for method, _ in recorder.events]
+    assert methods[0] == 'on_image_start' and methods[-1] == 'on_image_end'
+    assert methods.count('on_tile_start') == methods.count('on_tile_end') == 4
+    tile_ends = [event for method, event in recorder.events if method == 'on_tile_end']
+    assert [event['path'] for event in tile_ends] == result['tiles']
+    assert set(tile_ends[0]['stages']) == {'crop', 'encode', 'write'}
+    assert sum(event['bytes'] for event in tile_ends) == sum(os.path.getsize(tile) for tile in result['tiles'])
+    image_end = recorder.events[-1][1]
+    assert image_end['tiles'] == 4 and image_end['bytes_out'] > 0
+
+def test_process_directory_stats(tmp_path):
+    for idx in range(3):
+        Image.new('RGB', (40, 40), color='blue').save(tmp_path / f'image_{idx}.png')
+    progress = MagicMock()
+    stats = StatsCollector(slowest=2)
+    process_directory(str(tmp_path), str(tmp_path / 'out'), (2, 1), cli_callbacks=(progress, None), jobs=2, hooks=stats)
+
+    summary = stats.summary()
+    assert summary['images'] == 3 and summary['tiles'] == 6
+    assert summary['stages']['encode']['count'] == 6
+    assert len(summary['slowest_images']) == 2
+    assert progress.call_count == 6
+
+# Testing the asyncio API
+def test_aprocess_directory(tmp_path):
+    for idx in range(5):
+        Image.new('RGB', (60, 30), color='red').save(tmp_path / f'image_{idx}.png')
+
+    async def collect():
+        return [result async for result in aprocess_directory(str(tmp_path), str(tmp_path / 'out'), (3, 1), max_images=2, quiet=True)]
+
+    results = asyncio.run(collect())
+    assert sorted(os.path.basename(result['image']) for result in results) == [f'image_{idx}.png' for idx in range(5)]
+    assert len(os.listdir(str(tmp_path / 'out'))) == 15
+
+def test_aiter_tiles_closed_early():
+    img = Image.new('RGB', (100, 100), color='blue')
+
+    async def first_tiles():
+        tiles = []
+        stream = aiter_tiles(img, (10, 10), max_tiles=2, image_format='PNG')
+        async for tile in stream:
+            tiles.append(tile)
+            if len(tiles) == 3:
+                break
+        await stream.aclose()
+        return tiles
+
+    assert [(col, row) for col, row, _, _ in asyncio.run(first_tiles())] == [(0, 0), (0, 1), (0, 2)]
+
+def test_asplyt_cancel_removes_tiles(tmp_path):
+    img_path = tmp_path / 'test_image.png'
+    Image.new('RGB', (200, 200), color='green').save(img_path)
+    save_dir = tmp_path / 'out'
+
+    class SlowHooks(SplitHooks):
+        def __init__(self):
+            self.started = threading.Event()
+
+        def on_tile_end(self, event):
+            self.started.set()
+            time.sleep(0.01)
+
+    async def cancel_split():
+        hooks = SlowHooks()
+        task = asyncio.ensure_future(asplyt(str(img_path), str(save_dir), (20, 20), hooks=hooks))
+        while not hooks.started.is_set():
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_split())
+    assert os.listdir(str(save_dir)) == []
+
+# Testing watch mode
+@pytest.mark.parametrize('method', ['polling', 'inotify'])
+def test_watch_directory(tmp_path, method):
+    if method == 'inotify' and not sys.platform.startswith('linux'):
+        pytest.skip('inotify is only available on Linux')
+    watched = tmp_path / 'drop'
+    watched.mkdir()
+    Image.new('RGB', (40, 40), color='red').save(watched / 'before.png')
+    stop_event = threading.Event()
+    results = []
+
+    def on_result(result):
+        results.append(result)
+        if len(results) == 2:
+            stop_event.set()
+
+    def drop_later():
+        time.sleep(0.3)
+        Image.new('RGB', (40, 40), color='blue').save(watched / 'after.png')
+        (watched / 'notes.txt').write_text('not an image')
+
+    threading.Thread(target=drop_later).start()
+    stats = watch_directory(str(watched), str(tmp_path / 'out'), (2, 1), settle=0.2, poll_interval=0.05,
+                            method=method, stop_event=stop_event, on_result=on_result)
+
+    assert sorted(os.path.basename(result['image']) for result in results) == ['after.png', 'before.png']
+    snapshot = stats.snapshot()
+    assert snapshot['method'] == method
+    assert snapshot['completed'] == 2 and snapshot['tiles'] == 4 and snapshot['queue_depth'] == 0
+    assert os.path.exists(tmp_path / 'out' / 'splyt-watch-status.json')
+
+def test_watch_directory_format_and_resume(tmp_path):
+    watched = tmp_path / 'drop'
+    watched.mkdir()
+    Image.new('RGB', (40, 40), color='red').save(watched / 'photo.png')
+
+    def watch_once(image_format):
+        stop_event = threading.Event()
+        results = []
+        # Gives up if the source is (wrongly) skipped as already done
+        timer = threading.Timer(5, stop_event.set)
+        timer.start()
+        watch_directory(str(watched), str(tmp_path / 'out'), (2, 1), resume=True, image_format=image_format, settle=0.1,
+                        poll_interval=0.05, method='polling', stop_event=stop_event,
+                        on_result=lambda result: (results.append(result), stop_event.set()))
+        timer.cancel()
+        return results
+
+    assert [os.path.basename(tile) for tile in watch_once('jpeg')[0]['tiles']] == ['photo_a1.jpg', 'photo_b1.jpg']
+    # Other output settings redo the source instead of skipping it
+    assert [os.path.basename(tile) for tile in watch_once('webp')[0]['tiles']] == ['photo_a1.webp', 'photo_b1.webp']
+
+def test_watch_directory_rescans_deleted_tiles(tmp_path):
+    watched = tmp_path / 'drop'
+    out = tmp_path / 'out'
+    watched.mkdir()
+    Image.new('RGB', (40, 40), color='red').save(watched / 'photo.png')
+    stop_event = threading.Event()
+    results = []
+
+    def on_result(result):
+        results.append(result)
+        if len(results) == 1:
+            # Clear the output and drop the same picture again, as a new file
+            for name in os.listdir(out):
+                if name.startswith('photo'):
+                    os.remove(out / name)
+            os.remove(watched / 'photo.png')
+            time.sleep(0.3)
+            Image.new('RGB', (40, 40), color='red').save(watched / 'photo.png')
+        else:
+            stop_event.set()
+
+    timer = threading.Timer(10, stop_event.set)
+    timer.start()
+    watch_directory(str(watched), str(out), (2, 1), naming='skip', dedupe='manifest', settle=0.1, poll_interval=0.05,
+                    method='polling', stop_event=stop_event, on_result=on_result)
+    timer.cancel()
+
+    # The worker must not remember the deleted tiles as still being there
+    assert len(results) == 2
+    assert os.path.exists(out / 'photo_a1.png')
+    with open(out / 'splyt-duplicates.jsonl') as f:
+        assert all(os.path.exists(json.loads(line)['original']) for line in f)
+
+# Testing CLI startup cost
+# Time importing the CLI may add to a bare interpreter start; loading Pillow alone exceeds it
+STARTUP_BUDGET_SECONDS = 0.08
+
+def run_python(code):
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                          cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def test_cli_import_defers_pillow():
+    completed = run_python(
+        "import sys, splyt, splyt.cli\n"
+        "print(sorted(name for name in sys.modules if name == 'PIL' or name.startswith(('PIL.', 'splyt.core'))))"
+    )
+    assert completed.stdout.strip() == '[]'
+
+def test_cli_startup_time():
+    def best_time(code):
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            run_python(code)
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    overhead = best_time('import splyt.cli') - best_time('pass')
+    assert overhead < STARTUP_BUDGET_SECONDS
+
+def test_cli_registers_only_supported_plugins(tmp_path):
+    Image.new('RGB', (20, 20)).save(tmp_path / 'image.tif')
+    completed = run_python(
+        "import sys\n"
+        f"sys.argv = ['splyt', {str(tmp_path / 'image.tif')!r}, {str(tmp_path / 'out')!r}]\n"
+        "from splyt.cli import main\n"
+        "main()\n"
+        "print(sorted(name for name in sys.modules if name.startswith('PIL.') and name.endswith('ImagePlugin')))"
+    )
+    plugins = ['PIL.BmpImagePlugin', 'PIL.GifImagePlugin', 'PIL.JpegImagePlugin', 'PIL.PngImagePlugin', 'PIL.TiffImagePlugin']
+    assert completed.stdout.strip().splitlines()[-1] == repr(plugins)
+
+def test_cli_plugins_leave_other_formats_loadable(tmp_path):
+    completed = run_python(
+        "from splyt.cli import register_image_plugins\n"
+        "register_image_plugins('WEBP')\n"
+        "from PIL import Image\n"
+        f"Image.new('RGB', (4, 4)).save({str(tmp_path / 'tile.pcx')!r})\n"
+        f"print(Image.open({str(tmp_path / 'tile.pcx')!r}).format)"
+    )
+    assert completed.stdout.strip() == 'PCX'
+
+# Testing jobs files
+def test_run_jobs_file_decodes_each_source_once(tmp_path):
+    Image.new('RGB', (60, 40)).save(tmp_path / 'a.png')
+    jobs_file = tmp_path / 'jobs.jsonl'
+    jobs_file.write_text(
+        '{"source": "a.png", "output": "two", "grid_size": [2, 1], "id": "first"}\n'
+        '\n'
+        '{"source": "a.png", "output": "three", "grid_size": "3x2", "copy_metadata": false}\n'
+        '{"grid_size": [2, 1]}\n'
+    )
+    with patch.object(Image, 'open', wraps=Image.open) as open_mock:
+        results = list(run_jobs_file(str(jobs_file)))
+    assert open_mock.call_count == 1
+
+    invalid, first, second = results
+    assert invalid['line'] == 4 and invalid['errors']
+    assert first['id'] == 'first' and len(first['tiles']) == 2
+    assert second['line'] == 3 and second['grid_size'] == [3, 2] and len(second['tiles']) == 6
+    assert all(os.path.dirname(tile) == str(tmp_path / 'three') for tile in second['tiles'])
+
+def test_parse_job_rejects_invalid_fields():
+    for line in ('[]', '{"source": "a.png", "grid_size": "3"}', '{"source": "a.png", "aspect_ratio": [0, 1]}', '{"source": "a.png", "add_metadata": "no"}'):
+        with pytest.raises(ValueError):
+            parse_job(line)
+    assert parse_job('{"source": "a.png", "aspect_ratio": "16:9"}')['aspect_ratio'] == (16, 9)
+
+# Testing image pyramids
+def test_build_pyramid_dzi(tmp_path):
+    Image.new('RGB', (600, 300), 'green').save(tmp_path / 'map.png')
+    result = build_pyramid(str(tmp_path / 'map.png'), str(tmp_path / 'out'), tile_size=256, overlap=2)
+    assert result['errors'] == []
+    assert result['levels'] == 11  # 600px halves down to 1px in 10 steps
+    assert (tmp_path / 'out' / 'map.dzi').read_text().count('TileSize="256"') == 1
+
+    top = tmp_path / 'out' / 'map_files' / '10'
+    assert sorted(os.listdir(top)) == ['0_0.png', '0_1.png', '1_0.png', '1_1.png', '2_0.png', '2_1.png']
+    assert Image.open(top / '0_0.png').size == (258, 258)
+    assert Image.open(top / '1_1.png').size == (260, 46)
+    assert Image.open(top / '2_0.png').size == (90, 258)
+    for level in range(11):
+        width, height = level_size((600, 300), level, 11)
+        assert Image.open(tmp_path / 'out' / 'map_files' / str(level) / '0_0.png').size == (min(width, 258), min(height, 258))
+
+def test_build_pyramid_xyz_starts_at_one_tile(tmp_path):
+    Image.new('P', (500, 200)).save(tmp_path / 'map.gif')
+    result = build_pyramid(str(tmp_path / 'map.gif'), str(tmp_path / 'out'), tile_size=128, layout='xyz')
+    assert result['levels'] == 3
+    assert os.path.exists(tmp_path / 'out' / 'map' / '0' / '0' / '0.png')
+    assert len(os.listdir(tmp_path / 'out' / 'map' / '2')) == 4
+    assert Image.open(tmp_path / 'out' / 'map' / '2' / '3' / '1.png').size == (116, 72)
+
+@pytest.mark.parametrize('args, flag', [
+    (['-o', 'tiles.zip'], '--output'),
+    (['--watch'], '--watch'),
+    (['--all-frames'], '--all-frames'),
+    (['-j', '4'], '--jobs'),
+    (['--lossless'], '--lossless'),
+    (['-r'], '--recursive'),
+    (['--naming', 'skip'], '--naming'),
+    (['--dedupe', 'link'], '--dedupe'),
+])
+def test_pyramid_rejects_unsupported_options(tmp_path, capsys, args, flag):
+    from splyt import cli
+    Image.new('RGB', (64, 64)).save(tmp_path / 'map.png')
+    options, _ = parse_options(['--pyramid', 'dzi', '--tile-size', '32', '--format', 'webp'] + args)
+    with pytest.raises(SystemExit):
+        cli.pyramid(str(tmp_path / 'map.png'), str(tmp_path / 'out'), options)
+    assert f"--pyramid cannot be combined with {flag}" in capsys.readouterr().out
+    assert not os.path.exists(tmp_path / 'out')
+
+# Testing blank and repeated tiles
+def make_sprite_sheet(path):
+    sheet = Image.new('RGBA', (300, 200), (255, 0, 0, 0))
+    sprite = Image.linear_gradient('L').resize((100, 100)).convert('RGBA')
+    sheet.paste(sprite, (0, 0))
+    sheet.paste(sprite, (200, 100))
+    sheet.save(path)
+
+def test_splyt_blank_tiles(tmp_path):
+    make_sprite_sheet(tmp_path / 'sheet.png')
+    skipped = splyt(str(tmp_path / 'sheet.png'), str(tmp_path / 'skip'), (3, 2), blank='skip', quiet=True)
+    assert len(skipped['tiles']) == 2 and len(skipped['blank_tiles']) == 4
+    assert skipped['errors'] == []
+
+    with patch('splyt.core.save_image_with_profile', wraps=save_image_with_profile) as save_mock:
+        linked = splyt(str(tmp_path / 'sheet.png'), str(tmp_path / 'placeholder'), (3, 2), blank='placeholder', quiet=True)
+    assert len(linked['tiles']) == 6
+    assert save_mock.call_count == 3  # two sprites and one placeholder
+    assert os.stat(tmp_path / 'placeholder' / 'sheet_b1.png').st_ino == os.stat(tmp_path / 'placeholder' / 'sheet_c1.png').st_ino
+
+def test_process_directory_dedupe_manifest(tmp_path):
+    make_sprite_sheet(tmp_path / 'one.png')
+    make_sprite_sheet(tmp_path / 'two.png')
+    results = process_directory(str(tmp_path), str(tmp_path / 'out'), (3, 2), copy_metadata=False, add_metadata=False, dedupe='manifest')
+    assert [len(result['tiles']) for result in results] == [2, 0]
+    assert len(results[0]['duplicates']) == 4 and len(results[1]['duplicates']) == 6
+    with open(tmp_path / 'out' / 'splyt-duplicates.jsonl', encoding='utf-8') as f:
+        assert len(f.readlines()) == 10
+
+def test_run_jobs_file_blank_and_dedupe(tmp_path):
+    make_sprite_sheet(tmp_path / 'sheet.png')
+    (tmp_path / 'jobs.jsonl').write_text('{"source": "sheet.png", "output": "a", "grid_size": [3, 2]}\n'
+                                         '{"source": "sheet.png", "output": "b", "grid_size": [3, 2]}\n')
+    first, second = run_jobs_file(str(tmp_path / 'jobs.jsonl'), blank='skip', dedupe='manifest')
+    assert len(first['tiles']) == 1 and len(first['blank_tiles']) == 4 and len(first['duplicates']) == 1
+    # Repeats are found across jobs
+    assert second['tiles'] == [] and len(second['duplicates']) == 2
+
+# Testing the memory-mapped path for uncompressed sources
+@pytest.mark.parametrize('filename, save_options', [('scan.bmp', {}), ('scan.tif', {'tiffinfo': {278: 16}})])
+def test_splyt_maps_uncompressed_sources(tmp_path, filename, save_options):
+    original = Image.linear_gradient('L').resize((90, 70)).convert('RGB')
+    original.save(tmp_path / filename, **save_options)
+
+    source = Image.open(tmp_path / filename)
+    result = splyt(source, str(tmp_path / 'out'), (3, 2), quiet=True, threads=2)
+    assert source.tile  # never decoded as a whole
+    assert len(result['tiles']) == 6
+    for tile_path, box in zip(result['tiles'], GridGeometry.from_grid((90, 70), (3, 2)).iter_boxes()):
+        assert Image.open(tile_path).tobytes() == original.crop(box[2]).tobytes()
+
+def test_splyt_planar_tiff_is_not_mapped(tmp_path):
+    from splyt.bands import open_mapped_image
+    original = Image.merge('RGB', [Image.new('L', (60, 40), 70), Image.new('L', (60, 40), 185), Image.linear_gradient('L').resize((60, 40))])
+    make_planar_tiff(tmp_path / 'planar.tif', original)
+    with Image.open(tmp_path / 'planar.tif') as source:
+        assert open_mapped_image(source) is None
+    result = splyt(str(tmp_path / 'planar.tif'), str(tmp_path / 'out'), (3, 2), quiet=True)
+    for tile_path, box in zip(result['tiles'], GridGeometry.from_grid((60, 40), (3, 2)).iter_boxes()):
+        assert Image.open(tile_path).tobytes() == original.crop(box[2]).tobytes()
+
+# Testing write-behind output
+def test_write_behind_sink_slow_disk(tmp_path):
+    from splyt.sinks import DirectorySink, WriteBehindSink
+
+    class SlowDirectorySink(DirectorySink):
+        synced = []
+
+        def write_reserved(self, path, data):
+            time.sleep(0.01)
+            return super().write_reserved(path, data)
+
+        def sync(self, paths):
+            self.synced.append(len(paths))
+
+    Image.new('RGB', (60, 60), 'blue').save(tmp_path / 'image.png')
+    with WriteBehindSink(SlowDirectorySink(str(tmp_path / 'out')), queue_size=2, fsync='image') as sink:
+        result = splyt(str(tmp_path / 'image.png'), None, (4, 4), sink=sink, quiet=True)
+        # Names are final as soon as the tiles are queued
+        assert result['tiles'][0] == str(tmp_path / 'out' / 'image_a1.png')
+    stats = sink.stats()
+    assert sorted(os.listdir(tmp_path / 'out')) == sorted(os.path.basename(tile) for tile in result['tiles'])
+    assert all(os.path.getsize(tile) > 0 for tile in result['tiles'])
+    assert SlowDirectorySink.synced[0] == 16
+    assert stats['tiles_written'] == 16 and stats['full_fraction'] > 0 and stats['bound'] == 'io'
+
+def test_write_behind_failures_fail_the_run(tmp_path, monkeypatch, capsys):
+    from splyt import cli
+    from splyt.naming import NamingIndex
+    from splyt.sinks import WriteBehindSink
+    write_claimed = NamingIndex.write_claimed
+
+    def fail_second_tile(self, path, data):
+        if path.endswith('_b1.png'):
+            raise OSError('disk full')
+        return write_claimed(self, path, data)
+
+    monkeypatch.setattr(NamingIndex, 'write_claimed', fail_second_tile)
+    Image.new('RGB', (40, 20), 'blue').save(tmp_path / 'image.png')
+    # Keep the results the CLI checks against the writer's failures
+    results = []
+    remove_failed = WriteBehindSink.remove_failed
+    monkeypatch.setattr(WriteBehindSink, 'remove_failed', lambda self, result: results.append(remove_failed(self, result)))
+    monkeypatch.setattr('sys.argv', ['splyt', '2', '1', str(tmp_path / 'image.png'), str(tmp_path / 'out'), '--write-behind'])
+    with pytest.raises(SystemExit) as exc_info:
+        cli.main()
+    assert exc_info.value.code == 1
+    assert "Unable to write tile" in capsys.readouterr().out
+    result, = results
+    assert [os.path.basename(tile) for tile in result['tiles']] == ['image_a1.png']
+    assert len(result['errors']) == 1 and 'disk full' in result['errors'][0]
+    assert os.listdir(tmp_path / 'out') == ['image_a1.png']
+
+@pytest.mark.parametrize('mode', ['--watch', '--jobs-file'])
+def test_write_behind_rejected_where_unsupported(tmp_path, capsys, mode):
+    from splyt import cli
+    options, _ = parse_options([mode, str(tmp_path / 'jobs.jsonl'), '--write-behind'] if mode == '--jobs-file' else [mode, '--write-behind'])
+    with pytest.raises(SystemExit):
+        if mode == '--watch':
+            cli.watch(str(tmp_path), str(tmp_path / 'out'), (2, 1), None, True, True, options)
+        else:
+            cli.run_jobs_file(options)
+    assert 'cannot be combined with --write-behind' in capsys.readouterr().out
+
+# Testing shards
+def test_shards_side_by_side_cover_every_image_once(tmp_path):
+    source_dir = tmp_path / 'corpus'
+    (source_dir / 'nested').mkdir(parents=True)
+    for idx in range(12):
+        Image.new('RGB', (20, 10)).save(source_dir / ('nested' if idx % 3 == 0 else '') / f"img{idx}.png")
+
+    processes = [
+        subprocess.Popen([sys.executable, '-m', 'splyt.cli', str(source_dir), str(tmp_path / 'out'), '2x1', '-r', '--shard', f"{index}/3"],
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), stdout=subprocess.DEVNULL)
+        for index in range(3)
+    ]
+    assert all(process.wait() == 0 for process in processes)
+
+    tiles = sorted(os.path.relpath(os.path.join(root, name), tmp_path / 'out')
+                   for root, _, names in os.walk(tmp_path / 'out') for name in names if name.endswith('.png'))
+    expected = sorted(os.path.join('nested' if idx % 3 == 0 else '', f"img{idx}_{cell}.png") for idx in range(12) for cell in ('a1', 'b1'))
+    assert tiles == expected
+
+    sources = []
+    for index in range(3):
+        with open(tmp_path / 'out' / f"splyt-manifest.shard-{index}-of-3.jsonl", encoding='utf-8') as f:
+            sources += [json.loads(line)['source'] for line in f if '"complete"' in line]
+    assert len(sources) == len(set(sources)) == 12
+
+def test_shard_rejected_with_jobs_file(tmp_path, capsys):
+    from splyt import cli
+    options, _ = parse_options(['--jobs-file', str(tmp_path / 'jobs.jsonl'), '--shard', '0/2'])
+    with pytest.raises(SystemExit):
+        cli.run_jobs_file(options)
+    assert 'cannot be combined with --shard' in capsys.readouterr().out
+
+def test_parse_shard():
+    from splyt.utils import parse_shard
+    assert parse_shard('0/4') == (0, 4)
+    for value in ('4/4', '-1/2', '1', 'a/b'):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+# Testing reduced tiles
+def test_splyt_max_tile_size_drafts_jpeg(tmp_path):
+    original = Image.linear_gradient('L').resize((800, 600)).convert('RGB')
+    original.save(tmp_path / 'photo.jpg', quality=95)
+
+    source = Image.open(tmp_path / 'photo.jpg')
+    result = splyt(source, str(tmp_path / 'out'), (2, 2), quiet=True, max_tile_size=100)
+    assert source.size == (200, 150)  # decoded at 1/4 scale
+    assert [Image.open(tile).size for tile in result['tiles']] == [(100, 75)] * 4
+    # The bottom right tile matches the bottom right of the downscaled source
+    expected = original.resize((200, 150)).crop((100, 75, 200, 150))
+    assert abs(Image.open(result['tiles'][3]).getpixel((50, 37))[0] - expected.getpixel((50, 37))[0]) < 8
+
+def test_splyt_max_tile_size_other_formats(tmp_path):
+    Image.new('RGB', (300, 100), 'red').save(tmp_path / 'image.png')
+    result = splyt(str(tmp_path / 'image.png'), str(tmp_path / 'out'), (3, 1), quiet=True, max_tile_size=40, threads=2)
+    assert [Image.open(tile).size for tile in result['tiles']] == [(40, 40)] * 3
+    # Cells that already fit are left at full size
+    result = splyt(str(tmp_path / 'image.png'), str(tmp_path / 'full'), (3, 1), quiet=True, max_tile_size=500)
+    assert Image.open(result['tiles'][0]).size == (100, 100)
+
+def test_run_jobs_file_max_tile_size(tmp_path):
+    Image.new('RGB', (300, 100), 'red').save(tmp_path / 'image.png')
+    (tmp_path / 'jobs.jsonl').write_text('{"source": "image.png", "output": "three", "grid_size": [3, 1]}\n'
+                                         '{"source": "image.png", "output": "one", "grid_size": [1, 1]}\n')
+    three, one = run_jobs_file(str(tmp_path / 'jobs.jsonl'), max_tile_size=30)
+    assert [Image.open(tile).size for tile in three['tiles']] == [(30, 30)] * 3
+    assert Image.open(one['tiles'][0]).size == (30, 10)
+
+# Testing output formats and encoder presets
+def test_splyt_transcodes_tiles(tmp_path):
+    source = Image.linear_gradient('L').resize((80, 40)).convert('RGBA')
+    source.putpixel((0, 0), (0, 0, 0, 0))
+    source.save(tmp_path / 'image.png')
+
+    result = splyt(str(tmp_path / 'image.png'), str(tmp_path / 'jpeg'), (2, 1), quiet=True, image_format='jpg', preset='small')
+    assert [os.path.basename(tile) for tile in result['tiles']] == ['image_a1.jpg', 'image_b1.jpg']
+    with Image.open(result['tiles'][0]) as tile:
+        assert tile.format == 'JPEG' and tile.mode == 'RGB'
+        # The splyt comment moves from a PNG text chunk into EXIF
+        assert 'Splyt' in tile.getexif()[0x9286]
+
+    result = splyt(str(tmp_path / 'image.png'), str(tmp_path / 'webp'), (2, 1), quiet=True, image_format='WEBP', preset='fast')
+    with Image.open(result['tiles'][0]) as tile:
+        assert tile.format == 'WEBP' and tile.getpixel((0, 0))[3] == 0
+
+def test_encoder_presets():
+    from splyt.metadata import get_encoder_params
+    from splyt.utils import parse_output_format
+    assert get_encoder_params('png', 'fast') == {'compress_level': 1}
+    assert get_encoder_params('GIF', 'small') == {}
+    assert get_encoder_params('JPEG') == {}
+    assert parse_output_format('tif') == 'TIFF'
+    with pytest.raises(ValueError):
+        get_encoder_params('JPEG', 'tiny')
+    with pytest.raises(ValueError):
+        parse_output_format('avif')
+
+# Testing multi-frame sources
+def test_splyt_all_frames_animated_gif(tmp_path):
+    frames = [Image.new('P', (40, 20), idx) for idx in range(1, 4)]
+    for frame in frames:
+        frame.putpalette([value for idx in range(256) for value in (idx, 255 - idx, 0)])
+    frames[0].save(tmp_path / 'anim.gif', save_all=True, append_images=frames[1:], duration=[100, 200, 300], disposal=2, loop=0)
+
+    result = splyt(str(tmp_path / 'anim.gif'), str(tmp_path / 'out'), (2, 1), quiet=True, all_frames=True)
+    assert len(result['tiles']) == 2 and not result['errors']
+    with Image.open(result['tiles'][1]) as tile:
+        assert tile.n_frames == 3 and tile.size == (20, 20) and tile.info['loop'] == 0
+        for idx in range(3):
+            tile.seek(idx)
+            assert tile.info['duration'] == 100 * (idx + 1) and tile.disposal_method == 2
+            assert tile.convert('RGB').getpixel((5, 5)) == (idx + 1, 254 - idx, 0)
+
+    # Without all_frames only the first frame is split, as before
+    result = splyt(str(tmp_path / 'anim.gif'), str(tmp_path / 'first'), (2, 1), quiet=True)
+    with Image.open(result['tiles'][0]) as tile:
+        assert getattr(tile, 'n_frames', 1) == 1
+
+def test_splyt_all_frames_stats(tmp_path):
+    frames = [Image.new('RGB', (40, 20), (idx * 80, 0, 0)) for idx in range(3)]
+    frames[0].save(tmp_path / 'anim.gif', save_all=True, append_images=frames[1:], duration=100)
+
+    stats = StatsCollector()
+    result = splyt(str(tmp_path / 'anim.gif'), str(tmp_path / 'out'), (2, 1), quiet=True, hooks=stats, all_frames=True)
+    summary = stats.summary()
+    assert len(result['tiles']) == 2 and summary['tiles'] == 2
+    assert summary['stages']['tile']['count'] == 2
+    assert stats.bytes_out == sum(os.path.getsize(tile) for tile in result['tiles'])
+
+def test_run_jobs_file_all_frames(tmp_path):
+    frames = [Image.new('RGB', (40, 20), (idx * 80, 0, 0)) for idx in range(3)]
+    frames[0].save(tmp_path / 'anim.gif', save_all=True, append_images=frames[1:], duration=100)
+    (tmp_path / 'jobs.jsonl').write_text('{"source": "anim.gif", "output": "two", "grid_size": [2, 1]}\n'
+                                         '{"source": "anim.gif", "output": "four", "grid_size": [2, 2]}\n')
+    results = list(run_jobs_file(str(tmp_path / 'jobs.jsonl'), all_frames=True))
+    assert [len(result['tiles']) for result in results] == [2, 4]
+    for result in results:
+        with Image.open(result['tiles'][-1]) as tile:
+            assert tile.n_frames == 3
+
+def test_splyt_all_frames_multipage_tiff(tmp_path):
+    pages = [Image.new('RGB', (60, 30), (idx * 50, 0, 0)) for idx in range(4)] + [Image.new('L', (30, 15), 99)]
+    pages[0].save(tmp_path / 'scan.tif', save_all=True, append_images=pages[1:], dpi=(300, 300))
+
+    result = splyt(str(tmp_path / 'scan.tif'), str(tmp_path / 'out'), (3, 1), quiet=True, all_frames=True)
+    assert [os.path.basename(tile) for tile in result['tiles']] == ['scan_a1.tif', 'scan_b1.tif', 'scan_c1.tif']
+    assert not [name for name in os.listdir(tmp_path / 'out') if not name.endswith('.tif')]
+    with Image.open(result['tiles'][2]) as tile:
+        assert tile.n_frames == 5 and tile.info['dpi'] == (300, 300)
+        tile.seek(3)
+        assert tile.size == (20, 30) and tile.getpixel((0, 0)) == (150, 0, 0)
+        # A smaller page is cut at the same relative positions
+        tile.seek(4)
+        assert tile.size == (10, 15) and tile.getpixel((0, 0)) == 99